@@ -15,6 +15,9 @@ __author__ = "Charles R Schmidt <schmidtc@gmail.com>"
 
 __all__ = ["DISTANCE_METRICS", "FLOAT_EPS", "KDTree"]
 
+# cKDTree is used from scipy 0.12 on
+_SCIPY_VERSION = tuple(int(v) for v in scipy.version.version.split(".")[:2])
+
 DISTANCE_METRICS = ['Euclidean', 'Arc']
 FLOAT_EPS = numpy.finfo(float).eps
 
@@ -48,7 +51,7 @@ def KDTree(data, leafsize=10, distance_metric='Euclidean',
     """
 
     if distance_metric.lower() == 'euclidean':
-        if int(scipy.version.version.split(".")[1]) < 12:
+        if _SCIPY_VERSION < (0, 12):
             return scipy.spatial.KDTree(data, leafsize)
         else:
             return scipy.spatial.cKDTree(data, leafsize)
@@ -9,4 +9,5 @@ import smoothing
 import getisord
 import geary
 import join_counts
+import permutation
 import gamma
@@ -6,8 +6,9 @@ Gamma index for spatial autocorrelation
 __author__ = "Luc Anselin <luc.anselin@asu.edu>"
 
 import numpy as np
-from ..weights.spatial_lag import lag_spatial
 from .tabular import _univariate_handler 
+from .permutation import simulate, quadratic_form, squared_difference, \
+    absolute_difference
 
 __all__ = ['Gamma']
 
@@ -161,12 +162,14 @@ class Gamma(object):
             ysd = np.std(self.y)
             ys = (self.y - ym) / ysd
             self.y = ys
-        self.g = self.__calc(self.y, self.op)
+        self.g = self.__calc(self.y, self.op)[0]
 
         if permutations:
-            sim = [self.__calc(np.random.permutation(self.y), self.op)
-                   for i in xrange(permutations)]
-            self.sim_g = np.array(sim)
+            width = None
+            if self.op == 'a':
+                width = self.w.sparse.nnz
+            calc = lambda Z: self.__calc(Z, self.op)
+            self.sim_g = simulate(self.y, permutations, calc, width=width)
             self.min_g = np.min(self.sim_g)
             self.mean_g = np.mean(self.sim_g)
             self.max_g = np.max(self.sim_g)
@@ -185,36 +188,27 @@ class Gamma(object):
 
     def __calc(self, z, op):
         if op == 'c':     # cross-product
-            zl = lag_spatial(self.w, z)
-            g = (z * zl).sum()
+            g = quadratic_form(self.w.sparse, z)
         elif op == 's':   # squared difference
-            zs = np.zeros(z.shape)
-            z2 = z ** 2
-            for i, i0 in enumerate(self.w.id_order):
-                neighbors = self.w.neighbor_offsets[i0]
-                wijs = self.w.weights[i0]
-                zw = zip(neighbors, wijs)
-                zs[i] = sum([wij * (z2[i] - 2.0 * z[i] * z[
-                    j] + z2[j]) for j, wij in zw])
-            g = zs.sum()
+            g = squared_difference(self.w.sparse, z)
         elif op == 'a':    # absolute difference
-            zs = np.zeros(z.shape)
-            for i, i0 in enumerate(self.w.id_order):
-                neighbors = self.w.neighbor_offsets[i0]
-                wijs = self.w.weights[i0]
-                zw = zip(neighbors, wijs)
-                zs[i] = sum([wij * abs(z[i] - z[j]) for j, wij in zw])
-            g = zs.sum()
+            g = absolute_difference(self.w.sparse, z)
         else:              # any previously defined function op
-            zs = np.zeros(z.shape)
-            for i, i0 in enumerate(self.w.id_order):
-                neighbors = self.w.neighbor_offsets[i0]
-                wijs = self.w.weights[i0]
-                zw = zip(neighbors, wijs)
-                zs[i] = sum([wij * op(z, i, j) for j, wij in zw])
-            g = zs.sum()
+            if z.ndim == 1:
+                z = z.reshape(-1, 1)
+            g = np.array([self.__calc_op(z[:, k], op)
+                          for k in range(z.shape[1])])
         return g
 
+    def __calc_op(self, z, op):
+        zs = np.zeros(z.shape)
+        for i, i0 in enumerate(self.w.id_order):
+            neighbors = self.w.neighbor_offsets[i0]
+            wijs = self.w.weights[i0]
+            zw = zip(neighbors, wijs)
+            zs[i] = sum([wij * op(z, i, j) for j, wij in zw])
+        return zs.sum()
+
     def __pseudop(self, sim, g):
         above = sim >= g
         larger = above.sum()
@@ -7,6 +7,7 @@ import numpy as np
 import scipy.stats as stats
 from .. import weights
 from .tabular import _univariate_handler
+from .permutation import simulate, squared_difference
 
 __all__ = ['Geary']
 
@@ -89,8 +90,8 @@ class Geary(object):
     0.3330108
     >>> print round(c.p_norm,7)
     9.2e-05
-    >>> c.z_rand
-    -3.6489513837253944
+    >>> print round(c.z_rand,7)
+    -3.6489514
     """
     def __init__(self, y, w, transformation="r", permutations=999):
         if not isinstance(w, weights.W):
@@ -109,7 +110,7 @@ class Geary(object):
         yd = y - y.mean()
         yss = sum(yd * yd)
         self.den = yss * self.w.s0 * 2.0
-        self.C = self.__calc(y)
+        self.C = self.__calc(y)[0]
         de = self.C - 1.0
         self.EC = 1.0
         self.z_norm = de / self.seC_norm
@@ -123,9 +124,7 @@ class Geary(object):
 
 
         if permutations:
-            sim = [self.__calc(np.random.permutation(self.y))
-                   for i in xrange(permutations)]
-            self.sim = sim = np.array(sim)
+            self.sim = sim = simulate(self.y, permutations, self.__calc)
             above = sim >= self.C
             larger = sum(above)
             if (permutations - larger) < larger:
@@ -168,15 +167,7 @@ class Geary(object):
         self.seC_norm = vc_norm ** (0.5)
 
     def __calc(self, y):
-        ys = np.zeros(y.shape)
-        y2 = y ** 2
-        for i, i0 in enumerate(self.w.id_order):
-            neighbors = self.w.neighbor_offsets[i0]
-            wijs = self.w.weights[i0]
-            z = zip(neighbors, wijs)
-            ys[i] = sum([wij * (y2[i] - 2 * y[i] * y[j] + y2[j])
-                         for j, wij in z])
-        a = (self.n - 1) * sum(ys)
+        a = (self.n - 1) * squared_difference(self.w.sparse, y)
         return a / self.den
 
     @classmethod
@@ -5,8 +5,10 @@ __author__ = "Sergio J. Rey <srey@asu.edu>, Myunghwa Hwang <mhwang4@gmail.com> "
 __all__ = ['G', 'G_Local']
 
 from ..common import np, stats, math
+from scipy import sparse as SP
 from ..weights.spatial_lag import lag_spatial as slag
 from .tabular import _univariate_handler
+from .permutation import simulate, quadratic_form, crand
 
 PERMUTATIONS = 999
 
@@ -104,14 +106,13 @@ class G(object):
         self.y2 = y * y
         y = y.reshape(len(y), 1)  # Ensure that y is an n by 1 vector, otherwise y*y.T == y*y
         self.den_sum = (y * y.T).sum() - (y * y).sum()
-        self.G = self.__calc(self.y)
+        self.num = self.y * slag(self.w, self.y)
+        self.G = self.__calc(self.y)[0]
         self.z_norm = (self.G - self.EG) / math.sqrt(self.VG)
         self.p_norm = 1.0 - stats.norm.cdf(np.abs(self.z_norm))
 
         if permutations:
-            sim = [self.__calc(np.random.permutation(self.y))
-                   for i in xrange(permutations)]
-            self.sim = sim = np.array(sim)
+            self.sim = sim = simulate(self.y, permutations, self.__calc)
             above = sim >= self.G
             larger = sum(above)
             if (self.permutations - larger) < larger:
@@ -156,9 +157,7 @@ class G(object):
         self.VG = self.EG2 - self.EG ** 2
 
     def __calc(self, y):
-        yl = slag(self.w, y)
-        self.num = y * yl
-        return self.num.sum() / self.den_sum
+        return quadratic_form(self.w.sparse, y) / self.den_sum
 
     @property
     def _statistic(self):
@@ -227,6 +226,16 @@ class G_Local(object):
                   pseudo p values
     star : boolean
            whether or not to include focal observation in sums (default: False)
+    n_jobs : int
+             number of processes used for the conditional randomization, -1
+             for all available cores (default: 1)
+    seed : int
+           seed for the conditional randomization. If None, it is drawn from
+           numpy's global random state.
+    keep_simulations : boolean
+                       If False, the simulated values are reduced to p_sim,
+                       EG_sim, seG_sim and z_sim as they are generated and sim
+                       and rGs are set to None (default: True)
 
     Attributes
     ----------
@@ -250,8 +259,8 @@ class G_Local(object):
             of floats, p-value under normality assumption (one-sided)
             for two-sided tests, this value should be multiplied by 2
     sim : array
-         of arrays of floats (if permutations>0), vector of I values
-         for permutated samples
+         of arrays of floats (if permutations>0 and keep_simulations), vector
+         of I values for permutated samples
     p_sim : array
            of floats, p-value based on permutations (one-sided)
            null - spatial randomness
@@ -301,7 +310,7 @@ class G_Local(object):
     array([-1.0136729 , -0.04361589,  1.31558703, -0.31412676,  1.15373986,
             1.77833941])
     >>> lg.p_sim[0]
-    0.10100000000000001
+    0.112
 
     >>> numpy.random.seed(10)
 
@@ -313,7 +322,7 @@ class G_Local(object):
     array([-1.39727626, -0.28917762,  0.65064964, -0.28917762,  1.23452088,
             2.02424331])
     >>> lg_star.p_sim[0]
-    0.10100000000000001
+    0.112
 
     >>> numpy.random.seed(10)
 
@@ -325,7 +334,7 @@ class G_Local(object):
     array([-0.62074534, -0.01780611,  1.31558703, -0.12824171,  0.28843496,
             1.77833941])
     >>> lg.p_sim[0]
-    0.10100000000000001
+    0.112
 
     >>> numpy.random.seed(10)
 
@@ -337,10 +346,11 @@ class G_Local(object):
     array([-0.62488094, -0.09144599,  0.41150696, -0.09144599,  0.24690418,
             1.28024388])
     >>> lg_star.p_sim[0]
-    0.10100000000000001
+    0.112
 
     """
-    def __init__(self, y, w, transform='R', permutations=PERMUTATIONS, star=False):
+    def __init__(self, y, w, transform='R', permutations=PERMUTATIONS,
+                 star=False, n_jobs=1, seed=None, keep_simulations=True):
         y = np.asarray(y).flatten()
         self.n = len(y)
         self.y = y
@@ -349,47 +359,53 @@ class G_Local(object):
         self.w.transform = self.w_transform = transform.lower()
         self.permutations = permutations
         self.star = star
+        self.n_jobs = n_jobs
+        self.seed = seed
+        self.keep_simulations = keep_simulations
         self.calc()
         self.p_norm = np.array(
             [1 - stats.norm.cdf(np.abs(i)) for i in self.Zs])
         if permutations:
-            self.__crand()
-            sim = np.transpose(self.rGs)
-            above = sim >= self.Gs
-            larger = sum(above)
+            if keep_simulations:
+                self.__crand()
+                sim = np.transpose(self.rGs)
+                above = sim >= self.Gs
+                larger = sum(above)
+                self.sim = sim
+                self.EG_sim = sim.mean()
+                self.seG_sim = sim.std()
+            else:
+                larger, mean, std = self.__crand(self.Gs)
+                self.rGs = self.sim = None
+                # pool the per-site summaries, every site has the same
+                # number of permutations
+                self.EG_sim = mean.mean()
+                self.seG_sim = np.sqrt((std ** 2 + mean ** 2).mean() -
+                                       self.EG_sim ** 2)
             low_extreme = (self.permutations - larger) < larger
             larger[low_extreme] = self.permutations - larger[low_extreme]
             self.p_sim = (larger + 1.0) / (permutations + 1)
-            self.sim = sim
-            self.EG_sim = sim.mean()
-            self.seG_sim = sim.std()
             self.VG_sim = self.seG_sim * self.seG_sim
             self.z_sim = (self.Gs - self.EG_sim) / self.seG_sim
             self.p_z_sim = 1 - stats.norm.cdf(np.abs(self.z_sim))
 
-    def __crand(self):
+    def __crand(self, observed=None):
         y = self.y
-        rGs = np.zeros((self.n, self.permutations))
-        n_1 = self.n - 1
-        rid = range(n_1)
-        prange = range(self.permutations)
-        k = self.w.max_neighbors + 1
-        rids = np.array([np.random.permutation(rid)[0:k] for i in prange])
-        ids = np.arange(self.w.n)
-        ido = self.w.id_order
         wc = self.__getCardinalities()
         if self.w_transform == 'r':
             den = np.array(wc) + self.star
         else:
             den = np.ones(self.w.n)
-        for i in range(self.w.n):
-            idsi = ids[ids != i]
-            np.random.shuffle(idsi)
-            yi_star = y[i] * self.star
-            wci = wc[i]
-            rGs[i] = (y[idsi[rids[:, 0:wci]]]).sum(1) + yi_star
-            rGs[i] = (np.array(rGs[i]) / den[i]) / (
-                self.y_sum - (1 - self.star) * y[i])
+        # neighbor sums are unweighted, only the cardinalities matter
+        ws = self.w.sparse
+        ws = SP.csr_matrix((np.ones_like(ws.data), ws.indices, ws.indptr),
+                           shape=ws.shape)
+        scale = 1. / (den * (self.y_sum - (1 - self.star) * y))
+        offset = scale * y * self.star
+        rGs = crand(y, ws, self.permutations, scale, offset,
+                    n_jobs=self.n_jobs, seed=self.seed, observed=observed)
+        if observed is not None:
+            return rGs
         self.rGs = rGs
 
     def __getCardinalities(self):
@@ -4,8 +4,8 @@ Spatial autocorrelation for binary attributes
 """
 __author__ = "Sergio J. Rey <srey@asu.edu> , Luc Anselin <luc.anselin@asu.edu>"
 
-from ..weights.spatial_lag import lag_spatial
 from .tabular import _univariate_handler
+from .permutation import simulate, quadratic_form
 import numpy as np
 
 __all__ = ['Join_Counts']
@@ -116,17 +116,15 @@ class Join_Counts(object):
     """
     def __init__(self, y, w, permutations=PERMUTATIONS):
         y = np.asarray(y).flatten()
-        w.transformation = 'b'  # ensure we have binary weights
+        w.transform = 'b'  # ensure we have binary weights
         self.w = w
         self.y = y
         self.permutations = permutations
         self.J = w.s0 / 2.
-        self.bb, self.ww, self.bw = self.__calc(self.y)
+        self.bb, self.ww, self.bw = self.__calc(self.y)[0]
 
         if permutations:
-            sim = [self.__calc(np.random.permutation(self.y))
-                   for i in xrange(permutations)]
-            sim_jc = np.array(sim)
+            sim_jc = simulate(self.y, permutations, self.__calc)
             self.sim_bb = sim_jc[:, 0]
             self.min_bb = np.min(self.sim_bb)
             self.mean_bb = np.mean(self.sim_bb)
@@ -141,13 +139,10 @@ class Join_Counts(object):
             self.p_sim_bw = p_sim_bw
 
     def __calc(self, z):
-        zl = lag_spatial(self.w, z)
-        bb = sum(z * zl) / 2.0
-        zw = 1 - z
-        zl = lag_spatial(self.w, zw)
-        ww = sum(zw * zl) / 2.0
+        bb = quadratic_form(self.w.sparse, z) / 2.0
+        ww = quadratic_form(self.w.sparse, 1 - z) / 2.0
         bw = self.J - (bb + ww)
-        return (bb, ww, bw)
+        return np.column_stack((bb, ww, bw))
 
     def __pseudop(self, sim, jc):
         above = sim >= jc
@@ -29,11 +29,6 @@ import copy
 import sys
 from scipy.cluster.vq import kmeans as KMEANS
 from warnings import warn as Warn
-try:
-    from numba import autojit
-except ImportError:
-    def autojit(func):
-        return func
 
 def headTail_breaks(values, cuts):
     """
@@ -326,58 +321,100 @@ def natural_breaks(values, k=5):
     return (sids, class_ids, fit, cuts)
 
 
-@autojit
 def _fisher_jenks_means(values, classes=5, sort=True):
     """
-    Jenks Optimal (Natural Breaks) algorithm implemented in Python.
-    The original Python code comes from here:
-    http://danieljlewis.org/2010/06/07/jenks-natural-breaks-algorithm-in-python/
-    and is based on a JAVA and Fortran code available here:
-    https://stat.ethz.ch/pipermail/r-sig-geo/2006-March/000811.html
+    Jenks Optimal (Natural Breaks) algorithm.
+
+    Exact solution of Fisher's dynamic program for the partition of the
+    sorted values into `classes` contiguous groups minimizing the sum of
+    squared deviations around the class means.
+
+    Ties among the values are collapsed into weighted unique values, and
+    each stage of the program is solved by divide and conquer on the
+    monotone optimal split points [Gronlund2017]_, with all the subproblems
+    at one depth of the recursion evaluated in a single vectorized pass.
+    This takes O(k n log n) time and O(k n) memory for n unique values.
+
+    Values that are already sorted can be passed with sort=False, which
+    skips the sort when collapsing the ties; values is never sorted in
+    place.
 
     Returns class breaks such that classes are internally homogeneous while
     assuring heterogeneity among classes.
 
     """
+    values = np.asarray(values)
     if sort:
-        values.sort()
-    n_data = len(values)
-    mat1 = np.zeros((n_data + 1, classes + 1), dtype=np.int32)
-    mat2 = np.zeros((n_data + 1, classes + 1), dtype=np.float32)
-    mat1[1, 1:] = 1
-    mat2[2:, 1:] = np.inf
-
-    v = np.float32(0)
-    for l in range(2, len(values) + 1):
-        s1 = np.float32(0)
-        s2 = np.float32(0)
-        w = np.float32(0)
-        for m in range(1, l + 1):
-            i3 = l - m + 1
-            val = np.float32(values[i3 - 1])
-            s2 += val * val
-            s1 += val
-            w += np.float32(1)
-            v = s2 - (s1 * s1) / w
-            i4 = i3 - 1
-            if i4 != 0:
-                for j in range(2, classes + 1):
-                    if mat2[l, j] >= (v + mat2[i4, j - 1]):
-                        mat1[l, j] = i3
-                        mat2[l, j] = v + mat2[i4, j - 1]
-        mat1[l, 1] = 1
-        mat2[l, 1] = v
-
-    k = len(values)
-
+        uv, counts = np.unique(values, return_counts=True)
+    else:
+        # runs of ties in the sorted values
+        starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+        uv = values[starts]
+        counts = np.diff(np.r_[starts, len(values)])
+    n = len(uv)
     kclass = np.zeros(classes + 1, dtype=values.dtype)
-    kclass[classes] = values[len(values) - 1]
-    kclass[0] = values[0]
-    for countNum in range(classes, 1, -1):
-        pivot = mat1[k, countNum]
-        id = int(pivot - 2)
-        kclass[countNum - 1] = values[id]
-        k = int(pivot - 1)
+    kclass[0] = uv[0]
+    kclass[classes] = uv[-1]
+    if classes < 2:
+        return kclass
+    if n < classes:
+        raise ValueError("Fewer unique values than specified classes.")
+    # prefix sums of the weights, values and squared values; centering
+    # keeps the cancellation in the sums of squares small
+    x = uv.astype(np.float64)
+    x -= np.average(x, weights=counts)
+    s0 = np.zeros(n + 1)
+    s1 = np.zeros(n + 1)
+    s2 = np.zeros(n + 1)
+    np.cumsum(counts, out=s0[1:])
+    np.cumsum(counts * x, out=s1[1:])
+    np.cumsum(counts * x * x, out=s2[1:])
+
+    # cost[j]: optimal cost of the first j unique values in c classes,
+    # starting from a single class
+    cost = np.zeros(n + 1)
+    cost[1:] = s2[1:] - s1[1:] * s1[1:] / s0[1:]
+    splits = np.zeros((classes + 1, n + 1), dtype=np.intp)
+    for c in range(2, classes + 1):
+        # cost[i] + ssd(i:j) = base[i] + s2[j] - (s1[j] - s1[i])**2 /
+        # (s0[j] - s0[i]), and s2[j] does not depend on the split i
+        base = cost - s2
+        new = np.full(n + 1, np.inf)
+        split = splits[c]
+        # pending subproblems: values jlo..jhi with splits in ilo..ihi;
+        # the last class is only needed for all n values
+        jlo = np.array([c if c < classes else n])
+        jhi = np.array([n - classes + c])
+        ilo = np.array([c - 1])
+        ihi = np.array([n - classes + c - 1])
+        while len(jlo):
+            mid = (jlo + jhi) // 2
+            lengths = np.minimum(ihi, mid - 1) - ilo + 1
+            starts = np.zeros(len(lengths), dtype=np.intp)
+            np.cumsum(lengths[:-1], out=starts[1:])
+            pos = np.arange(starts[-1] + lengths[-1])
+            i = pos + np.repeat(ilo - starts, lengths)
+            d1 = np.repeat(s1[mid], lengths) - s1[i]
+            total = base[i] - d1 * d1 / (np.repeat(s0[mid], lengths) - s0[i])
+            best = np.minimum.reduceat(total, starts)
+            # leftmost minimizer, as the original implementation chose
+            first = np.where(total == np.repeat(best, lengths), pos, len(pos))
+            opt = i[np.minimum.reduceat(first, starts)]
+            new[mid] = best + s2[mid]
+            split[mid] = opt
+            left = jlo < mid
+            right = mid < jhi
+            jlo, jhi, ilo, ihi = (
+                np.concatenate((jlo[left], mid[right] + 1)),
+                np.concatenate((mid[left] - 1, jhi[right])),
+                np.concatenate((ilo[left], opt[right])),
+                np.concatenate((opt[left], ihi[right])))
+        cost = new
+
+    j = n
+    for c in range(classes, 1, -1):
+        j = splits[c, j]
+        kclass[c - 1] = uv[j - 1]
     return kclass
 
 
@@ -1496,6 +1533,13 @@ class Fisher_Jenks(Map_Classifier):
     >>> fj.counts
     array([49,  3,  4,  1,  1])
     >>>
+
+    Notes
+    -----
+    The breaks are exact. Repeated values are classified together, so the
+    cost of the classification grows with the number of unique values in
+    `y`, and a million distinct values takes seconds; sampling with
+    :class:`Fisher_Jenks_Sampled` is rarely needed.
     """
 
     def __init__(self, y, k=K):
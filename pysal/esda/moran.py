@@ -7,6 +7,7 @@ __author__ = "Sergio J. Rey <srey@asu.edu>, \
 from ..weights.spatial_lag import lag_spatial as slag
 from .smoothing import assuncao_rate
 from .tabular import _univariate_handler, _bivariate_handler
+from .permutation import simulate, quadratic_form, crand
 import scipy.stats as stats
 import numpy as np
 
@@ -164,9 +165,7 @@ class Moran(object):
             self.p_rand *= 2.
 
         if permutations:
-            sim = [self.__calc(np.random.permutation(self.z))
-                   for i in xrange(permutations)]
-            self.sim = sim = np.array(sim)
+            self.sim = sim = simulate(self.z, permutations, self.__calc)
             above = sim >= self.I
             larger = above.sum()
             if (self.permutations - larger) < larger:
@@ -213,8 +212,9 @@ class Moran(object):
         self.seI_rand = VIR ** (1 / 2.)
 
     def __calc(self, z):
-        zl = slag(self.w, z)
-        inum = (z * zl).sum()
+        inum = quadratic_form(self.w.sparse, z)
+        if z.ndim == 1:
+            inum = inum[0]
         return self.n / self.w.s0 * inum / self.z2ss
 
     @property
@@ -379,10 +379,9 @@ class Moran_BV(object):
         w.transform = transformation
         self.w = w
         self.I = self.__calc(zy)
+        self.num = self.I * self.den
         if permutations:
-            nrp = np.random.permutation
-            sim = [self.__calc(nrp(zy)) for i in xrange(permutations)]
-            self.sim = sim = np.array(sim)
+            self.sim = sim = simulate(zy, permutations, self.__calc)
             above = sim >= self.I
             larger = above.sum()
             if (permutations - larger) < larger:
@@ -398,9 +397,8 @@ class Moran_BV(object):
                 self.p_z_sim = stats.norm.cdf(self.z_sim)
 
     def __calc(self, zy):
-        wzy = slag(self.w, zy)
-        self.num = (self.zx * wzy).sum()
-        return self.num / self.den
+        wzy = self.w.sparse.dot(zy)
+        return self.zx.dot(wzy) / self.den
 
     @property
     def _statistic(self):
@@ -457,7 +455,8 @@ class Moran_BV(object):
                                   swapname=cls.__name__.lower(), stat=cls,**stat_kws)
 
 
-def Moran_BV_matrix(variables, w, permutations=0, varnames=None):
+def Moran_BV_matrix(variables, w, permutations=0, varnames=None,
+                    transformation="r"):
     """Bivariate Moran Matrix
 
     Calculates bivariate Moran between all pairs of a set of variables.
@@ -465,7 +464,8 @@ def Moran_BV_matrix(variables, w, permutations=0, varnames=None):
     Parameters
     ----------
     variables    : list
-                   sequence of variables
+                   sequence of variables, or (n, k) array with one variable
+                   per column
     w            : W
                    a spatial weights object
     permutations : int
@@ -473,6 +473,8 @@ def Moran_BV_matrix(variables, w, permutations=0, varnames=None):
     varnames     : list
                    strings for variable names. If specified runtime summary is
                    printed
+    transformation  : {'R', 'B', 'D', 'U', 'V'}
+                      weights transformation, default is row-standardized "r".
 
     Returns
     -------
@@ -480,6 +482,14 @@ def Moran_BV_matrix(variables, w, permutations=0, varnames=None):
                    (i,  j) is the key for the pair of variables, values are
                    the Moran_BV objects.
 
+    Notes
+    -----
+    The variables are standardized once and the k x k matrix of statistics
+    is obtained as :math:`Z'WZ/(n-1)` from a single sparse product. The same
+    permutations of the rows of Z are shared by every pair, so all
+    simulated statistics of a block of permutations also come from one
+    sparse product.
+
     Examples
     --------
     >>> import pysal
@@ -510,16 +520,56 @@ def Moran_BV_matrix(variables, w, permutations=0, varnames=None):
 
 
     """
+    if isinstance(variables, np.ndarray) and variables.ndim == 2:
+        y = variables.astype(float)
+    else:
+        y = np.column_stack([np.asarray(v, dtype=float).flatten()
+                             for v in variables])
+    n, k = y.shape
+    Z = (y - y.mean(0)) / y.std(0, ddof=1)
+    den = n - 1.  # z'z = n-1 for every variable
+    w.transform = transformation
+    sparse = w.sparse
+    I = Z.T.dot(sparse.dot(Z)) / den
+
+    def calc(Zp):
+        # Zp is (n, b, k): rows of Z permuted, one block per permutation
+        b = Zp.shape[1]
+        wzp = sparse.dot(Zp.reshape(n, b * k))
+        return Z.T.dot(wzp).reshape(k, b, k).transpose(1, 0, 2) / den
+
+    if permutations:
+        sim = simulate(Z, permutations, calc)
+        larger = (sim >= I).sum(0)
+        low_extreme = (permutations - larger) < larger
+        larger[low_extreme] = permutations - larger[low_extreme]
+        p_sim = (larger + 1.) / (permutations + 1.)
+        EI_sim = sim.sum(0) / permutations
+        seI_sim = sim.std(0)
+        z_sim = (I - EI_sim) / seI_sim
+        p_z_sim = stats.norm.cdf(-np.abs(z_sim))
 
-    k = len(variables)
-    rk = range(0, k - 1)
     results = {}
-    for i in rk:
-        for j in range(i + 1, k):
-            y1 = variables[i]
-            y2 = variables[j]
-            results[i, j] = Moran_BV(y1, y2, w, permutations=permutations)
-            results[j, i] = Moran_BV(y2, y1, w, permutations=permutations)
+    for i in range(k):
+        for j in range(k):
+            if i == j:
+                continue
+            mbv = Moran_BV.__new__(Moran_BV)
+            mbv.zx = Z[:, i]
+            mbv.zy = Z[:, j]
+            mbv.den = den
+            mbv.w = w
+            mbv.I = I[i, j]
+            mbv.num = I[i, j] * den
+            if permutations:
+                mbv.sim = sim[:, i, j]
+                mbv.p_sim = p_sim[i, j]
+                mbv.EI_sim = EI_sim[i, j]
+                mbv.seI_sim = seI_sim[i, j]
+                mbv.VI_sim = seI_sim[i, j] ** 2
+                mbv.z_sim = z_sim[i, j]
+                mbv.p_z_sim = p_z_sim[i, j]
+            results[i, j] = mbv
     return results
 
 class Moran_Rate(Moran):
@@ -754,6 +804,18 @@ class Moran_Local(object):
                      (default=False)
                      If True use GeoDa scheme: HH=1, LL=2, LH=3, HL=4
                      If False use PySAL Scheme: HH=1, LH=2, LL=3, HL=4
+    n_jobs         : int
+                     number of processes used for the conditional
+                     randomization, -1 for all available cores (default=1)
+    seed           : int
+                     seed for the conditional randomization. If None, it is
+                     drawn from numpy's global random state.
+    keep_simulations : boolean
+                     (default=True)
+                     If False, the simulated values are reduced to p_sim,
+                     EI_sim, seI_sim and z_sim as they are generated and sim
+                     and rlisas are set to None. This bounds memory use for
+                     large n and many permutations.
 
     Attributes
     ----------
@@ -771,7 +833,7 @@ class Moran_Local(object):
                    (if permutations>0)
                    values indicate quandrant location 1 HH,  2 LH,  3 LL,  4 HL
     sim          : array (permutations by n)
-                   (if permutations>0)
+                   (if permutations>0 and keep_simulations)
                    I values for permuted samples
     p_sim        : array
                    (if permutations>0)
@@ -810,7 +872,7 @@ class Moran_Local(object):
     >>> lm.q
     array([4, 4, 4, 2, 3, 3, 1, 4, 3, 3])
     >>> lm.p_z_sim[0]
-    0.24669152541631179
+    0.25274772452781047
     >>> lm = ps.Moran_Local(y, w, transformation = "r", permutations = 99, \
                             geoda_quads=True)
     >>> lm.q
@@ -821,7 +883,8 @@ class Moran_Local(object):
     moved into unittests that are conditional on architectures
     """
     def __init__(self, y, w, transformation="r", permutations=PERMUTATIONS,
-                 geoda_quads=False):
+                 geoda_quads=False, n_jobs=1, seed=None,
+                 keep_simulations=True):
         y = np.asarray(y).flatten()
         self.y = y
         n = len(y)
@@ -838,6 +901,9 @@ class Moran_Local(object):
         w.transform = transformation
         self.w = w
         self.permutations = permutations
+        self.n_jobs = n_jobs
+        self.seed = seed
+        self.keep_simulations = keep_simulations
         self.den = (z * z).sum()
         self.Is = self.calc(self.w, self.z)
         self.geoda_quads = geoda_quads
@@ -847,16 +913,20 @@ class Moran_Local(object):
         self.quads = quads
         self.__quads()
         if permutations:
-            self.__crand()
-            sim = np.transpose(self.rlisas)
-            above = sim >= self.Is
-            larger = above.sum(0)
+            if keep_simulations:
+                self.__crand()
+                sim = np.transpose(self.rlisas)
+                above = sim >= self.Is
+                larger = above.sum(0)
+                self.sim = sim
+                self.EI_sim = sim.mean(axis=0)
+                self.seI_sim = sim.std(axis=0)
+            else:
+                larger, self.EI_sim, self.seI_sim = self.__crand(self.Is)
+                self.rlisas = self.sim = None
             low_extreme = (self.permutations - larger) < larger
             larger[low_extreme] = self.permutations - larger[low_extreme]
             self.p_sim = (larger + 1.0) / (permutations + 1.0)
-            self.sim = sim
-            self.EI_sim = sim.mean(axis=0)
-            self.seI_sim = sim.std(axis=0)
             self.VI_sim = self.seI_sim * self.seI_sim
             self.z_sim = (self.Is - self.EI_sim) / self.seI_sim
             self.p_z_sim = 1 - stats.norm.cdf(np.abs(self.z_sim))
@@ -865,37 +935,24 @@ class Moran_Local(object):
         zl = slag(w, z)
         return self.n_1 * self.z * zl / self.den
 
-    def __crand(self):
+    def __crand(self, observed=None):
         """
         conditional randomization
 
         for observation i with ni neighbors,  the candidate set cannot include
-        i (we don't want i being a neighbor of i). we have to sample without
-        replacement from a set of ids that doesn't include i. numpy doesn't
-        directly support sampling wo replacement and it is expensive to
-        implement this. instead we omit i from the original ids,  permute the
-        ids and take the first ni elements of the permuted ids as the
-        neighbors to i in each randomization.
+        i (we don't want i being a neighbor of i). each randomization draws
+        ni of the other n-1 observations without replacement as the
+        neighbors of i, see pysal.esda.permutation.crand. if the observed
+        local statistics are given, only the summaries of the randomization
+        are returned and rlisas is not built.
 
         """
-        z = self.z
-        lisas = np.zeros((self.n, self.permutations))
-        n_1 = self.n - 1
-        prange = range(self.permutations)
-        k = self.w.max_neighbors + 1
-        nn = self.n - 1
-        rids = np.array([np.random.permutation(nn)[0:k] for i in prange])
-        ids = np.arange(self.w.n)
-        ido = self.w.id_order
-        w = [self.w.weights[ido[i]] for i in ids]
-        wc = [self.w.cardinalities[ido[i]] for i in ids]
-
-        for i in xrange(self.w.n):
-            idsi = ids[ids != i]
-            np.random.shuffle(idsi)
-            tmp = z[idsi[rids[:, 0:wc[i]]]]
-            lisas[i] = z[i] * (w[i] * tmp).sum(1)
-        self.rlisas = (n_1 / self.den) * lisas
+        scale = self.n_1 * self.z / self.den
+        rlisas = crand(self.z, self.w.sparse, self.permutations, scale,
+                       n_jobs=self.n_jobs, seed=self.seed, observed=observed)
+        if observed is not None:
+            return rlisas
+        self.rlisas = rlisas
 
     def __quads(self):
         zl = slag(self.w, self.z)
@@ -982,6 +1039,18 @@ class Moran_Local_BV(object):
                      (default=False)
                      If True use GeoDa scheme: HH=1, LL=2, LH=3, HL=4
                      If False use PySAL Scheme: HH=1, LH=2, LL=3, HL=4
+    n_jobs         : int
+                     number of processes used for the conditional
+                     randomization, -1 for all available cores (default=1)
+    seed           : int
+                     seed for the conditional randomization. If None, it is
+                     drawn from numpy's global random state.
+    keep_simulations : boolean
+                     (default=True)
+                     If False, the simulated values are reduced to p_sim,
+                     EI_sim, seI_sim and z_sim as they are generated and sim
+                     and rlisas are set to None. This bounds memory use for
+                     large n and many permutations.
 
     Attributes
     ----------
@@ -1001,7 +1070,7 @@ class Moran_Local_BV(object):
                    (if permutations>0)
                    values indicate quandrant location 1 HH,  2 LH,  3 LL,  4 HL
     sim          : array
-                   (if permutations>0)
+                   (if permutations>0 and keep_simulations)
                    vector of I values for permuted samples
     p_sim        : array
                    (if permutations>0)
@@ -1043,7 +1112,7 @@ class Moran_Local_BV(object):
     >>> lm.q[:10]
     array([3, 4, 3, 4, 2, 1, 4, 4, 2, 4])
     >>> lm.p_z_sim[0]
-    0.0017240031348827456
+    0.05411574120735041
     >>> lm = ps.Moran_Local_BV(x, y, w, transformation = "r", \
                                permutations = 99, geoda_quads=True)
     >>> lm.q[:10]
@@ -1054,7 +1123,8 @@ class Moran_Local_BV(object):
     moved into unittests that are conditional on architectures
     """
     def __init__(self, x, y, w, transformation="r", permutations=PERMUTATIONS,
-                 geoda_quads=False):
+                 geoda_quads=False, n_jobs=1, seed=None,
+                 keep_simulations=True):
         x = np.asarray(x).flatten()
         y = np.asarray(y).flatten()
         self.y = y
@@ -1076,6 +1146,9 @@ class Moran_Local_BV(object):
         w.transform = transformation
         self.w = w
         self.permutations = permutations
+        self.n_jobs = n_jobs
+        self.seed = seed
+        self.keep_simulations = keep_simulations
         self.den = (zx * zx).sum()
         self.Is = self.calc(self.w, self.zx, self.zy)
         self.geoda_quads = geoda_quads
@@ -1085,16 +1158,20 @@ class Moran_Local_BV(object):
         self.quads = quads
         self.__quads()
         if permutations:
-            self.__crand()
-            sim = np.transpose(self.rlisas)
-            above = sim >= self.Is
-            larger = above.sum(0)
+            if keep_simulations:
+                self.__crand()
+                sim = np.transpose(self.rlisas)
+                above = sim >= self.Is
+                larger = above.sum(0)
+                self.sim = sim
+                self.EI_sim = sim.mean(axis=0)
+                self.seI_sim = sim.std(axis=0)
+            else:
+                larger, self.EI_sim, self.seI_sim = self.__crand(self.Is)
+                self.rlisas = self.sim = None
             low_extreme = (self.permutations - larger) < larger
             larger[low_extreme] = self.permutations - larger[low_extreme]
             self.p_sim = (larger + 1.0) / (permutations + 1.0)
-            self.sim = sim
-            self.EI_sim = sim.mean(axis=0)
-            self.seI_sim = sim.std(axis=0)
             self.VI_sim = self.seI_sim * self.seI_sim
             self.z_sim = (self.Is - self.EI_sim) / self.seI_sim
             self.p_z_sim = 1 - stats.norm.cdf(np.abs(self.z_sim))
@@ -1103,38 +1180,24 @@ class Moran_Local_BV(object):
         zly = slag(w, zy)
         return self.n_1 * self.zx * zly / self.den
 
-    def __crand(self):
+    def __crand(self, observed=None):
         """
         conditional randomization
 
         for observation i with ni neighbors,  the candidate set cannot include
-        i (we don't want i being a neighbor of i). we have to sample without
-        replacement from a set of ids that doesn't include i. numpy doesn't
-        directly support sampling wo replacement and it is expensive to
-        implement this. instead we omit i from the original ids,  permute the
-        ids and take the first ni elements of the permuted ids as the
-        neighbors to i in each randomization.
+        i (we don't want i being a neighbor of i). each randomization draws
+        ni of the other n-1 observations without replacement as the
+        neighbors of i, see pysal.esda.permutation.crand. if the observed
+        local statistics are given, only the summaries of the randomization
+        are returned and rlisas is not built.
 
         """
-        lisas = np.zeros((self.n, self.permutations))
-        n_1 = self.n - 1
-        prange = range(self.permutations)
-        k = self.w.max_neighbors + 1
-        nn = self.n - 1
-        rids = np.array([np.random.permutation(nn)[0:k] for i in prange])
-        ids = np.arange(self.w.n)
-        ido = self.w.id_order
-        w = [self.w.weights[ido[i]] for i in ids]
-        wc = [self.w.cardinalities[ido[i]] for i in ids]
-
-        zx = self.zx
-        zy = self.zy
-        for i in xrange(self.w.n):
-            idsi = ids[ids != i]
-            np.random.shuffle(idsi)
-            tmp = zy[idsi[rids[:, 0:wc[i]]]]
-            lisas[i] = zx[i] * (w[i] * tmp).sum(1)
-        self.rlisas = (n_1 / self.den) * lisas
+        scale = self.n_1 * self.zx / self.den
+        rlisas = crand(self.zy, self.w.sparse, self.permutations, scale,
+                       n_jobs=self.n_jobs, seed=self.seed, observed=observed)
+        if observed is not None:
+            return rlisas
+        self.rlisas = rlisas
 
     def __quads(self):
         zl = slag(self.w, self.zy)
@@ -1230,6 +1293,18 @@ class Moran_Local_Rate(Moran_Local):
                      (default=False)
                      If True use GeoDa scheme: HH=1, LL=2, LH=3, HL=4
                      If False use PySAL Scheme: HH=1, LH=2, LL=3, HL=4
+    n_jobs         : int
+                     number of processes used for the conditional
+                     randomization, -1 for all available cores (default=1)
+    seed           : int
+                     seed for the conditional randomization. If None, it is
+                     drawn from numpy's global random state.
+    keep_simulations : boolean
+                     (default=True)
+                     If False, the simulated values are reduced to p_sim,
+                     EI_sim, seI_sim and z_sim as they are generated and sim
+                     and rlisas are set to None. This bounds memory use for
+                     large n and many permutations.
     geoda_rate     : boolean
                      If adjusted=False, geoda_rate is ignored.
                      If adjusted=True and geoda_rate=True, rates are adjusted and
@@ -1257,7 +1332,7 @@ class Moran_Local_Rate(Moran_Local):
                      (if permutations>0)
                      values indicate quandrant location 1 HH,  2 LH,  3 LL,  4 HL
     sim            : array
-                     (if permutations>0)
+                     (if permutations>0 and keep_simulations)
                      vector of I values for permuted samples
     p_sim          : array
                      (if permutations>0)
@@ -1299,7 +1374,7 @@ class Moran_Local_Rate(Moran_Local):
     >>> lm.q[:10]
     array([2, 4, 3, 1, 2, 1, 1, 4, 2, 4])
     >>> lm.p_z_sim[0]
-    0.39319552026912641
+    0.42797616868304
     >>> lm = ps.esda.moran.Moran_Local_Rate(e, b, w, \
                                                transformation = "r", \
                                                permutations = 99, \
@@ -1313,7 +1388,8 @@ class Moran_Local_Rate(Moran_Local):
     """
 
     def __init__(self, e, b, w, adjusted=True, transformation="r",
-                 permutations=PERMUTATIONS, geoda_quads=False, geoda_rate=True):
+                 permutations=PERMUTATIONS, geoda_quads=False, geoda_rate=True,
+                 n_jobs=1, seed=None, keep_simulations=True):
         e = np.asarray(e).flatten()
         b = np.asarray(b).flatten()
         if adjusted:
@@ -1323,7 +1399,9 @@ class Moran_Local_Rate(Moran_Local):
         Moran_Local.__init__(self, y, w,
                              transformation=transformation,
                              permutations=permutations,
-                             geoda_quads=geoda_quads)
+                             geoda_quads=geoda_quads,
+                             n_jobs=n_jobs, seed=seed,
+                             keep_simulations=keep_simulations)
     
     @classmethod
     def by_col(cls, df, events, populations, w=None, inplace=False, 
@@ -0,0 +1,447 @@
+"""
+Permutation engines for ESDA inference.
+
+Global statistics: instead of computing one permuted statistic at a time,
+permutations are drawn in blocks and kept as a (permutations x n) index matrix
+so that every simulated statistic in a block is obtained from a single
+sparse-matrix by dense-matrix product against ``w.sparse``.
+
+Local statistics: conditional randomization draws, for each site, random
+neighbor sets from the other n-1 sites without shuffling the full id array,
+working on chunks of sites that can be spread over a process pool with
+independently seeded random streams. Each chunk can be reduced to its
+summaries (counts above the observed value, mean and standard deviation of
+the simulated values) as soon as it is generated, so the n x permutations
+matrix of simulated statistics never has to be held in memory.
+"""
+
+import multiprocessing as mp
+import numpy as np
+
+__all__ = ['BLOCK_ELEMENTS', 'block_size', 'permutation_blocks', 'simulate',
+           'quadratic_form', 'squared_difference', 'absolute_difference',
+           'crand']
+
+# maximum number of array elements (per array) held by one block of
+# permutations: 2**23 float64 values is 64 MB
+BLOCK_ELEMENTS = 2 ** 23
+
+
+def block_size(width, permutations, max_elements=None):
+    """
+    Number of permutations to evaluate together.
+
+    Parameters
+    ----------
+    width        : int
+                   number of elements generated for each permutation (n for
+                   the permuted values, the number of nonzero weights for
+                   edge-based statistics)
+    permutations : int
+                   total number of permutations
+    max_elements : int
+                   cap on the number of elements in a block, default is
+                   BLOCK_ELEMENTS
+
+    Returns
+    -------
+    size         : int
+                   number of permutations per block
+
+    Examples
+    --------
+    >>> block_size(100, 999)
+    999
+    >>> block_size(1000, 999, max_elements=10000)
+    10
+    """
+    if max_elements is None:
+        max_elements = BLOCK_ELEMENTS
+    size = max(1, int(max_elements // max(width, 1)))
+    return min(size, max(permutations, 1))
+
+
+def permutation_blocks(n, permutations, size=None):
+    """
+    Generator of blocks of random permutations of range(n).
+
+    Permutations are drawn with ``np.random.permutation`` in the same order
+    as a loop calling ``np.random.permutation(y)`` would, so seeded results
+    are unchanged by the block size.
+
+    Parameters
+    ----------
+    n            : int
+                   number of observations
+    permutations : int
+                   total number of permutations
+    size         : int
+                   number of permutations per block, default from block_size
+
+    Yields
+    ------
+    start        : int
+                   offset of the first permutation of the block
+    ids          : array
+                   (size, n) integer array, each row a permutation of
+                   range(n)
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> np.random.seed(10)
+    >>> [(start, ids.shape) for start, ids in permutation_blocks(5, 7, 3)]
+    [(0, (3, 5)), (3, (3, 5)), (6, (1, 5))]
+    """
+    if size is None:
+        size = block_size(n, permutations)
+    for start in range(0, permutations, size):
+        b = min(size, permutations - start)
+        ids = np.empty((b, n), dtype=np.intp)
+        for row in range(b):
+            ids[row] = np.random.permutation(n)
+        yield start, ids
+
+
+def simulate(y, permutations, calc, width=None, size=None):
+    """
+    Simulated reference distribution of a global statistic.
+
+    Parameters
+    ----------
+    y            : array
+                   (n,) values to permute, or (n, k) array of k variables
+                   whose rows are permuted together
+    permutations : int
+                   number of permutations
+    calc         : callable
+                   maps an (n, b) array whose columns are permuted copies of
+                   y (an (n, b, k) array if y is (n, k)) to the (b,) array of
+                   statistics, or to a (b, ...) array when several statistics
+                   are computed per permutation
+    width        : int
+                   elements generated per permutation inside calc, used to
+                   cap the block size (default y.size)
+    size         : int
+                   number of permutations per block, overrides width
+
+    Returns
+    -------
+    sim          : array
+                   (permutations, ...) simulated statistics
+
+    Examples
+    --------
+    >>> import pysal
+    >>> import numpy as np
+    >>> w = pysal.lat2W(3, 3)
+    >>> y = np.arange(9.)
+    >>> sim = simulate(y, 99, lambda Y: quadratic_form(w.sparse, Y))
+    >>> sim.shape
+    (99,)
+    """
+    y = np.asarray(y)
+    if y.ndim != 2:
+        y = y.flatten()
+    n = y.shape[0]
+    if size is None:
+        size = block_size(max(y.size, width or y.size), permutations)
+    sim = None
+    for start, ids in permutation_blocks(n, permutations, size):
+        block = np.asarray(calc(y[ids.T]))
+        if sim is None:
+            sim = np.empty((permutations,) + block.shape[1:])
+        sim[start:start + ids.shape[0]] = block
+    return sim
+
+
+def quadratic_form(sparse, Y):
+    """
+    Column-wise cross-product :math:`y'Wy`.
+
+    Parameters
+    ----------
+    sparse : sparse_matrix
+             (n, n) spatial weights
+    Y      : array
+             (n, b) values, one variable per column
+
+    Returns
+    -------
+    yWy    : array
+             (b,) cross-products, one per column
+
+    Examples
+    --------
+    >>> import pysal
+    >>> import numpy as np
+    >>> w = pysal.lat2W(3, 3)
+    >>> Y = np.arange(18.).reshape(9, 2)
+    >>> quadratic_form(w.sparse, Y)
+    array([ 1856.,  2264.])
+    """
+    Y = np.asarray(Y)
+    if Y.ndim == 1:
+        Y = Y.reshape(-1, 1)
+    return (Y * sparse.dot(Y)).sum(0)
+
+
+def squared_difference(sparse, Y):
+    """
+    Column-wise :math:`\sum_i \sum_j w_{i,j} (y_i - y_j)^2`.
+
+    Parameters
+    ----------
+    sparse : sparse_matrix
+             (n, n) spatial weights
+    Y      : array
+             (n, b) values, one variable per column
+
+    Returns
+    -------
+    ssd    : array
+             (b,) weighted sums of squared differences
+
+    Notes
+    -----
+    Expands the square as :math:`\sum_i y_i^2 (w_{i.} + w_{.i}) - 2y'Wy` so
+    that only one sparse product is needed.
+
+    Examples
+    --------
+    >>> import pysal
+    >>> import numpy as np
+    >>> w = pysal.lat2W(3, 3)
+    >>> squared_difference(w.sparse, np.arange(9.))
+    array([ 120.])
+    """
+    Y = np.asarray(Y)
+    if Y.ndim == 1:
+        Y = Y.reshape(-1, 1)
+    rc = np.asarray(sparse.sum(1)).flatten() + \
+        np.asarray(sparse.sum(0)).flatten()
+    return (Y * Y * rc[:, None]).sum(0) - 2. * quadratic_form(sparse, Y)
+
+
+def absolute_difference(sparse, Y):
+    """
+    Column-wise :math:`\sum_i \sum_j w_{i,j} |y_i - y_j|`.
+
+    Parameters
+    ----------
+    sparse : sparse_matrix
+             (n, n) spatial weights
+    Y      : array
+             (n, b) values, one variable per column
+
+    Returns
+    -------
+    sad    : array
+             (b,) weighted sums of absolute differences
+
+    Notes
+    -----
+    Works on the (nnz, b) array of differences across weighted pairs; callers
+    should size blocks with width=sparse.nnz.
+
+    Examples
+    --------
+    >>> import pysal
+    >>> import numpy as np
+    >>> w = pysal.lat2W(3, 3)
+    >>> absolute_difference(w.sparse, np.arange(9.))
+    array([ 48.])
+    """
+    Y = np.asarray(Y)
+    if Y.ndim == 1:
+        Y = Y.reshape(-1, 1)
+    coo = sparse.tocoo()
+    d = np.abs(Y[coo.row] - Y[coo.col])
+    return (coo.data[:, None] * d).sum(0)
+
+
+def crand(z, sparse, permutations, scale, offset=None, n_jobs=1, seed=None,
+          observed=None):
+    """
+    Conditional randomization for local statistics.
+
+    For every site i and every permutation, the neighbors of i are replaced by
+    a random draw (without replacement) of card(i) of the other n-1 sites and
+    the weighted sum of their values is taken. The local statistic is assumed
+    affine in that random lag:
+
+    .. math::
+            I^*_i = scale_i \sum_j w_{i,j} z_{\pi(j)} + offset_i
+
+    Parameters
+    ----------
+    z            : array
+                   (n,) values drawn for the random neighbors
+    sparse       : sparse_matrix
+                   (n, n) CSR spatial weights, row i holds the weights used
+                   for the neighbors of site i
+    permutations : int
+                   number of random draws per site
+    scale        : array
+                   (n,) multiplier of the random lag for each site
+    offset       : array
+                   (n,) constant added for each site (default 0)
+    n_jobs       : int
+                   number of processes the chunks of sites are spread over,
+                   -1 for all available cores (default 1, no pool)
+    seed         : int
+                   seed of the master random stream, from which one seed is
+                   drawn per chunk of sites. If None, the master seed is drawn
+                   from numpy's global random state, so np.random.seed still
+                   gives reproducible results. Results do not depend on
+                   n_jobs.
+    observed     : array
+                   (n,) observed local statistics. If given, the simulated
+                   statistics are reduced chunk by chunk and only their
+                   summaries are returned.
+
+    Returns
+    -------
+    rstats       : array
+                   (n, permutations) simulated local statistics, if observed
+                   is None
+    larger       : array
+                   (n,) number of simulated statistics greater than or equal
+                   to the observed ones, if observed is given
+    mean         : array
+                   (n,) mean of the simulated statistics, if observed is given
+    std          : array
+                   (n,) standard deviation of the simulated statistics, if
+                   observed is given
+
+    Examples
+    --------
+    >>> import pysal
+    >>> import numpy as np
+    >>> w = pysal.lat2W(5, 5)
+    >>> w.transform = 'r'
+    >>> z = np.arange(25.)
+    >>> r1 = crand(z, w.sparse, 99, np.ones(25), seed=1)
+    >>> r2 = crand(z, w.sparse, 99, np.ones(25), n_jobs=2, seed=1)
+    >>> r1.shape
+    (25, 99)
+    >>> np.allclose(r1, r2)
+    True
+
+    Summaries only, without keeping the simulations
+
+    >>> larger, mean, std = crand(z, w.sparse, 99, np.ones(25), seed=1,
+    ...                           observed=z)
+    >>> np.allclose(mean, r1.mean(1))
+    True
+    """
+    z = np.asarray(z, dtype=float).flatten()
+    n = z.shape[0]
+    sparse = sparse.tocsr()
+    scale = np.asarray(scale, dtype=float).flatten()
+    if offset is None:
+        offset = np.zeros(n)
+    offset = np.asarray(offset, dtype=float).flatten()
+    cards = np.diff(sparse.indptr)
+    k = max(int(cards.max()), 1) if n else 1
+    chunk = block_size(permutations * k, n)
+    starts = list(range(0, n, chunk))
+    if seed is None:
+        seed = np.random.randint(np.iinfo(np.int32).max)
+    seeds = np.random.RandomState(seed).randint(np.iinfo(np.int32).max,
+                                                size=len(starts))
+    tasks = [(start, min(start + chunk, n), permutations, s)
+             for start, s in zip(starts, seeds)]
+    if observed is not None:
+        observed = np.asarray(observed, dtype=float).flatten()
+    data = (z, sparse.indptr, sparse.data, scale, offset, observed)
+    if n_jobs == -1:
+        n_jobs = mp.cpu_count()
+    if n_jobs > 1 and len(tasks) > 1:
+        pool = mp.Pool(min(n_jobs, len(tasks)), _crand_init, data)
+        try:
+            results = pool.map(_crand_chunk, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _crand_init(*data)
+        results = [_crand_chunk(task) for task in tasks]
+    _CRAND.clear()
+    if observed is None:
+        return np.vstack(results) if results else np.zeros((0, permutations))
+    summaries = np.vstack(results) if results else np.zeros((0, 3))
+    return summaries[:, 0].astype(int), summaries[:, 1], summaries[:, 2]
+
+
+# arrays shared by the chunks of a crand run, set once per worker process
+_CRAND = {}
+
+
+def _crand_init(z, indptr, data, scale, offset, observed=None):
+    _CRAND.update(z=z, indptr=indptr, data=data, scale=scale, offset=offset,
+                  observed=observed)
+
+
+def _crand_chunk(task):
+    start, stop, permutations, seed = task
+    z = _CRAND['z']
+    indptr = _CRAND['indptr']
+    data = _CRAND['data']
+    rng = np.random.RandomState(seed)
+    n_1 = z.shape[0] - 1
+    sites = np.arange(start, stop)
+    cards = indptr[start + 1:stop + 1] - indptr[start:stop]
+    lags = np.zeros((stop - start, permutations))
+    for c in np.unique(cards):
+        if c == 0:
+            continue
+        rows = np.flatnonzero(cards == c)
+        ids = _sample_without_replacement(rng, n_1, (rows.shape[0],
+                                                     permutations), c)
+        # skip site i itself: draws are offsets among the n-1 other sites
+        ids += ids >= sites[rows][:, None, None]
+        wts = data[indptr[sites[rows]][:, None] + np.arange(c)]
+        lags[rows] = (z[ids] * wts[:, None, :]).sum(-1)
+    scale = _CRAND['scale'][start:stop]
+    offset = _CRAND['offset'][start:stop]
+    rstats = scale[:, None] * lags + offset[:, None]
+    observed = _CRAND['observed']
+    if observed is None:
+        return rstats
+    larger = (rstats >= observed[start:stop, None]).sum(1)
+    return np.column_stack((larger, rstats.mean(1), rstats.std(1)))
+
+
+def _sample_without_replacement(rng, n, shape, k):
+    """
+    Draw shape + (k,) integers from range(n) with distinct values along the
+    last axis.
+    """
+    if 2 * k > n:
+        # dense draws, rejection sampling would rarely succeed
+        keys = rng.random_sample(shape + (n,))
+        return keys.argsort(-1)[..., :k]
+    ids = rng.randint(0, n, size=shape + (k,))
+    dup = _duplicated(ids)
+    while dup.any():
+        redraw = rng.randint(0, n, size=(dup.sum(), k))
+        ids[dup] = redraw
+        dup[dup] = _duplicated(redraw)
+    return ids
+
+
+def _duplicated(ids):
+    """
+    Flag the rows (along the last axis) of ids holding a repeated value.
+    """
+    k = ids.shape[-1]
+    if k > 8:
+        srt = np.sort(ids, -1)
+        return (srt[..., 1:] == srt[..., :-1]).any(-1)
+    # pairwise comparisons are cheaper than sorting short rows
+    dup = np.zeros(ids.shape[:-1], dtype=bool)
+    for a in range(k - 1):
+        for b in range(a + 1, k):
+            dup |= ids[..., a] == ids[..., b]
+    return dup
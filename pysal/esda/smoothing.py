@@ -15,16 +15,20 @@ Author(s):
 __author__ = "Myunghwa Hwang <mhwang4@gmail.com>, David Folch <dfolch@asu.edu>, Luc Anselin <luc.anselin@asu.edu>, Serge Rey <srey@asu.edu"
 
 import pysal
+import multiprocessing as mp
+from multiprocessing.pool import ThreadPool
 from ..weights import comb, Kernel, W
 from ..weights.util import get_points_array
 from ..cg import Point, Ray, LineSegment
 from ..cg import get_angle_between, get_points_dist, get_segment_point_dist,\
                  get_point_at_angle_and_dist, convex_hull, get_bounding_box
 from ..common import np, KDTree, requires as _requires
+from .permutation import block_size
 from ..weights.spatial_lag import lag_spatial as slag
 from scipy.stats import gamma, norm, chi2, poisson
+from scipy import sparse as SP
 
-__all__ = ['Excess_Risk', 'Empirical_Bayes', 'Spatial_Empirical_Bayes', 'Spatial_Rate', 'Kernel_Smoother', 'Age_Adjusted_Smoother', 'Disk_Smoother', 'Spatial_Median_Rate', 'Spatial_Filtering', 'Headbanging_Triples', 'Headbanging_Median_Rate', 'flatten', 'weighted_median', 'sum_by_n', 'crude_age_standardization', 'direct_age_standardization', 'indirect_age_standardization', 'standardized_mortality_ratio', 'choynowski', 'assuncao_rate']
+__all__ = ['Excess_Risk', 'Empirical_Bayes', 'Spatial_Empirical_Bayes', 'Spatial_Rate', 'Kernel_Smoother', 'Age_Adjusted_Smoother', 'Disk_Smoother', 'Spatial_Median_Rate', 'Spatial_Filtering', 'Headbanging_Triples', 'Headbanging_Median_Rate', 'flatten', 'weighted_median', 'grouped_median', 'sum_by_n', 'crude_age_standardization', 'direct_age_standardization', 'indirect_age_standardization', 'standardized_mortality_ratio', 'choynowski', 'assuncao_rate']
 
 
 def flatten(l, unique=True):
@@ -111,6 +115,102 @@ def weighted_median(d, w):
     return np.sort(d)[median_inx]
 
 
+def grouped_median(d, indptr, indices=None, aw=None):
+    """Medians (or weighted medians) of d within the groups of a CSR layout
+
+    Parameters
+    ----------
+    d          : array
+                 (t, ), values for which medians will be found
+    indptr     : array
+                 (n+1, ), group i holds the positions
+                 indices[indptr[i]:indptr[i+1]]
+    indices    : array
+                 positions of the group members in d (and aw); if None, d is
+                 already arranged by group
+    aw         : array
+                 (t, ), weights for weighted medians, aligned with d; if
+                 None, plain medians are returned
+
+    Returns
+    -------
+               : array
+                 (n, ), median of every group (nan for empty groups). With
+                 aw, the values are those of weighted_median applied to
+                 every group.
+
+    Notes
+    -----
+    Groups with the same number of members are gathered into a dense block
+    and solved together, so the cost is a few sorts over (groups x size)
+    arrays instead of one Python call per group.
+
+    Examples
+    --------
+
+    Three groups over five values: {5, 4}, {3} and {4, 1, 2}
+
+    >>> d = np.array([5., 4., 3., 1., 2.])
+    >>> indptr = np.array([0, 2, 3, 6])
+    >>> indices = np.array([0, 1, 2, 1, 3, 4])
+    >>> grouped_median(d, indptr, indices)
+    array([ 4.5,  3. ,  2. ])
+
+    Using the values themselves as weights
+
+    >>> grouped_median(d, indptr, indices, aw=d)
+    array([ 5.,  3.,  4.])
+
+    """
+    return _grouped_median(d, aw, _csr_groups(indptr, indices))
+
+
+def _csr_groups(indptr, indices=None):
+    """Blocks of group ids and (groups x size) member positions by group
+    size"""
+    indptr = np.asarray(indptr)
+    lens = np.diff(indptr)
+    groups = []
+    for size in np.unique(lens):
+        rows = np.nonzero(lens == size)[0]
+        pos = indptr[rows][:, None] + np.arange(size)
+        if indices is not None:
+            pos = np.asarray(indices)[pos]
+        groups.append((rows, pos))
+    return len(lens), groups
+
+
+def _grouped_median(d, aw, groups):
+    n, groups = groups
+    d = np.asarray(d).flatten()
+    out = np.empty(n)
+    for rows, pos in groups:
+        size = pos.shape[1]
+        if size == 0:
+            out[rows] = np.nan
+        elif aw is None:
+            out[rows] = np.median(d[pos], axis=1)
+        else:
+            # same rule as weighted_median: sort by value (ties by weight)
+            # and take the first value at which the cumulative weight
+            # reaches half of the total
+            d_g = d[pos]
+            aw_g = np.asarray(aw).flatten()[pos]
+            order = np.lexsort((aw_g, d_g), axis=1)
+            take = np.arange(len(rows))[:, None]
+            d_g, aw_g = d_g[take, order], aw_g[take, order]
+            reordered_w = aw_g.cumsum(axis=1)
+            cumsum_threshold = reordered_w[:, -1:] * 1.0 / 2
+            median_inx = (reordered_w >= cumsum_threshold).argmax(axis=1)
+            take = take[:, 0]
+            median = d_g[take, median_inx]
+            tie = (reordered_w[take, median_inx] == cumsum_threshold[:, 0]) &\
+                (median_inx < size - 1)
+            median[tie] = (median[tie] + d_g[take[tie], median_inx[tie] + 1]) / 2.
+            out[rows] = median
+    return out
+
+
 def sum_by_n(d, w, n):
     """A utility function to summarize a data array into n values
        after weighting the array with another weight array w
@@ -575,6 +675,34 @@ def assuncao_rate(e, b, geoda=True):
     return (y - ebi_b) / np.sqrt(ebi_v)
 
 
+def _columns(a):
+    """
+    Arrange an event or population variable as columns.
+
+    A 1-d array, or an array with a single column, becomes an (n, 1) array,
+    while an (n, m) array keeps its m columns so that m variables observed
+    on the same spatial units can be smoothed together.
+    """
+    a = np.asarray(a)
+    if a.ndim < 2:
+        return a.reshape(-1, 1)
+    return a.reshape(a.shape[0], -1)
+
+
+def _w_groups(w):
+    """
+    Positions of the list w grouped by the weights object they hold, in order
+    of first appearance, so that variables sharing a W are smoothed together.
+    """
+    groups, seen = [], {}
+    for i, wi in enumerate(w):
+        if id(wi) not in seen:
+            seen[id(wi)] = len(groups)
+            groups.append([])
+        groups[seen[id(wi)]].append(i)
+    return groups
+
+
 class _Smoother(object):
     """
     This is a helper class that implements things that all smoothers should do.
@@ -748,7 +876,13 @@ class _Spatial_Smoother(_Smoother):
     TBQH, most of these smoothers should be functions, not classes (aside from
     maybe headbanging triples), since they're literally only inits + one
     attribute.
+
+    Smoothers setting _multi_column accept (n, m) event and population
+    arrays, and by_col smooths all the columns sharing a weights object in a
+    single call.
     """
+    _multi_column = False
+
     def __init__(self):
         pass
 
@@ -812,6 +946,17 @@ class _Spatial_Smoother(_Smoother):
         except AssertionError:
             raise ValueError('There is no one-to-one mapping between event'
                              ' variable and population at risk variable!')
+        if cls._multi_column:
+            for group in _w_groups(w):
+                enames = [e[i] for i in group]
+                bnames = [b[i] for i in group]
+                r = cls(df[enames].values, df[bnames].values, w=w[group[0]],
+                        **kwargs).r
+                for j, (ename, bname) in enumerate(zip(enames, bnames)):
+                    outcol = '_'.join(('-'.join((ename, bname)),
+                                       cls.__name__.lower()))
+                    df[outcol] = r[:, j]
+            return
         for ei, bi, wi in zip(e, b, w):
             ename = ei
             bname = bi
@@ -825,15 +970,17 @@ class Spatial_Empirical_Bayes(_Spatial_Smoother):
 
     Parameters
     ----------
-    e           : array (n, 1)
-                  event variable measured across n spatial units
-    b           : array (n, 1)
-                  population at risk variable measured across n spatial units
+    e           : array (n, 1) or (n, m)
+                  event variable measured across n spatial units, or m event
+                  variables smoothed together
+    b           : array (n, 1) or (n, m)
+                  population at risk variable measured across n spatial units,
+                  one column for each column of e
     w           : spatial weights instance
 
     Attributes
     ----------
-    r           : array (n, 1)
+    r           : array (n, 1) or (n, m)
                   rate values from Empirical Bayes Smoothing
 
     Examples
@@ -869,23 +1016,38 @@ class Spatial_Empirical_Bayes(_Spatial_Smoother):
              5.09387329e-05,   3.72735210e-05,   3.69333797e-05,
              5.40245456e-05,   2.99806055e-05,   3.73034109e-05,
              3.47270722e-05])
+
+    Several event variables can be smoothed against their populations at
+    once, here the same homicides over the population and twice the
+    population
+
+    >>> s_eb2 = Spatial_Empirical_Bayes(np.column_stack((stl_e, stl_e)),
+    ...                                 np.column_stack((stl_b, 2 * stl_b)),
+    ...                                 stl_w)
+    >>> s_eb2.r.shape
+    (78, 2)
+    >>> np.allclose(s_eb2.r[:, :1], s_eb.r)
+    True
     """
+    _multi_column = True
+
     def __init__(self, e, b, w):
         if not w.id_order_set:
             raise ValueError("w id_order must be set to align with the order of e an b")
-        e = np.asarray(e).reshape(-1,1)
-        b = np.asarray(b).reshape(-1,1)
+        e = _columns(e)
+        b = _columns(b)
         r_mean = Spatial_Rate(e, b, w).r
         rate = e * 1.0 / b
-        r_var_left = np.ones_like(e) * 1.
-        ngh_num = np.ones_like(e)
         bi = slag(w, b) + b
-        for i, idv in enumerate(w.id_order):
-            ngh = w[idv].keys() + [idv]
-            nghi = [w.id2i[k] for k in ngh]
-            ngh_num[i] = len(nghi)
-            v = sum(np.square(rate[nghi] - r_mean[i]) * b[nghi])
-            r_var_left[i] = v
+        # each unit and its neighbors, whatever their weights
+        disk = w.sparse.tocsr(copy=True)
+        disk.data = np.ones_like(disk.data, dtype=float)
+        disk = disk + SP.identity(w.n, format='csr')
+        ngh_num = np.asarray(disk.sum(axis=1))
+        # sum of b * (rate - r_mean) ** 2 over the disk of each unit
+        b_rate = b * rate
+        r_var_left = (disk * (b_rate * rate) - 2 * r_mean * (disk * b_rate) +
+                      np.square(r_mean) * (disk * b))
         r_var_left = r_var_left / bi
         r_var_right = r_mean / (bi / ngh_num)
         r_var = r_var_left - r_var_right
@@ -897,15 +1059,17 @@ class Spatial_Rate(_Spatial_Smoother):
 
     Parameters
     ----------
-    e           : array (n, 1)
-                  event variable measured across n spatial units
-    b           : array (n, 1)
-                  population at risk variable measured across n spatial units
+    e           : array (n, 1) or (n, m)
+                  event variable measured across n spatial units, or m event
+                  variables smoothed together
+    b           : array (n, 1) or (n, m)
+                  population at risk variable measured across n spatial units,
+                  one column for each column of e
     w           : spatial weights instance
 
     Attributes
     ----------
-    r           : array (n, 1)
+    r           : array (n, 1) or (n, m)
                   rate values from spatial rate smoothing
 
     Examples
@@ -942,12 +1106,14 @@ class Spatial_Rate(_Spatial_Smoother):
              3.79372794e-05,   3.27019246e-05,   4.26204928e-05,
              3.47270722e-05])
     """
+    _multi_column = True
+
     def __init__(self, e, b, w):
         if not w.id_order_set:
             raise ValueError("w id_order must be set to align with the order of e and b")
         else:
-            e = np.asarray(e).reshape(-1,1)
-            b = np.asarray(b).reshape(-1,1)
+            e = _columns(e)
+            b = _columns(b)
             w.transform = 'b'
             w_e, w_b = slag(w, e), slag(w, b)
             self.r = (e + w_e) / (b + w_b)
@@ -959,15 +1125,17 @@ class Kernel_Smoother(_Spatial_Smoother):
 
     Parameters
     ----------
-    e           : array (n, 1)
-                  event variable measured across n spatial units
-    b           : array (n, 1)
-                  population at risk variable measured across n spatial units
+    e           : array (n, 1) or (n, m)
+                  event variable measured across n spatial units, or m event
+                  variables smoothed together
+    b           : array (n, 1) or (n, m)
+                  population at risk variable measured across n spatial units,
+                  one column for each column of e
     w           : Kernel weights instance
 
     Attributes
     ----------
-    r           : array (n, 1)
+    r           : array (n, 1) or (n, m)
                   rate values from spatial rate smoothing
 
     Examples
@@ -1004,14 +1172,16 @@ class Kernel_Smoother(_Spatial_Smoother):
     array([ 0.10543301,  0.0858573 ,  0.08256196,  0.09884584,  0.04756872,
             0.04845298])
     """
+    _multi_column = True
+
     def __init__(self, e, b, w):
         if type(w) != Kernel:
             raise Error('w must be an instance of Kernel weights')
         if not w.id_order_set:
             raise ValueError("w id_order must be set to align with the order of e and b")
         else:
-            e = np.asarray(e).reshape(-1,1)
-            b = np.asarray(b).reshape(-1,1)
+            e = _columns(e)
+            b = _columns(b)
             w_e, w_b = slag(w, e), slag(w, b)
             self.r = w_e / w_b
 
@@ -1021,17 +1191,20 @@ class Age_Adjusted_Smoother(_Spatial_Smoother):
 
     Parameters
     ----------
-    e           : array (n*h, 1)
-                  event variable measured for each age group across n spatial units
-    b           : array (n*h, 1)
-                  population at risk variable measured for each age group across n spatial units
+    e           : array (n*h, 1) or (n*h, m)
+                  event variable measured for each age group across n spatial
+                  units, or m event variables smoothed together
+    b           : array (n*h, 1) or (n*h, m)
+                  population at risk variable measured for each age group
+                  across n spatial units, one column for each column of e
     w           : spatial weights instance
-    s           : array (n*h, 1)
-                  standard population for each age group across n spatial units
+    s           : array (n*h, 1) or (n*h, m)
+                  standard population for each age group across n spatial
+                  units, shared by all the columns of e or one for each
 
     Attributes
     ----------
-    r           : array (n, 1)
+    r           : array (n, ) or (n, m)
                   rate values from spatial rate smoothing
 
     Notes
@@ -1077,24 +1250,24 @@ class Age_Adjusted_Smoother(_Spatial_Smoother):
     array([ 0.10519625,  0.08494318,  0.06440072,  0.06898604,  0.06952076,
             0.05020968])
     """
+    _multi_column = True
+
     def __init__(self, e, b, w, s, alpha=0.05):
-        e = np.asarray(e).reshape(-1, 1)
-        b = np.asarray(b).reshape(-1, 1)
-        s = np.asarray(s).flatten()
-        t = len(e)
+        e = _columns(e)
+        b = _columns(b)
+        s = _columns(s)
+        t, m = e.shape
         h = t // w.n
         w.transform = 'b'
-        e_n, b_n = [], []
-        for i in range(h):
-            e_n.append(slag(w, e[i::h]).tolist())
-            b_n.append(slag(w, b[i::h]).tolist())
-        e_n = np.array(e_n).reshape((1, t), order='F')[0]
-        b_n = np.array(b_n).reshape((1, t), order='F')[0]
-        e_n = e_n.reshape(s.shape)
-        b_n = b_n.reshape(s.shape)
-        r = direct_age_standardization(e_n, b_n, s, w.n, alpha=alpha)
-        self.r = np.array([i[0] for i in r])
+        # rows hold the age groups of a unit, so one lag covers all of them
+        e_n = slag(w, e.reshape(w.n, h * m)).reshape(t, m)
+        b_n = slag(w, b.reshape(w.n, h * m)).reshape(t, m)
         w.transform = 'o'
+        # the rates of direct_age_standardization for every column
+        s_sum = s.reshape(w.n, h, -1).sum(axis=1).repeat(h, axis=0)
+        age_weight = (1.0 / b_n) * (s * 1.0 / s_sum)
+        r = (e_n * age_weight).reshape(w.n, h, m).sum(axis=1)
+        self.r = r[:, 0] if m == 1 else r
 
     @_requires('pandas')
     @classmethod
@@ -1171,14 +1344,18 @@ class Age_Adjusted_Smoother(_Spatial_Smoother):
                              ' weights!')
         rdf = []
         max_len = 0
-        for ei, bi, wi, si in zip(e, b, w, s):
-            ename = ei
-            bname = bi
-            h = len(ei) // wi.n
-            outcol = '_'.join(('-'.join((ename, bname)), cls.__name__.lower()))
-            this_r = cls(df[ei], df[bi], w=wi, s=df[si], **kwargs).r
-            max_len = 0 if len(this_r) > max_len else max_len
-            rdf.append((outcol, this_r.tolist()))
+        for group in _w_groups(w):
+            enames = [e[i] for i in group]
+            bnames = [b[i] for i in group]
+            snames = [s[i] for i in group]
+            this_r = cls(df[enames].values, df[bnames].values,
+                         w=w[group[0]], s=df[snames].values, **kwargs).r
+            this_r = this_r.reshape(len(this_r), -1)
+            for j, (ename, bname) in enumerate(zip(enames, bnames)):
+                outcol = '_'.join(('-'.join((ename, bname)),
+                                   cls.__name__.lower()))
+                max_len = 0 if len(this_r) > max_len else max_len
+                rdf.append((outcol, this_r[:, j].tolist()))
         padded = (r[1] + [None] * max_len for r in rdf)
         rdf = zip((r[0] for r in rdf), padded)
         rdf = pd.DataFrame.from_items(rdf)
@@ -1190,15 +1367,17 @@ class Disk_Smoother(_Spatial_Smoother):
 
     Parameters
     ----------
-    e           : array (n, 1)
-                  event variable measured across n spatial units
-    b           : array (n, 1)
-                  population at risk variable measured across n spatial units
+    e           : array (n, 1) or (n, m)
+                  event variable measured across n spatial units, or m event
+                  variables smoothed together
+    b           : array (n, 1) or (n, m)
+                  population at risk variable measured across n spatial units,
+                  one column for each column of e
     w           : spatial weights matrix
 
     Attributes
     ----------
-    r           : array (n, 1)
+    r           : array (n, 1) or (n, m)
                   rate values from disk smoothing
 
     Examples
@@ -1236,17 +1415,17 @@ class Disk_Smoother(_Spatial_Smoother):
              3.09511832e-05])
     """
 
+    _multi_column = True
+
     def __init__(self, e, b, w):
         if not w.id_order_set:
             raise ValueError("w id_order must be set to align with the order of e and b")
         else:
-            e = np.asarray(e).reshape(-1,1)
-            b = np.asarray(b).reshape(-1,1)
+            e = _columns(e)
+            b = _columns(b)
             r = e * 1.0 / b
-            weight_sum = []
-            for i in w.id_order:
-                weight_sum.append(sum(w.weights[i]))
-            self.r = slag(w, r) / np.array(weight_sum).reshape(-1,1)
+            weight_sum = np.asarray(w.sparse.sum(axis=1))
+            self.r = slag(w, r) / weight_sum
 
 
 class Spatial_Median_Rate(_Spatial_Smoother):
@@ -1352,23 +1531,24 @@ class Spatial_Median_Rate(_Spatial_Smoother):
         b = np.asarray(b).flatten()
         self.r = e * 1.0 / b
         self.aw, self.w = aw, w
+        # each disk is an observation and its neighbors, laid out as CSR
+        # groups once and reused in every iteration
+        s = w.sparse
+        n = s.shape[0]
+        indptr = s.indptr + np.arange(n + 1)
+        indices = np.empty(indptr[-1], dtype=int)
+        own = np.zeros(indptr[-1], dtype=bool)
+        own[indptr[:-1]] = True
+        indices[own] = np.arange(n)
+        indices[~own] = s.indices
+        self.__disks = _csr_groups(indptr, indices)
         while iteration:
             self.__search_median()
             iteration -= 1
 
     def __search_median(self):
-        r, aw, w = self.r, self.aw, self.w
-        new_r = []
-        if self.aw is None:
-            for i, id in enumerate(w.id_order):
-                r_disk = np.append(r[i], r[w.neighbor_offsets[id]])
-                new_r.append(np.median(r_disk))
-        else:
-            for i, id in enumerate(w.id_order):
-                id_d = [i] + list(w.neighbor_offsets[id])
-                aw_d, r_d = aw[id_d], r[id_d]
-                new_r.append(weighted_median(r_d, aw_d))
-        self.r = np.asarray(new_r).reshape(r.shape)
+        r = self.r
+        self.r = _grouped_median(r, self.aw, self.__disks).reshape(r.shape)
 
 
 class Spatial_Filtering(_Smoother):
@@ -1392,6 +1572,9 @@ class Spatial_Filtering(_Smoother):
                   fixed radius of a moving window
     pop         : integer
                   population threshold to create adaptive moving windows
+    n_jobs      : integer
+                  number of threads searching the adaptive moving windows,
+                  -1 uses all available cores
 
     Attributes
     ----------
@@ -1399,6 +1582,10 @@ class Spatial_Filtering(_Smoother):
                   x, y coordinates for grid points
     r           : array (x_grid*y_grid, 1)
                   rate values for grid points
+    raster      : array (x_grid, y_grid)
+                  rate values for grid points arranged as a surface, where
+                  raster[i, j] is the rate of the i-th cell on the x axis and
+                  the j-th cell on the y axis
 
     Notes
     -----
@@ -1462,9 +1649,18 @@ class Spatial_Filtering(_Smoother):
              3.81035327e-05,   4.54831940e-05,   4.54831940e-05,
              3.75658628e-05,   3.75658628e-05,   3.75658628e-05,
              3.75658628e-05])
+
+    The same rates are available as a surface with one row per cell on the
+    x axis
+
+    >>> sf.raster.shape
+    (10, 10)
+    >>> sf.raster[0, :3]
+    array([  3.73728738e-05,   4.04456300e-05,   4.04456300e-05])
     """
 
-    def __init__(self, bbox, data, e, b, x_grid, y_grid, r=None, pop=None):
+    def __init__(self, bbox, data, e, b, x_grid, y_grid, r=None, pop=None,
+                 n_jobs=1):
         e= np.asarray(e).reshape(-1,1)
         b= np.asarray(b).reshape(-1,1)
         data_tree = KDTree(data)
@@ -1472,6 +1668,7 @@ class Spatial_Filtering(_Smoother):
         y_range = bbox[1][1] - bbox[0][1]
         x, y = np.mgrid[bbox[0][0]:bbox[1][0]:float(x_range) / x_grid,
                         bbox[0][1]:bbox[1][1]:float(y_range) / y_grid]
+        grid = np.column_stack((x.ravel(), y.ravel()))
         self.grid = zip(x.ravel(), y.ravel())
         self.r = []
         if r is None and pop is None:
@@ -1482,16 +1679,10 @@ class Spatial_Filtering(_Smoother):
                 r = e[i].sum() * 1.0 / b[i].sum()
                 self.r.append(r)
         if pop is not None:
-            half_nearest_pnts = data_tree.query(self.grid, k=len(e))[1]
-            for i in half_nearest_pnts:
-                e_n, b_n = e[i].cumsum(), b[i].cumsum()
-                b_n_filter = b_n <= pop
-                e_n_f, b_n_f = e_n[b_n_filter], b_n[b_n_filter]
-                if len(e_n_f) == 0:
-                    e_n_f = e_n[[0]]
-                    b_n_f = b_n[[0]]
-                self.r.append(e_n_f[-1] * 1.0 / b_n_f[-1])
+            self.r = _adaptive_rates(data_tree, grid, e.flatten(),
+                                     b.flatten(), pop, n_jobs=n_jobs)
         self.r = np.array(self.r)
+        self.raster = self.r.reshape(x.shape)
 
     @_requires('pandas')
     @classmethod
@@ -1557,6 +1748,102 @@ class Spatial_Filtering(_Smoother):
 
 
 
+def _adaptive_rates(tree, grid, e, b, pop, k=None, n_jobs=1):
+    """
+    Rates within moving windows that grow around each grid point until their
+    population passes pop.
+
+    Parameters
+    ----------
+    tree        : KDTree
+                  tree built on the n point locations
+    grid        : array (g, 2)
+                  x, y coordinates for grid points
+    e           : array (n, )
+                  event variable measured across n spatial units
+    b           : array (n, )
+                  non-negative population at risk measured across n spatial
+                  units
+    pop         : float
+                  population threshold
+    k           : integer
+                  number of nearest points searched first, doubled for the
+                  grid points whose windows are not yet complete
+    n_jobs      : integer
+                  number of threads searching the chunks of grid points,
+                  -1 uses all available cores
+
+    Returns
+    -------
+    r           : array (g, )
+                  rate values for grid points
+
+    Notes
+    -----
+    A window takes the nearest points as long as their cumulative population
+    does not pass pop, and at least the nearest point. Equidistant points are
+    taken in the order of their ids. Instead of sorting every point for every
+    grid point, only the k nearest points are searched for chunks of grid
+    points, so that memory is bounded by BLOCK_ELEMENTS.
+    """
+    n, g = len(e), len(grid)
+    e = np.asarray(e, dtype=float)
+    b = np.asarray(b, dtype=float)
+    if k is None:
+        # twice the number of points expected to hold pop
+        k = 2 * int(np.ceil(pop / max(b.mean(), np.finfo(float).tiny))) + 1
+    k = int(min(max(k, 1), n))
+    r = np.empty(g)
+    todo = np.arange(g)
+    if n_jobs == -1:
+        n_jobs = mp.cpu_count()
+    pool = ThreadPool(n_jobs) if n_jobs > 1 else None
+    try:
+        while todo.size:
+            size = block_size(k, todo.size)
+            chunks = [todo[start:start + size]
+                      for start in range(0, todo.size, size)]
+            task = lambda ids: _window_rates(tree, grid[ids], e, b, pop, k)
+            if pool is not None and len(chunks) > 1:
+                results = pool.map(task, chunks)
+            else:
+                results = [task(ids) for ids in chunks]
+            left = []
+            for ids, (rates, done) in zip(chunks, results):
+                r[ids[done]] = rates[done]
+                left.append(ids[~done])
+            todo = np.concatenate(left)
+            k = min(2 * k, n)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return r
+
+
+def _window_rates(tree, points, e, b, pop, k):
+    """rates within the k nearest points and whether each window is complete"""
+    n, rows = len(e), np.arange(len(points))
+    d, nn = tree.query(points, k=k)
+    d, nn = d.reshape(len(points), -1), nn.reshape(len(points), -1)
+    # equidistant points are taken in the order of their ids
+    ties = (d[:, 1:] == d[:, :-1]).any(axis=1)
+    if ties.any():
+        order = np.lexsort((nn[ties], d[ties]), axis=1)
+        tied = rows[ties][:, None]
+        d[ties], nn[ties] = d[tied, order], nn[tied, order]
+    e_n, b_n = e[nn].cumsum(axis=1), b[nn].cumsum(axis=1)
+    inside = b_n <= pop
+    # the last point inside the window, or the nearest one if none is
+    last = np.where(inside.any(axis=1),
+                    k - 1 - inside[:, ::-1].argmax(axis=1), 0)
+    # a window is complete once a point passes pop and no point beyond the
+    # k nearest is as close as that one
+    first = (~inside).argmax(axis=1)
+    done = (~inside[:, -1]) & (d[rows, first] < d[:, -1]) | (k == n)
+    return e_n[rows, last] / b_n[rows, last], done
+
+
 import warnings
 class Headbanging_Triples(object):
     """Generate a pseudo spatial weights instance that contains headbanging triples
@@ -46,23 +46,33 @@ class G_Local_Tester(unittest.TestCase):
     def test_G_Local_Binary(self):
         lg = getisord.G_Local(self.y, self.w, transform='B')
         self.assertAlmostEquals(lg.Zs[0], -1.0136729, places=7)
-        self.assertAlmostEquals(lg.p_sim[0], 0.10100000000000001, places=7)
+        self.assertAlmostEquals(lg.p_sim[0], 0.112, places=7)
 
     def test_G_Local_Row_Standardized(self):
         lg = getisord.G_Local(self.y, self.w, transform='R')
         self.assertAlmostEquals(lg.Zs[0], -0.62074534, places=7)
-        self.assertAlmostEquals(lg.p_sim[0], 0.10100000000000001, places=7)
+        self.assertAlmostEquals(lg.p_sim[0], 0.112, places=7)
 
     def test_G_star_Local_Binary(self):
         lg = getisord.G_Local(self.y, self.w, transform='B', star=True)
         self.assertAlmostEquals(lg.Zs[0], -1.39727626, places=8)
-        self.assertAlmostEquals(lg.p_sim[0], 0.10100000000000001, places=7)
+        self.assertAlmostEquals(lg.p_sim[0], 0.112, places=7)
 
     def test_G_star_Row_Standardized(self):
         lg = getisord.G_Local(self.y, self.w, transform='R', star=True)
         self.assertAlmostEquals(lg.Zs[0], -0.62488094, places=8)
-        self.assertAlmostEquals(lg.p_sim[0], 0.10100000000000001, places=7)
+        self.assertAlmostEquals(lg.p_sim[0], 0.112, places=7)
     
+    def test_G_Local_keep_simulations(self):
+        lg = getisord.G_Local(self.y, self.w, transform='R', seed=10)
+        lg_low = getisord.G_Local(self.y, self.w, transform='R', seed=10,
+                                  keep_simulations=False)
+        self.assertTrue(lg_low.sim is None)
+        np.testing.assert_allclose(lg_low.p_sim, lg.p_sim)
+        np.testing.assert_allclose(lg_low.EG_sim, lg.EG_sim)
+        np.testing.assert_allclose(lg_low.seG_sim, lg.seG_sim)
+        np.testing.assert_allclose(lg_low.z_sim, lg.z_sim)
+
     @unittest.skipIf(PANDAS_EXTINCT, 'missing pandas')
     def test_by_col(self):
         import pandas as pd
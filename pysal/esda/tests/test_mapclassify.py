@@ -343,6 +343,29 @@ class TestFisherJenks(unittest.TestCase):
         np.testing.assert_array_almost_equal(fj.counts, np.array([49, 3, 4,
                                                                   1, 1]))
 
+    def test_fisher_jenks_means(self):
+        from itertools import combinations
+        from pysal.esda.mapclassify import _fisher_jenks_means
+        np.random.seed(10)
+        y = np.random.choice(np.round(np.random.lognormal(size=12), 2), 16)
+        uv = np.unique(y)
+        for k in (2, 3, 4):
+            # exhaustive search over the breaks between unique values
+            best = np.inf
+            for breaks in combinations(uv[:-1], k - 1):
+                yb = np.searchsorted(breaks, y)
+                ssd = sum(((y[yb == c] - y[yb == c].mean()) ** 2).sum()
+                          for c in range(k))
+                if ssd < best - 1e-9:
+                    best, known = ssd, breaks
+            kclass = _fisher_jenks_means(y, classes=k)
+            self.assertEqual(kclass[0], y.min())
+            self.assertEqual(kclass[-1], y.max())
+            np.testing.assert_array_equal(kclass[1:-1], known)
+            np.testing.assert_array_equal(
+                _fisher_jenks_means(np.sort(y), classes=k, sort=False),
+                kclass)
+
 
 class TestJenksCaspall(unittest.TestCase):
     def setUp(self):
@@ -83,6 +83,21 @@ class Moran_BV_matrix_Tester(unittest.TestCase):
         self.assertAlmostEquals(res[(0, 1)].I, 0.19362610652874668)
         self.assertAlmostEquals(res[(3, 0)].I, 0.37701382542927858)
 
+    def test_Moran_BV_matrix_permutations(self):
+        np.random.seed(12345)
+        res = moran.Moran_BV_matrix(self.vars, self.w, permutations=99)
+        self.assertEqual(len(res), 12)
+        # every pair shares the same permutations of the rows
+        for i, j in [(0, 1), (3, 0), (2, 1)]:
+            np.random.seed(12345)
+            mbv = moran.Moran_BV(self.vars[i], self.vars[j], self.w,
+                                 permutations=99)
+            np.testing.assert_allclose(res[(i, j)].I, mbv.I)
+            np.testing.assert_allclose(res[(i, j)].sim, mbv.sim)
+            np.testing.assert_allclose(res[(i, j)].p_sim, mbv.p_sim)
+            np.testing.assert_allclose(res[(i, j)].z_sim, mbv.z_sim)
+            np.testing.assert_allclose(res[(i, j)].p_z_sim, mbv.p_z_sim)
+
 class Moran_Local_Tester(unittest.TestCase):
     def setUp(self):
         np.random.seed(10)
@@ -93,8 +108,18 @@ class Moran_Local_Tester(unittest.TestCase):
     def test_Moran_Local(self):
         lm = moran.Moran_Local(
             self.y, self.w, transformation="r", permutations=99)
-        self.assertAlmostEquals(lm.z_sim[0], -0.68493799168603808)
-        self.assertAlmostEquals(lm.p_z_sim[0],  0.24669152541631179)
+        self.assertAlmostEquals(lm.z_sim[0], -0.6658680419241444)
+        self.assertAlmostEquals(lm.p_z_sim[0],  0.25274772452781047)
+
+    def test_Moran_Local_keep_simulations(self):
+        lm = moran.Moran_Local(self.y, self.w, permutations=99, seed=10)
+        lm_low = moran.Moran_Local(self.y, self.w, permutations=99, seed=10,
+                                   keep_simulations=False)
+        self.assertTrue(lm_low.sim is None and lm_low.rlisas is None)
+        np.testing.assert_allclose(lm_low.p_sim, lm.p_sim)
+        np.testing.assert_allclose(lm_low.EI_sim, lm.EI_sim)
+        np.testing.assert_allclose(lm_low.seI_sim, lm.seI_sim)
+        np.testing.assert_allclose(lm_low.z_sim, lm.z_sim)
 
     @unittest.skipIf(PANDAS_EXTINCT, 'missing pandas')
     def test_by_col(self):
@@ -102,8 +127,8 @@ class Moran_Local_Tester(unittest.TestCase):
         df = pd.DataFrame(self.y, columns =['z'])
         lm = moran.Moran_Local.by_col(df, ['z'], w=self.w, transformation='r',
                 permutations=99, outvals=['z_sim', 'p_z_sim'])
-        self.assertAlmostEquals(lm.z_z_sim[0], -0.68493799168603808)
-        self.assertAlmostEquals(lm.z_p_z_sim[0],  0.24669152541631179)
+        self.assertAlmostEquals(lm.z_z_sim[0], -0.6658680419241444)
+        self.assertAlmostEquals(lm.z_p_z_sim[0],  0.25274772452781047)
 
 
 class Moran_Local_BV_Tester(unittest.TestCase):
@@ -118,8 +143,17 @@ class Moran_Local_BV_Tester(unittest.TestCase):
         lm = moran.Moran_Local_BV(self.x, self.y, self.w,
                                   transformation="r", permutations=99)
         self.assertAlmostEquals(lm.Is[0], 1.4649221250620736)
-        self.assertAlmostEquals(lm.z_sim[0],  1.5816540860500772)
-        self.assertAlmostEquals(lm.p_z_sim[0], 0.056864279811026153)
+        self.assertAlmostEquals(lm.z_sim[0],  1.6061931297320335)
+        self.assertAlmostEquals(lm.p_z_sim[0], 0.05411574120735041)
+
+    def test_Moran_Local_BV_keep_simulations(self):
+        lm = moran.Moran_Local_BV(self.x, self.y, self.w, permutations=99,
+                                  seed=10)
+        lm_low = moran.Moran_Local_BV(self.x, self.y, self.w, permutations=99,
+                                      seed=10, keep_simulations=False)
+        self.assertTrue(lm_low.sim is None)
+        np.testing.assert_allclose(lm_low.p_sim, lm.p_sim)
+        np.testing.assert_allclose(lm_low.z_sim, lm.z_sim)
 
     @unittest.skipIf(PANDAS_EXTINCT, 'missing pandas')
     def test_by_col(self):
@@ -133,8 +167,8 @@ class Moran_Local_BV_Tester(unittest.TestCase):
         bvz = df['SIDR79-SIDR74_z_sim'].values
         bvzp = df['SIDR79-SIDR74_p_z_sim'].values
         self.assertAlmostEquals(bvstats[0], 1.4649221250620736)
-        self.assertAlmostEquals(bvz[0],  1.657427, 5)
-        self.assertAlmostEquals(bvzp[0], 0.048717, 5)
+        self.assertAlmostEquals(bvz[0],  1.598761, 5)
+        self.assertAlmostEquals(bvzp[0], 0.054937, 5)
 
 
 class Moran_Local_Rate_Tester(unittest.TestCase):
@@ -148,8 +182,8 @@ class Moran_Local_Rate_Tester(unittest.TestCase):
     def test_moran_rate(self):
         lm = moran.Moran_Local_Rate(self.e, self.b, self.w,
                                     transformation="r", permutations=99)
-        self.assertAlmostEquals(lm.z_sim[0], -0.13699844503985936, 7)
-        self.assertAlmostEquals(lm.p_z_sim[0], 0.44551601210081715)
+        self.assertAlmostEquals(lm.z_sim[0], -0.18152904483798152, 7)
+        self.assertAlmostEquals(lm.p_z_sim[0], 0.42797616868304)
 
     @unittest.skipIf(PANDAS_EXTINCT, 'missing pandas')
     def test_by_col(self):
@@ -158,8 +192,8 @@ class Moran_Local_Rate_Tester(unittest.TestCase):
         lm = moran.Moran_Local_Rate.by_col(df, ['SID79'], ['BIR79'], w=self.w,
                                            outvals=['p_z_sim', 'z_sim'],
                                            transformation='r', permutations=99)
-        self.assertAlmostEquals(lm['SID79-BIR79_z_sim'][0],  -0.13699844503985936, 7)
-        self.assertAlmostEquals(lm['SID79-BIR79_p_z_sim'][0], 0.44551601210081715)
+        self.assertAlmostEquals(lm['SID79-BIR79_z_sim'][0],  -0.18152904483798152, 7)
+        self.assertAlmostEquals(lm['SID79-BIR79_p_z_sim'][0], 0.42797616868304)
 
 
 
@@ -0,0 +1,93 @@
+import unittest
+import pysal
+from .. import permutation
+import numpy as np
+
+
+class Permutation_Tester(unittest.TestCase):
+    def setUp(self):
+        self.w = pysal.open(pysal.examples.get_path("stl.gal")).read()
+        f = pysal.open(pysal.examples.get_path("stl_hom.txt"))
+        self.y = np.array(f.by_col['HR8893'])
+        self.full = self.w.full()[0]
+
+    def test_block_size(self):
+        self.assertEqual(permutation.block_size(78, 999), 999)
+        self.assertEqual(permutation.block_size(78, 999, max_elements=780),
+                         10)
+        self.assertEqual(permutation.block_size(10 ** 6, 99, max_elements=10),
+                         1)
+
+    def test_permutation_blocks(self):
+        np.random.seed(10)
+        blocks = list(permutation.permutation_blocks(78, 25, size=10))
+        self.assertEqual([start for start, ids in blocks], [0, 10, 20])
+        ids = np.vstack([ids for start, ids in blocks])
+        np.random.seed(10)
+        loop = np.array([np.random.permutation(78) for i in range(25)])
+        np.testing.assert_array_equal(ids, loop)
+
+    def test_simulate(self):
+        sparse = self.w.sparse
+        np.random.seed(12345)
+        sim = permutation.simulate(self.y, 99,
+                                   lambda Y: permutation.quadratic_form(
+                                       sparse, Y), size=7)
+        np.random.seed(12345)
+        loop = []
+        for i in range(99):
+            z = np.random.permutation(self.y)
+            loop.append(np.dot(z, self.full.dot(z)))
+        np.testing.assert_allclose(sim, loop)
+
+    def test_kernels(self):
+        Y = np.column_stack((self.y, self.y[::-1]))
+        d = self.y[:, None] - self.y[None, :]
+        qf = permutation.quadratic_form(self.w.sparse, Y)
+        np.testing.assert_allclose(qf[0], self.y.dot(self.full.dot(self.y)))
+        sd = permutation.squared_difference(self.w.sparse, Y)
+        np.testing.assert_allclose(sd[0], (self.full * d ** 2).sum())
+        ad = permutation.absolute_difference(self.w.sparse, Y)
+        np.testing.assert_allclose(ad[0], (self.full * np.abs(d)).sum())
+
+    def test_crand(self):
+        self.w.transform = 'r'
+        z = self.y - self.y.mean()
+        scale = np.ones(self.w.n)
+        # small blocks so the sites are split over several chunks
+        block_elements = permutation.BLOCK_ELEMENTS
+        permutation.BLOCK_ELEMENTS = 99 * self.w.max_neighbors * 10
+        try:
+            r1 = permutation.crand(z, self.w.sparse, 99, scale, seed=10)
+            r2 = permutation.crand(z, self.w.sparse, 99, scale, n_jobs=2,
+                                   seed=10)
+        finally:
+            permutation.BLOCK_ELEMENTS = block_elements
+        self.assertEqual(r1.shape, (self.w.n, 99))
+        np.testing.assert_array_equal(r1, r2)
+        np.random.seed(10)
+        r3 = permutation.crand(z, self.w.sparse, 99, scale)
+        np.random.seed(10)
+        r4 = permutation.crand(z, self.w.sparse, 99, scale)
+        np.testing.assert_array_equal(r3, r4)
+        # offsets shift every draw of a site
+        offset = np.arange(self.w.n, dtype=float)
+        r5 = permutation.crand(z, self.w.sparse, 99, scale, offset, seed=10)
+        r6 = permutation.crand(z, self.w.sparse, 99, scale, seed=10)
+        np.testing.assert_allclose(r5 - offset[:, None], r6)
+
+    def test_sample_without_replacement(self):
+        rng = np.random.RandomState(10)
+        for k in (1, 4, 12, 60):
+            ids = permutation._sample_without_replacement(rng, 77, (5, 50), k)
+            self.assertEqual(ids.shape, (5, 50, k))
+            self.assertTrue(ids.min() >= 0 and ids.max() < 77)
+            srt = np.sort(ids, -1)
+            self.assertFalse((srt[..., 1:] == srt[..., :-1]).any())
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(Permutation_Tester)
+
+if __name__ == '__main__':
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
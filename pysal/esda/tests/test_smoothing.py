@@ -32,6 +32,27 @@ class TestWMean(unittest.TestCase):
         self.assertEquals(out1, 4)
         self.assertEquals(out2, 3.5)
 
+    def test_grouped_median(self):
+        indptr = np.array([0, 5, 10, 10, 12])
+        indices = np.array([0, 1, 2, 3, 4, 0, 1, 2, 3, 4, 1, 4])
+        d = self.d.astype(float)
+        out = sm.grouped_median(d, indptr, indices)
+        np.testing.assert_allclose(out, [3, 3, np.nan, 3])
+        aw = np.hstack((self.w1, self.w2, [1, 1]))
+        out = sm.grouped_median(d[indices], indptr, aw=aw)
+        np.testing.assert_allclose(out, [4, 3.5, np.nan, 3])
+        rng = np.random.RandomState(10)
+        lens = rng.randint(1, 8, 50)
+        indptr = np.hstack(([0], lens.cumsum()))
+        d = rng.randint(0, 5, indptr[-1]).astype(float)
+        aw = rng.randint(1, 4, indptr[-1])
+        groups = [slice(indptr[i], indptr[i + 1]) for i in range(50)]
+        np.testing.assert_array_equal(sm.grouped_median(d, indptr),
+                                      [np.median(d[g]) for g in groups])
+        np.testing.assert_array_equal(
+            sm.grouped_median(d, indptr, aw=aw),
+            [sm.weighted_median(d[g], aw[g]) for g in groups])
+
 
 class TestAgeStd(unittest.TestCase):
     def setUp(self):
@@ -169,6 +190,28 @@ class TestSRate(unittest.TestCase):
         self.assertIsInstance(r, np.ndarray)
         np.testing.assert_allclose(r[:5], self.sr, rtol=RTOL, atol=ATOL)
 
+    def test_multi_column(self):
+        e = np.column_stack((self.stl_e, 2 * self.stl_e, self.stl_e))
+        b = np.column_stack((self.stl_b, self.stl_b, 3 * self.stl_b))
+        for smoother in [sm.Spatial_Empirical_Bayes, sm.Spatial_Rate,
+                         sm.Disk_Smoother]:
+            r = smoother(e, b, self.stl_w).r
+            self.assertEqual(r.shape, (78, 3))
+            for j in range(3):
+                single = smoother(e[:, j], b[:, j], self.stl_w).r
+                np.testing.assert_allclose(r[:, j:j + 1], single, rtol=RTOL)
+
+    @unittest.skipIf(PANDAS_EXTINCT, 'missing pandas')
+    def test_multi_column_tabular(self):
+        enames = ['SID74', 'SID79', 'NWBIR74']
+        bnames = ['BIR74', 'BIR79', 'BIR74']
+        out = sm.Spatial_Rate.by_col(self.df, enames, bnames, w=self.w)
+        for ename, bname in zip(enames, bnames):
+            outcol = '{}-{}_spatial_rate'.format(ename, bname)
+            single = sm.Spatial_Rate(self.df[ename], self.df[bname], self.w).r
+            np.testing.assert_allclose(out[outcol].values, single.flatten(),
+                                       rtol=RTOL)
+
     def test_Spatial_Median_Rate(self):
         out_smr = sm.Spatial_Median_Rate(self.e, self.b, self.w).r
         out_smr_w = sm.Spatial_Median_Rate(self.e, self.b, self.w, aw=self.b).r
@@ -399,6 +442,18 @@ class TestKernel_AgeAdj_SM(unittest.TestCase):
     def test_Age_Adjusted_Smoother(self):
         ar = sm.Age_Adjusted_Smoother(self.e1, self.b1, self.kw, self.s)
         np.testing.assert_allclose(ar.r, self.ageadj_exp)
+        e = np.column_stack((self.e1, self.e1[::-1]))
+        b = np.column_stack((self.b1, self.b1[::-1]))
+        ar = sm.Age_Adjusted_Smoother(e, b, self.kw, self.s)
+        self.assertEqual(ar.r.shape, (6, 2))
+        np.testing.assert_allclose(ar.r[:, 0], self.ageadj_exp)
+        single = sm.Age_Adjusted_Smoother(self.e1[::-1], self.b1[::-1],
+                                          self.kw, self.s)
+        np.testing.assert_allclose(ar.r[:, 1], single.r)
+        kr = sm.Kernel_Smoother(e[:6], b[:6], self.kw)
+        np.testing.assert_allclose(kr.r[:, 0],
+                                   sm.Kernel_Smoother(e[:6, 0], b[:6, 0],
+                                                      self.kw).r.flatten())
 
     @unittest.skipIf(PANDAS_EXTINCT, 'missing pandas')
     def test_Age_Adjusted_Smoother_tabular(self):
@@ -435,6 +490,26 @@ class TestKernel_AgeAdj_SM(unittest.TestCase):
         bbox = [[0, 0], [45, 45]]
         sf = sm.Spatial_Filtering(bbox, points, self.e, self.b, 2, 2, r=30)
         np.testing.assert_allclose(sf.r, self.sf_exp, rtol=RTOL, atol=ATOL)
+        self.assertEqual(sf.raster.shape, (2, 2))
+
+    def test_Spatial_Filtering_pop(self):
+        points = np.array(self.points)
+        bbox = [[0, 0], [45, 45]]
+        tree = pysal.common.KDTree(points)
+        sf = sm.Spatial_Filtering(bbox, points, self.e, self.b, 4, 3, pop=100)
+        self.assertEqual(sf.raster.shape, (4, 3))
+        # windows taking every point sorted by distance and id
+        exp = []
+        for d, i in zip(*tree.query(sf.grid, k=len(self.e))):
+            i = i[np.lexsort((i, d))]
+            e_n, b_n = self.e[i].cumsum(), self.b[i].cumsum()
+            last = max((b_n <= 100).sum(), 1) - 1
+            exp.append(e_n[last] * 1.0 / b_n[last])
+        np.testing.assert_allclose(sf.r, exp, rtol=RTOL, atol=ATOL)
+        # windows grown from the nearest point, across threads
+        r = sm._adaptive_rates(tree, np.array(sf.grid), self.e, self.b, 100,
+                               k=1, n_jobs=2)
+        np.testing.assert_allclose(r, exp, rtol=RTOL, atol=ATOL)
 
     @unittest.skipIf(PANDAS_EXTINCT, 'missing pandas')
     def test_Kernel_Smoother_tabular(self):
@@ -3,8 +3,10 @@ import math
 import os
 import cPickle
 import copy
+import json
 
 import numpy as np
+from scipy import sparse
 import pysal as ps
 from pysal.weights.util import get_ids
 
@@ -335,6 +337,10 @@ class Network:
         """
         Create distance based weights
 
+        If the node distance matrix has not been computed, the shortest
+        path search from each node stops at the threshold, and the (n, n)
+        matrix is not built.
+
         Parameters
         ----------
         threshold:      float
@@ -345,12 +351,13 @@ class Network:
                         Default is 1 core. Use (int) to specify an exact number or cores.
                         Use ("all") to request all available cores.
         """
-        try:
-            hasattr(self.alldistances)
-        except:
-            self.node_distance_matrix(n_proccess)
-
-        neighbor_query = np.where(self.distancematrix < threshold)
+        if hasattr(self, 'distancematrix'):
+            neighbor_query = np.where(self.distancematrix < threshold)
+        else:
+            # Only search each node up to the threshold.
+            graph, lists = util._network_graph(self, self.edge_lengths)
+            neighbor_query = util.distance_band(graph, threshold,
+                                                n_processes=n_proccess)
         neighbors = defaultdict(list)
         for i, n in enumerate(neighbor_query[0]):
             neigh = neighbor_query[1][i]
@@ -444,31 +451,25 @@ class Network:
         dist_to_node = {}
 
         pointpattern.snapped_coordinates = {}
-        segments = []
-        s2e = {}
-        for edge in self.edges:
-            head = self.node_coords[edge[0]]
-            tail = self.node_coords[edge[1]]
-            segments.append(ps.cg.Chain([head,tail]))
-            s2e[(head,tail)] = edge
-            
+        edges = list(self.edges)
+        heads = np.array([self.node_coords[edge[0]] for edge in edges])
+        tails = np.array([self.node_coords[edge[1]] for edge in edges])
 
-        points = {}
-        p2id = {}
-        for pointIdx, point in pointpattern.points.iteritems(): 
-            points[pointIdx] = point['coordinates']
+        ids = list(pointpattern.points.keys())
+        points = np.array([pointpattern.points[pointIdx]['coordinates']
+                           for pointIdx in ids])
 
-        snapped = util.snapPointsOnSegments(points, segments)
+        segment, d1, snapped = util.snap_points(points, heads, tails)
+        d2 = np.sqrt(np.square(snapped - tails[segment]).sum(axis=1))
 
-        for pointIdx, snapInfo in snapped.iteritems():
-            x,y = snapInfo[1].tolist()
-            edge = s2e[tuple(snapInfo[0])]
+        for i, pointIdx in enumerate(ids):
+            x,y = snapped[i].tolist()
+            edge = edges[segment[i]]
             if edge not in obs_to_edge:
                 obs_to_edge[edge] = {}
             obs_to_edge[edge][pointIdx] = (x,y)
             pointpattern.snapped_coordinates[pointIdx] = (x,y)
-            d1,d2 = self.compute_distance_to_nodes(x, y, edge)
-            dist_to_node[pointIdx] = {edge[0]:d1, edge[1]:d2}
+            dist_to_node[pointIdx] = {edge[0]:d1[i], edge[1]:d2[i]}
 
         obs_to_node = defaultdict(list)
         for k, v in obs_to_edge.iteritems():
@@ -632,44 +633,46 @@ class Network:
             links.append(tuple(sorted([n, v0])))
         return links
 
-    def node_distance_matrix(self, n_processes):
+    def node_distance_matrix(self, n_processes=None, dtype=np.float64,
+                             filename=None):
         """
+        Compute the shortest path distances between all nodes.
+
         Called from: allneighbordistances()
                      nearestneighbordistances()
                      distancebandweights()
+
+        Parameters
+        ----------
+        n_processes:    int, str
+                        (Optional) Specify the number of cores to utilize.
+                        Default is 1 core. Use (int) to specify an exact number or cores.
+                        Use ("all") to request all available cores.
+
+        dtype:          numpy dtype
+                        np.float64 (default) or np.float32 for half the memory.
+
+        filename:       str
+                        (Optional) Keep the matrix in a numpy memmap in this
+                        file instead of in memory.
+
+        Notes
+        -----
+        The distances are stored in the (n, n) array `distancematrix`.
+        `alldistances` maps every node to its row of `distancematrix`, it
+        does not hold a copy of the distances.
         """
+        graph, lists = util._network_graph(self, self.edge_lengths)
+        self.distancematrix = util.distance_matrix(graph,
+                                                   n_processes=n_processes,
+                                                   dtype=dtype,
+                                                   filename=filename)
+        #tree = util.generatetree(pred)     <---- something to look at in the future
+        tree = None
         self.alldistances = {}
-        nnodes = len(self.node_list)
-        self.distancematrix = np.empty((nnodes, nnodes))
-        # Single-core processing
-        if not n_processes:
-            for node in self.node_list:
-                distance, pred = util.dijkstra(self, self.edge_lengths, node, n=float('inf'))
-                pred = np.array(pred)
-                #tree = util.generatetree(pred)     <---- something to look at in the future
-                tree = None
-                self.alldistances[node] = (distance, tree)
-                self.distancematrix[node] = distance
-        # Multiprocessing
-        if n_processes:
-            import multiprocessing as mp
-            from itertools import repeat
-            if n_processes == "all":
-                cores = mp.cpu_count()
-            else:
-                cores = n_processes
-            p = mp.Pool(processes=cores)
-            distance_pred = p.map(util.dijkstra_multi, zip(repeat(self), 
-                                                       repeat(self.edge_time), 
-                                                       self.node_list))
-            distance = [distance_pred[iteration][0] for iteration in range(len(distance_pred))]
-            pred = [distance_pred[iteration][1] for iteration in range(len(distance_pred))]
-            pred = np.array(pred)
-            #tree = util.generatetree(pred[node])
-            for node in self.node_list:
-                self.distancematrix[node] = distance[node]
-    
-    
+        for node in self.node_list:
+            self.alldistances[node] = (self.distancematrix[node], tree)
+
     def allneighbordistances(self, sourcepattern, destpattern=None, fill_diagonal=None,
                              n_processes=None):
         """
@@ -1113,7 +1116,7 @@ class Network:
 
         return sn
 
-    def savenetwork(self, filename):
+    def savenetwork(self, filename, columnar=False):
         """
         Save a network to disk as a binary file
 
@@ -1123,21 +1126,248 @@ class Network:
                     The filename where the network should be saved. This should be a full 
                     path or the file is saved whereever this method is called from.
 
+        columnar:   bool
+                    If True, filename is a directory where the nodes, edges,
+                    lengths, adjacency and distance matrix of the network are
+                    written as numpy .npy arrays, which loadnetwork can
+                    memory-map. Snapped point patterns are pickled next to
+                    the arrays.
+                    If False (default), the network is pickled.
+
         Example
         --------
         >>> ntw = ps.Network(ps.examples.get_path('streets.shp'))
         >>> ntw.savenetwork('mynetwork.pkl')
         """
+        if columnar:
+            _save_arrays(self, filename)
+            return
         with open(filename, 'wb') as networkout:
             cPickle.dump(self, networkout, protocol=2)
 
     @staticmethod
-    def loadnetwork(filename):
+    def loadnetwork(filename, mmap_mode=None):
+        """
+        Load a network saved with savenetwork.
+
+        Parameters
+        ----------
+        filename:   str
+                    The pickle file, or the directory of a network saved with
+                    columnar=True.
+
+        mmap_mode:  str
+                    (Optional) Memory-map the arrays of a columnar network
+                    with this numpy.load mode, e.g. 'r', so that processes
+                    loading the same directory share one copy on disk.
+
+        Returns
+        -------
+        ntw:        object
+                    PySAL Network Object.
+
+        Notes
+        -----
+        A columnar network keeps its arrays and builds the dict attributes,
+        such as edge_lengths or adjacencylist, the first time they are used.
+
+        Example
+        -------
+        >>> import tempfile, shutil
+        >>> ntw = ps.Network(ps.examples.get_path('streets.shp'))
+        >>> tmpdir = tempfile.mkdtemp()
+        >>> ntw.savenetwork(tmpdir, columnar=True)
+        >>> loaded = ps.Network.loadnetwork(tmpdir, mmap_mode='r')
+        >>> loaded.edges == ntw.edges
+        True
+        >>> shutil.rmtree(tmpdir)
+        """
+        if os.path.isdir(filename):
+            return _load_arrays(filename, mmap_mode=mmap_mode)
         with open(filename, 'rb') as networkin:
             self = cPickle.load(networkin)
 
         return self
 
+    def __getattr__(self, name):
+        # Attributes of a columnar network are built from its arrays when
+        # they are first used.
+        arrays = self.__dict__.get('_arrays')
+        if arrays is None or name not in _ARRAY_ATTRIBUTES:
+            raise AttributeError(name)
+        value = _ARRAY_ATTRIBUTES[name](self, arrays)
+        setattr(self, name, value)
+        return value
+
+
+def _edge_array(edges):
+    return np.array(list(edges), dtype=int).reshape(-1, 2)
+
+
+def _dict_arrays(d):
+    """
+    Key and value arrays of a dict with (node, node) keys.
+    """
+    keys = _edge_array(d.keys())
+    values = np.array(d.values())
+    return keys, values
+
+
+def _save_arrays(ntw, dirname):
+    """
+    Write the arrays of a network to the directory dirname, see
+    Network.savenetwork.
+    """
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    arrays = {}
+    ids = sorted(ntw.node_coords.keys())
+    arrays['node_ids'] = np.array(ids, dtype=int)
+    arrays['node_coords'] = np.array([ntw.node_coords[i] for i in ids],
+                                     dtype=float).reshape(-1, 2)
+    arrays['edges'] = _edge_array(ntw.edges)
+    arrays['length_edges'], arrays['lengths'] = _dict_arrays(ntw.edge_lengths)
+    adjacency = ntw.adjacencylist
+    keys = list(adjacency.keys())
+    arrays['adjacency_nodes'] = np.array(keys, dtype=int)
+    arrays['adjacency_indptr'] = np.cumsum([0] + [len(adjacency[k])
+                                                  for k in keys])
+    arrays['adjacency_indices'] = np.array([n for k in keys
+                                            for n in adjacency[k]], dtype=int)
+    graph = util.network_csr(ntw, ntw.edge_lengths)
+    arrays['graph_indptr'] = graph.indptr
+    arrays['graph_indices'] = graph.indices
+    arrays['graph_data'] = graph.data
+    if hasattr(ntw, 'graphedges'):
+        arrays['graphedges'] = _edge_array(ntw.graphedges)
+        arrays['graph_length_edges'], arrays['graph_lengths'] = \
+            _dict_arrays(ntw.graph_lengths)
+        arrays['graph_to_edges_keys'], arrays['graph_to_edges_values'] = \
+            _dict_arrays(ntw.graph_to_edges)
+    if hasattr(ntw, 'distancematrix'):
+        arrays['distancematrix'] = ntw.distancematrix
+    for name, array in arrays.iteritems():
+        np.save(os.path.join(dirname, name + '.npy'), array)
+    meta = {'arrays': sorted(arrays.keys()),
+            'in_shp': getattr(ntw, 'in_shp', None),
+            'node_sig': getattr(ntw, 'node_sig', None),
+            'unique_segs': getattr(ntw, 'unique_segs', None),
+            'edges_type': type(ntw.edges).__name__}
+    with open(os.path.join(dirname, 'meta.json'), 'w') as metaout:
+        json.dump(meta, metaout)
+    pointpatterns = getattr(ntw, 'pointpatterns', {})
+    if pointpatterns:
+        with open(os.path.join(dirname, 'pointpatterns.pkl'), 'wb') as ppout:
+            cPickle.dump(pointpatterns, ppout, protocol=2)
+
+
+def _load_arrays(dirname, mmap_mode=None):
+    """
+    Read a network written by _save_arrays, see Network.loadnetwork.
+    """
+    with open(os.path.join(dirname, 'meta.json')) as metain:
+        meta = json.load(metain)
+    arrays = dict((name, np.load(os.path.join(dirname, name + '.npy'),
+                                 mmap_mode=mmap_mode))
+                  for name in meta['arrays'])
+    ntw = Network()
+    for name in ['in_shp', 'node_sig', 'unique_segs']:
+        if meta[name] is not None:
+            setattr(ntw, name, meta[name])
+    ntw._arrays = arrays
+    ntw._dirname = dirname
+    ntw._edges_type = meta['edges_type']
+    if 'distancematrix' in arrays:
+        ntw.distancematrix = arrays['distancematrix']
+    return ntw
+
+
+def _edge_tuples(array):
+    return [tuple(edge) for edge in array.tolist()]
+
+
+def _array_dict(keys, values):
+    return dict(zip(_edge_tuples(keys), values.tolist()))
+
+
+def _require(arrays, name):
+    if name not in arrays:
+        raise AttributeError(name)
+    return arrays[name]
+
+
+def _load_node_coords(ntw, arrays):
+    return dict(zip(arrays['node_ids'].tolist(),
+                    [tuple(xy) for xy in arrays['node_coords'].tolist()]))
+
+
+def _load_edges(ntw, arrays):
+    edges = _edge_tuples(arrays['edges'])
+    return set(edges) if ntw._edges_type == 'set' else edges
+
+
+def _load_adjacencylist(ntw, arrays):
+    adjacency = defaultdict(list)
+    indptr = arrays['adjacency_indptr'].tolist()
+    indices = arrays['adjacency_indices'].tolist()
+    for i, node in enumerate(arrays['adjacency_nodes'].tolist()):
+        adjacency[node] = indices[indptr[i]:indptr[i + 1]]
+    return adjacency
+
+
+def _load_graph_cache(ntw, arrays):
+    # the adjacency util._network_graph would build for edge_lengths
+    graph = sparse.csr_matrix((arrays['graph_data'], arrays['graph_indices'],
+                               arrays['graph_indptr']),
+                              shape=(len(arrays['graph_indptr']) - 1,) * 2)
+    lists = (graph.indptr.tolist(), graph.indices.tolist(),
+             graph.data.tolist())
+    return (ntw.edge_lengths, len(ntw.edge_lengths), (graph, lists))
+
+
+def _load_edge_to_graph(ntw, arrays):
+    _require(arrays, 'graphedges')
+    return {}
+
+
+def _load_alldistances(ntw, arrays):
+    # rows of the distance matrix, as set by node_distance_matrix
+    distancematrix = _require(arrays, 'distancematrix')
+    return dict((node, (distancematrix[node], None))
+                for node in ntw.node_list)
+
+
+def _load_pointpatterns(ntw, arrays):
+    filename = os.path.join(ntw._dirname, 'pointpatterns.pkl')
+    if not os.path.exists(filename):
+        return {}
+    with open(filename, 'rb') as ppin:
+        return cPickle.load(ppin)
+
+
+# Builders of the attributes of a network loaded from arrays.
+_ARRAY_ATTRIBUTES = {
+    'node_coords': _load_node_coords,
+    'nodes': lambda ntw, arrays: dict((v, k) for k, v in
+                                      ntw.node_coords.iteritems()),
+    'node_list': lambda ntw, arrays: sorted(arrays['node_ids'].tolist()),
+    'edges': _load_edges,
+    'edge_lengths': lambda ntw, arrays: _array_dict(arrays['length_edges'],
+                                                    arrays['lengths']),
+    'adjacencylist': _load_adjacencylist,
+    'graphedges': lambda ntw, arrays: _edge_tuples(
+        _require(arrays, 'graphedges')),
+    'graph_lengths': lambda ntw, arrays: _array_dict(
+        _require(arrays, 'graph_length_edges'), arrays['graph_lengths']),
+    'graph_to_edges': lambda ntw, arrays: dict(zip(
+        _edge_tuples(_require(arrays, 'graph_to_edges_keys')),
+        _edge_tuples(arrays['graph_to_edges_values']))),
+    'edge_to_graph': _load_edge_to_graph,
+    'alldistances': _load_alldistances,
+    'pointpatterns': _load_pointpatterns,
+    '_graph_cache': _load_graph_cache,
+}
+
 
 class PointPattern():
     """
@@ -1,4 +1,7 @@
 from __future__ import division
+import os
+import shutil
+import tempfile
 import unittest
 
 import numpy as np
@@ -47,12 +50,39 @@ class TestNetwork(unittest.TestCase):
         self.assertEqual(w.histogram,
                          [(1, 22), (2, 58), (3, 63), (4, 40),
                           (5, 36), (6, 3), (7, 5), (8, 3)])
+        parallel = self.ntw.distancebandweights(threshold=500, n_proccess=2)
+        self.assertEqual(parallel.neighbors, w.neighbors)
+        self.ntw.node_distance_matrix()
+        full = self.ntw.distancebandweights(threshold=500)
+        self.assertEqual(full.neighbors, w.neighbors)
 
     def test_edge_segmentation(self):
         n200 = self.ntw.segment_edges(200.0)
         self.assertEqual(len(n200.edges), 688)
         n200 = None
 
+    def test_save_columnar(self):
+        self.ntw.node_distance_matrix()
+        tmpdir = tempfile.mkdtemp()
+        try:
+            self.ntw.savenetwork(tmpdir, columnar=True)
+            loaded = ps.Network.loadnetwork(tmpdir, mmap_mode='r')
+            self.assertIsInstance(loaded.distancematrix, np.memmap)
+            np.testing.assert_array_equal(loaded.distancematrix,
+                                          self.ntw.distancematrix)
+            for name in ['nodes', 'node_coords', 'node_list', 'edges',
+                         'edge_lengths', 'adjacencylist', 'graphedges',
+                         'graph_lengths', 'graph_to_edges', 'in_shp']:
+                self.assertEqual(getattr(loaded, name),
+                                 getattr(self.ntw, name))
+            self.assertEqual(sorted(loaded.alldistances.keys()),
+                             self.ntw.node_list)
+            distance, pred = util.dijkstra(loaded, loaded.edge_lengths, 0)
+            self.assertAlmostEqual(distance[196], 5505.668247, places=4)
+            del loaded
+        finally:
+            shutil.rmtree(tmpdir)
+
     def test_enum_links_node(self):
         coincident = self.ntw.enum_links_node(24)
         self.assertIn((24,48), coincident)
@@ -136,6 +166,76 @@ class TestNetworkUtils(unittest.TestCase):
         self.assertAlmostEqual(self.distance[196], 5505.668247, places=4)
         self.assertEqual(self.pred[196], 133)
         
+    def test_dijkstra_threshold(self):
+        distance, pred = util.dijkstra(self.ntw, self.ntw.edge_lengths, 0)
+        near, near_pred = util.dijkstra(self.ntw, self.ntw.edge_lengths, 0,
+                                        threshold=2000.)
+        distance, near = np.array(distance), np.array(near)
+        reached = distance <= 2000.
+        np.testing.assert_array_equal(np.isfinite(near), reached)
+        np.testing.assert_allclose(near[reached], distance[reached])
+        np.testing.assert_array_equal(near_pred[reached], pred[reached])
+        self.assertTrue((near_pred[~reached] == -1).all())
+
+    def test_dijkstra_n(self):
+        distance, pred = util.dijkstra(self.ntw, self.ntw.edge_lengths, 0)
+        distance = np.array(distance)
+        nearest, nearest_pred = util.dijkstra(self.ntw, self.ntw.edge_lengths,
+                                              0, n=5)
+        nearest = np.array(nearest)
+        self.assertEqual(np.isfinite(nearest).sum(), 6)
+        np.testing.assert_allclose(np.sort(nearest)[:6],
+                                   np.sort(distance)[:6])
+        targets = np.argsort(distance)[100:110]
+        nearest, nearest_pred = util.dijkstra(self.ntw, self.ntw.edge_lengths,
+                                              0, n=1, targets=targets)
+        self.assertEqual(np.nanmax(np.where(np.isfinite(nearest), nearest,
+                                            np.nan)),
+                         distance[targets[0]])
+
+    def test_distance_matrix(self):
+        graph = util.network_csr(self.ntw, self.ntw.edge_lengths)
+        serial = util.distance_matrix(graph)
+        distance, pred = util.dijkstra(self.ntw, self.ntw.edge_lengths, 0)
+        np.testing.assert_allclose(serial[0], distance)
+        parallel = util.distance_matrix(graph, n_processes=2)
+        np.testing.assert_array_equal(parallel, serial)
+        single = util.distance_matrix(graph, n_processes=2, dtype=np.float32)
+        self.assertEqual(single.dtype, np.float32)
+        np.testing.assert_allclose(single, serial, rtol=1e-6)
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'distances.dat')
+            ondisk = util.distance_matrix(graph, n_processes=2,
+                                          filename=filename)
+            np.testing.assert_array_equal(ondisk, serial)
+            del ondisk
+        finally:
+            shutil.rmtree(tmpdir)
+        limited = util.distance_matrix(graph, threshold=1000.)
+        np.testing.assert_array_equal(limited[serial <= 1000.],
+                                      serial[serial <= 1000.])
+        self.assertTrue(np.isinf(limited[serial > 1000.]).all())
+
+    def test_snap_points(self):
+        edges = list(self.ntw.edges)
+        heads = np.array([self.ntw.node_coords[e[0]] for e in edges])
+        tails = np.array([self.ntw.node_coords[e[1]] for e in edges])
+        rs = np.random.RandomState(10)
+        low, high = heads.min(axis=0), heads.max(axis=0)
+        points = rs.uniform(low, high, (200, 2))
+        segment, offset, snapped = util.snap_points(points, heads, tails, k=1)
+        for i, point in enumerate(points):
+            d2 = [util.squaredDistancePointSegment(point, (h, t))[0]
+                  for h, t in zip(heads, tails)]
+            self.assertAlmostEqual(d2[segment[i]], min(d2))
+            self.assertEqual(segment[i], np.argmin(d2))
+            pb = util.squaredDistancePointSegment(point, (heads[segment[i]],
+                                                          tails[segment[i]]))[1]
+            np.testing.assert_allclose(snapped[i], pb)
+            self.assertAlmostEqual(offset[i],
+                                   util.compute_length(pb, heads[segment[i]]))
+
     def test_dijkstra_mp(self):
         self.distance, self.pred = util.dijkstra_mp((self.ntw, self.ntw.edge_lengths, 0))
         self.assertAlmostEqual(self.distance[196], 5505.668247, places=4)
@@ -1,8 +1,12 @@
 #from collections import OrderedDict
 #import math
 #import operator
+from heapq import heappush, heappop
+import multiprocessing as mp
 import pysal as ps
 import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
 
 
 def compute_length(v0, v1):
@@ -56,7 +60,66 @@ def generatetree(pred):
     return tree
 
 
-def dijkstra(ntw, cost, node, n=float('inf')):
+def network_csr(ntw, cost):
+    """
+    Build the adjacency of the network nodes as a sparse matrix of edge costs.
+
+    Parameters
+    ----------
+    ntw:        object
+                PySAL network object
+
+    cost:       dict
+                key:    tuple
+                        (start node, end node)
+                value:  float
+                        Cost per edge to travel, e.g. distance
+
+    Returns
+    -------
+    graph:      scipy.sparse.csr_matrix
+                (n, n) symmetric matrix with the cost of every edge, where n
+                is the number of nodes. The neighbors of node i are
+                graph.indices[graph.indptr[i]:graph.indptr[i+1]].
+    """
+    edges = np.array(cost.keys(), dtype=int).reshape(-1, 2)
+    costs = np.array(cost.values(), dtype=float)
+    nnodes = len(ntw.node_list)
+    if len(edges):
+        nnodes = max(nnodes, edges.max() + 1)
+    rows = np.concatenate((edges[:, 0], edges[:, 1]))
+    cols = np.concatenate((edges[:, 1], edges[:, 0]))
+    costs = np.concatenate((costs, costs))
+    # Sort by row without summing repeated edges.
+    order = np.argsort(rows, kind='mergesort')
+    indptr = np.zeros(nnodes + 1, dtype=int)
+    indptr[1:] = np.cumsum(np.bincount(rows, minlength=nnodes))
+    return sparse.csr_matrix((costs[order], cols[order], indptr),
+                             shape=(nnodes, nnodes))
+
+
+def _network_graph(ntw, cost):
+    """
+    CSR adjacency of the network for a cost dict, built once per network and
+    cost dict.
+
+    Returns
+    -------
+    graph:      tuple
+                (csr_matrix, (indptr, indices, data)) with the arrays of the
+                matrix also stored as lists for the heap search.
+    """
+    cached = getattr(ntw, '_graph_cache', None)
+    if cached is None or cached[0] is not cost or cached[1] != len(cost):
+        csr = network_csr(ntw, cost)
+        lists = (csr.indptr.tolist(), csr.indices.tolist(), csr.data.tolist())
+        cached = (cost, len(cost), (csr, lists))
+        ntw._graph_cache = cached
+    return cached[2]
+
+
+def dijkstra(ntw, cost, node, n=float('inf'), threshold=float('inf'),
+             targets=None):
     """
     Compute the shortest path between a start node and all other nodes in the web.
     
@@ -76,41 +139,70 @@ def dijkstra(ntw, cost, node, n=float('inf')):
     
     n:          float('inf')
                 integer break point to stop iteration and return n neighbors
+                (the n nearest targets)
+
+    threshold:  float('inf')
+                Distance cutoff, the search stops at nodes farther than
+                threshold from the start node.
+
+    targets:    list
+                (Optional) Node IDs counted towards n. Default is all the
+                nodes.
     
     Returns
     -------
     distance:   list
-                List of distances from node to all other nodes.
+                List of distances from node to all other nodes. Nodes that
+                were not reached before the search stopped are float('inf').
                 
     pred:       list
                 List of preceeding nodes for traversal route.
     """
+    csr, (indptr, indices, data) = _network_graph(ntw, cost)
+    return _dijkstra(indptr, indices, data, node, n=n, threshold=threshold,
+                     targets=targets)
 
-    v0 = node
-    distance = [float('inf') for x in ntw.node_list]
-    idx = ntw.node_list.index(v0)
-    distance[ntw.node_list.index(v0)] = 0
-    pred = [-1 for x in ntw.node_list]
-    a = set()
-    a.add(v0)
-    while len(a) > 0:
-        # Get node with the lowest value from distance.
-        dist = float('inf')
-        for node in a:
-            if distance[node] < dist:
-                dist = distance[node]
-                v = node
-        # Remove that node from the set.
-        a.remove(v)
-        last = v
-        #4. Get the neighbors to the current node.
-        neighbors = get_neighbor_distances(ntw, v, cost)
-        for v1, indiv_cost in neighbors.iteritems():
-            if distance[v1] > distance[v] + indiv_cost:
-                distance[v1] = distance[v] + indiv_cost
-                pred[v1] = v
-                a.add(v1)
-    return distance, np.array(pred, dtype=np.int)
+
+def _dijkstra(indptr, indices, data, node, n=float('inf'),
+              threshold=float('inf'), targets=None):
+    """
+    Binary heap Dijkstra over the arrays of a CSR adjacency, see dijkstra.
+    """
+    inf = float('inf')
+    nnodes = len(indptr) - 1
+    distance = [inf] * nnodes
+    tentative = [inf] * nnodes
+    pred = [-1] * nnodes
+    is_target = None
+    if targets is not None:
+        is_target = [False] * nnodes
+        for t in targets:
+            is_target[t] = True
+    tentative[node] = 0.
+    heap = [(0., node)]
+    found = 0
+    while heap:
+        d, v = heappop(heap)
+        if distance[v] != inf:
+            # Stale entry for a node that is already settled.
+            continue
+        distance[v] = d
+        if v != node and (is_target is None or is_target[v]):
+            found += 1
+            if found >= n:
+                break
+        for k in xrange(indptr[v], indptr[v + 1]):
+            u = indices[k]
+            du = d + data[k]
+            if du < tentative[u] and du <= threshold:
+                tentative[u] = du
+                pred[u] = v
+                heappush(heap, (du, u))
+    pred = np.array(pred, dtype=np.int)
+    if heap:
+        # Nodes still on the heap have not been settled.
+        pred[np.isinf(distance)] = -1
+    return distance, pred
 
 
 def dijkstra_mp((ntw, cost, node)):
@@ -146,6 +238,199 @@ def dijkstra_mp((ntw, cost, node)):
     return dijkstra(ntw, cost, node)
        
     
+# Rows of the distance matrix computed in one step, bounded by the number of
+# matrix elements kept in memory at once.
+BLOCK_ELEMENTS = 2 ** 23
+
+# Worker state for distance_matrix, set once per process by _distance_init.
+_DISTANCE = {}
+
+
+def distance_matrix(graph, n_processes=None, dtype=np.float64, filename=None,
+                    threshold=float('inf')):
+    """
+    Compute the shortest path distances between all pairs of network nodes.
+
+    Parameters
+    ----------
+    graph:          scipy.sparse.csr_matrix
+                    (n, n) edge costs, see network_csr.
+
+    n_processes:    int, str
+                    (Optional) Specify the number of cores to utilize.
+                    Default is 1 core. Use (int) to specify an exact number or cores.
+                    Use ("all") to request all available cores.
+
+    dtype:          numpy dtype
+                    np.float64 (default) or np.float32 for half the memory.
+
+    filename:       str
+                    (Optional) Write the matrix to a numpy memmap in this file
+                    instead of keeping it in memory, for networks whose
+                    (n, n) matrix does not fit in RAM.
+
+    threshold:      float
+                    (Optional) Distances larger than threshold are not
+                    searched and are left as float('inf').
+
+    Returns
+    -------
+    distances:      array, memmap
+                    (n, n) shortest path distances, float('inf') between
+                    nodes that are not connected.
+
+    Notes
+    -----
+    Each worker receives the CSR arrays of the graph once when it starts and
+    writes its rows straight into the shared or memmapped output, so neither
+    the network nor the rows are sent between processes.
+    """
+    graph = sparse.csr_matrix(graph)
+    dtype = np.dtype(dtype)
+    if dtype == np.float64:
+        typecode = 'd'
+    elif dtype == np.float32:
+        typecode = 'f'
+    else:
+        raise ValueError('dtype must be np.float64 or np.float32')
+    nnodes = graph.shape[0]
+    if n_processes == 'all':
+        n_processes = mp.cpu_count()
+    n_processes = int(n_processes or 1)
+
+    if filename is not None:
+        out = np.memmap(filename, dtype=dtype, mode='w+',
+                        shape=(nnodes, nnodes))
+        target = ('memmap', filename)
+    elif n_processes > 1:
+        raw = mp.RawArray(typecode, nnodes * nnodes)
+        out = np.frombuffer(raw, dtype=dtype).reshape(nnodes, nnodes)
+        target = ('shared', raw)
+    else:
+        out = np.empty((nnodes, nnodes), dtype=dtype)
+        target = ('array', out)
+
+    size = max(1, min(BLOCK_ELEMENTS // max(nnodes, 1),
+                      -(-nnodes // (4 * n_processes))))
+    tasks = [(start, min(start + size, nnodes))
+             for start in range(0, nnodes, size)]
+    data = (graph.indptr, graph.indices, graph.data, nnodes, target, dtype,
+            threshold)
+    _map_rows(_distance_rows, tasks, data, n_processes)
+    if filename is not None:
+        out.flush()
+    return out
+
+
+def distance_band(graph, threshold, n_processes=None):
+    """
+    Find the pairs of network nodes closer than a threshold.
+
+    Parameters
+    ----------
+    graph:          scipy.sparse.csr_matrix
+                    (n, n) edge costs, see network_csr.
+
+    threshold:      float
+                    Pairs with a shortest path distance below threshold are
+                    returned; longer paths are not searched.
+
+    n_processes:    int, str
+                    (Optional) Specify the number of cores to utilize.
+                    Default is 1 core. Use (int) to specify an exact number or cores.
+                    Use ("all") to request all available cores.
+
+    Returns
+    -------
+    rows, cols:     arrays
+                    node indices of the pairs, including each node with
+                    itself.
+
+    Notes
+    -----
+    Rows of distances are computed in blocks as in distance_matrix, and only
+    the pairs within the threshold are kept, so the (n, n) matrix is never
+    held in memory.
+    """
+    graph = sparse.csr_matrix(graph)
+    nnodes = graph.shape[0]
+    if n_processes == 'all':
+        n_processes = mp.cpu_count()
+    n_processes = int(n_processes or 1)
+    size = max(1, min(BLOCK_ELEMENTS // max(nnodes, 1),
+                      -(-nnodes // (4 * n_processes))))
+    tasks = [(start, min(start + size, nnodes))
+             for start in range(0, nnodes, size)]
+    data = (graph.indptr, graph.indices, graph.data, nnodes, ('band', None),
+            np.float64, threshold)
+    pairs = _map_rows(_band_rows, tasks, data, n_processes)
+    if not pairs:
+        return np.array([], dtype=int), np.array([], dtype=int)
+    rows, cols = zip(*pairs)
+    return np.concatenate(rows), np.concatenate(cols)
+
+
+def _map_rows(func, tasks, data, n_processes):
+    """
+    Run func on the blocks of rows in tasks, with workers set up by
+    _distance_init.
+    """
+    if n_processes > 1 and len(tasks) > 1:
+        pool = mp.Pool(min(n_processes, len(tasks)), _distance_init, data)
+        try:
+            return pool.map(func, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    _distance_init(*data)
+    try:
+        return map(func, tasks)
+    finally:
+        _DISTANCE.clear()
+
+
+def _distance_init(indptr, indices, data, nnodes, target, dtype, threshold):
+    """
+    Set up a distance_matrix worker with the graph and the output.
+    """
+    kind, where = target
+    if kind == 'memmap':
+        out = np.memmap(where, dtype=dtype, mode='r+', shape=(nnodes, nnodes))
+    elif kind == 'shared':
+        out = np.frombuffer(where, dtype=dtype).reshape(nnodes, nnodes)
+    else:
+        out = where
+    _DISTANCE['graph'] = sparse.csr_matrix((data, indices, indptr),
+                                           shape=(nnodes, nnodes))
+    _DISTANCE['out'] = out
+    _DISTANCE['threshold'] = threshold
+
+
+def _distance_rows(task):
+    """
+    Fill the rows start:stop of the distance matrix.
+    """
+    start, stop = task
+    out = _DISTANCE['out']
+    out[start:stop] = csgraph.dijkstra(_DISTANCE['graph'],
+                                       indices=np.arange(start, stop),
+                                       limit=_DISTANCE['threshold'])
+    if isinstance(out, np.memmap):
+        out.flush()
+
+
+def _band_rows(task):
+    """
+    Pairs within the threshold for the rows start:stop.
+    """
+    start, stop = task
+    threshold = _DISTANCE['threshold']
+    block = csgraph.dijkstra(_DISTANCE['graph'],
+                             indices=np.arange(start, stop), limit=threshold)
+    rows, cols = np.nonzero(block < threshold)
+    return rows + start, cols
+
+
 def squaredDistancePointSegment(point, segment):
     """Find the squared distance between a point and a segment
     
@@ -207,61 +492,149 @@ def snapPointsOnSegments(points, segments):
                 value:  a 2-tuple: ((head, tail), point)
                         where (head, tail) is the target segment, and point is the snapped
                         location on the segment
+
+    Notes
+    -----
+    A wrapper around snap_points, which snaps all the points at once.
     """
-    
-    # Put segments in an Rtree.
-    rt = ps.cg.Rtree()
-    SMALL = 0.01
-    node2segs = {}
-    
-    for segment in segments:
-        head,tail = segment.vertices
-        x0,y0 = head
-        x1,y1 = tail
-        if (x0,y0) not in node2segs:
-            node2segs[(x0,y0)] = []
-        if (x1,y1) not in node2segs:
-            node2segs[(x1,y1)] = []
-        node2segs[(x0,y0)].append(segment)
-        node2segs[(x1,y1)].append(segment)
-        x0,y0,x1,y1 =  segment.bounding_box
-        x0 -= SMALL
-        y0 -= SMALL
-        x1 += SMALL
-        y1 += SMALL
-        r = ps.cg.Rect(x0,y0,x1,y1)
-        rt.insert(segment, r)
-         
-    # Build a KDtree on segment nodes.
-    kt = ps.cg.KDTree(node2segs.keys())
-    p2s = {}
-
-    for ptIdx, point in points.iteritems():
-        # First, find nearest neighbor segment node for the point.
-        dmin, node = kt.query(point, k=1)
-        node = tuple(kt.data[node])
-        closest = node2segs[node][0].vertices
-        
-        # Use this segment as the candidate closest segment:  closest
-        # Use the distance as the distance to beat:           dmin
-        p2s[ptIdx] = (closest, node) # sna
-        x0 = point[0] - dmin
-        y0 = point[1] - dmin
-        x1 = point[0] + dmin
-        y1 = point[1] + dmin
-        
-        # Find all segments with bounding boxes that intersect
-        # a query rectangle centered on the point with sides of length 2*dmin.
-        candidates = [ cand for cand in rt.intersection([x0,y0,x1,y1])]
-        dmin += SMALL
-        dmin2 = dmin * dmin
-        
-        # Of the candidate segments, find the nearest to the query point.
-        for candidate in candidates:
-            dnc, p2b = squaredDistancePointSegment(point, candidate.vertices)
-            if dnc <= dmin2:
-                closest = candidate.vertices
-                dmin2 = dnc
-                p2s[ptIdx] = (closest, p2b)
-        
-    return p2s
\ No newline at end of file
+    ids = list(points.keys())
+    coords = np.array([points[i] for i in ids], dtype=float).reshape(-1, 2)
+    vertices = [segment.vertices for segment in segments]
+    heads = np.array([v[0] for v in vertices], dtype=float).reshape(-1, 2)
+    tails = np.array([v[1] for v in vertices], dtype=float).reshape(-1, 2)
+    segment, offset, snapped = snap_points(coords, heads, tails)
+    return dict((i, (vertices[s], xy))
+                for i, s, xy in zip(ids, segment, snapped))
+
+
+def snap_points(points, heads, tails, k=8):
+    """
+    Snap points onto their nearest segment.
+
+    Parameters
+    ----------
+    points:     array
+                (n, 2) x, y coordinates of the points.
+
+    heads:      array
+                (m, 2) x, y coordinates of the first end of the segments.
+
+    tails:      array
+                (m, 2) x, y coordinates of the second end of the segments.
+
+    k:          int
+                Number of index entries searched first for each point,
+                doubled for the points whose nearest segment is not yet
+                certain.
+
+    Returns
+    -------
+    segment:    array
+                (n, ) position in heads and tails of the nearest segment.
+                Among equally near segments the first one is taken.
+
+    offset:     array
+                (n, ) distance along the segment from its head to the
+                snapped location.
+
+    snapped:    array
+                (n, 2) x, y coordinates of the snapped locations.
+
+    Notes
+    -----
+    The segments are packed into a KD-tree built once on the midpoints of
+    pieces no longer than the median segment length, so that a point is
+    never farther from a piece midpoint than its distance to the segment
+    plus half a piece. The points are searched in chunks of BLOCK_ELEMENTS
+    candidate pairs and all their projections are computed at once.
+
+    Examples
+    --------
+    >>> heads = np.array([[0., 0.], [0., 0.]])
+    >>> tails = np.array([[10., 0.], [0., 10.]])
+    >>> segment, offset, snapped = snap_points([[2., 1.], [-1., 7.]],
+    ...                                        heads, tails)
+    >>> segment
+    array([0, 1])
+    >>> offset
+    array([ 2.,  7.])
+    >>> snapped
+    array([[ 2.,  0.],
+           [ 0.,  7.]])
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    heads = np.asarray(heads, dtype=float).reshape(-1, 2)
+    tails = np.asarray(tails, dtype=float).reshape(-1, 2)
+    n = len(points)
+    owner, midpoints, half = _segment_pieces(heads, tails)
+    tree = ps.cg.KDTree(midpoints)
+    npieces = len(owner)
+    segment = np.empty(n, dtype=int)
+    todo = np.arange(n)
+    k = max(1, min(k, npieces))
+    while todo.size:
+        size = max(1, BLOCK_ELEMENTS // k)
+        left = []
+        for start in range(0, todo.size, size):
+            ids = todo[start:start + size]
+            d, idx = tree.query(points[ids], k=k)
+            d, idx = d.reshape(len(ids), -1), idx.reshape(len(ids), -1)
+            candidates = owner[idx]
+            d2 = _project(points[ids][:, None, :], heads[candidates],
+                          tails[candidates])[0]
+            d2min = d2.min(axis=1)
+            nearest = np.where(d2 == d2min[:, None], candidates,
+                               len(heads)).min(axis=1)
+            # a closer or equally close segment would have a piece whose
+            # midpoint is nearer than the farthest one searched
+            done = (d[:, -1] > np.sqrt(d2min) + half) | (k == npieces)
+            segment[ids[done]] = nearest[done]
+            left.append(ids[~done])
+        todo = np.concatenate(left)
+        k = min(2 * k, npieces)
+    snapped = _project(points, heads[segment], tails[segment])[1]
+    offset = np.sqrt(np.square(snapped - heads[segment]).sum(axis=1))
+    return segment, offset, snapped
+
+
+def _segment_pieces(heads, tails):
+    """
+    Split segments into pieces no longer than the median segment length.
+
+    Returns the segment owning each piece, the (p, 2) piece midpoints and an
+    upper bound on the distance between a piece midpoint and any location on
+    the piece.
+    """
+    lengths = np.sqrt(np.square(tails - heads).sum(axis=1))
+    limit = np.median(lengths) if len(lengths) else 0.
+    if limit > 0:
+        counts = np.maximum(np.ceil(lengths / limit), 1).astype(int)
+    else:
+        counts = np.ones(len(lengths), dtype=int)
+    owner = np.repeat(np.arange(len(heads)), counts)
+    first = np.cumsum(counts) - counts
+    position = np.arange(len(owner)) - np.repeat(first, counts)
+    t = (position + 0.5) / counts[owner]
+    midpoints = heads[owner] + t[:, None] * (tails - heads)[owner]
+    half = 0.5 * (lengths / counts).max() if len(lengths) else 0.
+    # guard the bound against rounding in the tree distances
+    return owner, midpoints, half * (1 + 1e-9) + np.finfo(float).eps
+
+
+def _project(points, heads, tails):
+    """
+    Squared distances from points to segments and the nearest locations on
+    the segments, for arrays of x, y pairs in the last dimension, following
+    squaredDistancePointSegment.
+    """
+    v = tails - heads
+    w = points - heads
+    c1 = (w * v).sum(axis=-1)
+    c2 = (v * v).sum(axis=-1)
+    before = c1 <= 0.
+    after = ~before & (c2 <= c1)
+    b = np.where(before | after, 0., c1 / np.where(c2 > 0., c2, 1.))
+    nearest = heads + b[..., None] * v
+    nearest = np.where(after[..., None], tails, nearest)
+    d = points - nearest
+    return (d * d).sum(axis=-1), nearest
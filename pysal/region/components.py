@@ -4,7 +4,7 @@ Checking for connected components in a graph.
 __author__ = "Sergio J. Rey <srey@asu.edu>"
 
 
-__all__ = ["check_contiguity"]
+__all__ = ["check_contiguity", "articulation_points", "Region_Contiguity"]
 
 from operator import lt
 
@@ -31,24 +31,19 @@ def is_component(w, ids):
 
     """
 
-    components = 0
-    marks = dict([(node, 0) for node in ids])
-    q = []
-    for node in ids:
-        if marks[node] == 0:
-            components += 1
-            q.append(node)
-            if components > 1:
-                return False
-        while q:
-            node = q.pop()
-            marks[node] = components
-            others = [neighbor for neighbor in w.neighbors[node]
-                      if neighbor in ids]
-            for other in others:
-                if marks[other] == 0 and other not in q:
-                    q.append(other)
-    return True
+    if not ids:
+        return True
+    members = set(ids)
+    start = ids[0]
+    marked = set([start])
+    q = [start]
+    while q:
+        node = q.pop()
+        for other in w.neighbors[node]:
+            if other in members and other not in marked:
+                marked.add(other)
+                q.append(other)
+    return len(marked) == len(members)
 
 
 def check_contiguity(w, neighbors, leaver):
@@ -104,6 +99,180 @@ def check_contiguity(w, neighbors, leaver):
     return is_component(w, ids)
 
 
+def articulation_points(w, ids):
+    """Find the areas whose removal splits the set of ids
+
+
+    Parameters
+    ----------
+
+    w           : spatial weights object
+                  simple contiguity based weights
+    ids         : list
+                  identifiers of units forming a single connected component
+
+
+    Returns
+    -------
+
+    points      : set
+                  ids whose removal leaves the remaining ids as more than one
+                  connected component
+
+    Notes
+    -----
+
+    A depth first search (Tarjan) over the contiguity graph of ids finds all
+    the points in one pass, whereas check_contiguity searches the set again
+    for each leaver. For a connected set of ids, check_contiguity(w, ids, i)
+    is True exactly when i is not an articulation point.
+
+    Example
+    -------
+
+    >>> import pysal
+    >>> w = pysal.lat2W(5, 5)
+    >>> sorted(pysal.region.articulation_points(w, [0, 1, 2, 3, 4]))
+    [1, 2, 3]
+    >>> sorted(pysal.region.articulation_points(w, [0, 1, 5, 6]))
+    []
+    """
+    return _articulation(w.neighbors, ids)[0]
+
+
+def _articulation(neighbors, ids):
+    """
+    Articulation points and (root, size) of each connected component of the
+    contiguity graph of ids.
+    """
+    members = set(ids)
+    disc = {}
+    low = {}
+    points = set()
+    components = []
+    counter = 0
+    for root in ids:
+        if root in disc:
+            continue
+        disc[root] = low[root] = counter
+        counter += 1
+        size = 1
+        children = 0
+        stack = [(root, None, iter(neighbors[root]))]
+        while stack:
+            node, parent, others = stack[-1]
+            for other in others:
+                if other not in members or other == node:
+                    continue
+                if other not in disc:
+                    disc[other] = low[other] = counter
+                    counter += 1
+                    size += 1
+                    stack.append((other, node, iter(neighbors[other])))
+                    break
+                elif other != parent:
+                    low[node] = min(low[node], disc[other])
+            else:
+                stack.pop()
+                if parent is not None:
+                    low[parent] = min(low[parent], low[node])
+                    if parent == root:
+                        children += 1
+                    elif low[node] >= disc[parent]:
+                        points.add(parent)
+        if children > 1:
+            points.add(root)
+        components.append((root, size))
+    return points, components
+
+
+class Region_Contiguity(object):
+    """Track which areas can leave their region without breaking it apart
+
+
+    Parameters
+    ----------
+
+    w           : spatial weights object
+                  simple (symmetric) contiguity based weights
+    regions     : list
+                  list of lists of ids, region r is regions[r]
+    area2region : dict
+                  (Optional) mapping of areas to region, built from regions
+                  if not given
+
+    Attributes
+    ----------
+
+    regions     : list
+                  the regions passed in, updated in place by move
+    area2region : dict
+                  mapping of areas to region, updated in place by move
+
+    Notes
+    -----
+
+    The articulation points of a region are found when it is first queried
+    after a change, so a region is searched once per move rather than once
+    per candidate leaver.
+
+    Example
+    -------
+
+    >>> import pysal
+    >>> w = pysal.lat2W(5, 5)
+    >>> regions = [[0, 1, 2, 3, 4], [5, 6, 7, 8, 9]]
+    >>> rc = pysal.region.Region_Contiguity(w, regions)
+    >>> rc.can_leave(4), rc.can_leave(3)
+    (True, False)
+    >>> rc.move(4, 1)
+    >>> regions
+    [[0, 1, 2, 3], [5, 6, 7, 8, 9, 4]]
+    >>> rc.can_leave(3), rc.can_leave(9), rc.can_leave(4)
+    (True, False, True)
+    """
+    def __init__(self, w, regions, area2region=None):
+        self.neighbors = w.neighbors
+        self.regions = regions
+        if area2region is None:
+            area2region = {}
+            for r, region in enumerate(regions):
+                for area in region:
+                    area2region[area] = r
+        self.area2region = area2region
+        self._blocked = {}
+
+    def can_leave(self, area):
+        """True if the rest of the region of area stays one component
+        without it"""
+        r = self.area2region[area]
+        if r not in self._blocked:
+            self._blocked[r] = self._find_blocked(self.regions[r])
+        return area not in self._blocked[r]
+
+    def move(self, area, recipient):
+        """Move area to region recipient"""
+        donor = self.area2region[area]
+        self.regions[donor].remove(area)
+        self.regions[recipient].append(area)
+        self.area2region[area] = recipient
+        self._blocked.pop(donor, None)
+        self._blocked.pop(recipient, None)
+
+    def _find_blocked(self, region):
+        points, components = _articulation(self.neighbors, region)
+        if len(components) == 1:
+            return points
+        # a region already in pieces stays so unless the leaver is the
+        # only area of one of two pieces
+        blocked = set(region)
+        if len(components) == 2:
+            for root, size in components:
+                if size == 1:
+                    blocked.discard(root)
+        return blocked
+
+
 class Graph(object):
     def __init__(self, undirected=True):
         self.nodes = set()
@@ -9,8 +9,10 @@ __author__ = "Serge Rey <srey@asu.edu>, David Folch <dfolch@fsu.edu>"
 
 
 import pysal
-from components import check_contiguity
+from components import Region_Contiguity
 import copy
+import multiprocessing as mp
+from collections import deque
 import numpy as np
 from pysal.region import randomregion as RR
 
@@ -19,6 +21,9 @@ __all__ = ["Maxp", "Maxp_LISA"]
 LARGE = 10 ** 6
 MAX_ATTEMPTS = 100
 
+# per process state of the workers building initial solutions
+_MAXP = {}
+
 
 class Maxp:
     """Try to find the maximum number of regions for a set of areas such that
@@ -50,6 +55,11 @@ class Maxp:
                       len(ids) is less than the number of observations, the
                       complementary ids are added to the end of seeds. Thus
                       the specified seeds get priority in the solution
+    n_jobs          : int
+                      number of processes building the initial solutions,
+                      -1 uses all available cores. Each process draws from
+                      its own random stream seeded from numpy.random, so the
+                      solution depends on n_jobs only through these seeds
 
     Attributes
     ----------
@@ -67,6 +77,21 @@ class Maxp:
     total_moves     : int
                       number of moves into internal regions
 
+    Notes
+    -----
+
+    Each region carries the number of its areas and the sums of z and of
+    floor_variable over them. Moving an area between two regions changes
+    the within sum of squares by
+
+    .. math::
+
+        \\frac{n_r}{n_r + 1} \\|z_i - \\bar{z}_r\\|^2 -
+        \\frac{n_d}{n_d - 1} \\|z_i - \\bar{z}_d\\|^2
+
+    where r is the receiving and d the donor region, so the swap phase
+    evaluates a move in O(m) and keeps the floor check to one subtraction.
+
     Examples
     --------
 
@@ -103,7 +128,7 @@ class Maxp:
 
     """
     def __init__(self, w, z, floor, floor_variable,
-                 verbose=False, initial=100, seeds=[]):
+                 verbose=False, initial=100, seeds=[], n_jobs=1):
 
         self.w = w
         self.z = z
@@ -111,6 +136,9 @@ class Maxp:
         self.floor_variable = floor_variable
         self.verbose = verbose
         self.seeds = seeds
+        self._index = dict((area, i) for i, area in enumerate(w.id_order))
+        self._z = np.asarray(z, dtype=float).reshape(w.n, -1)
+        self._fv = np.asarray(floor_variable).reshape(w.n)
         self.initial_solution()
         if not self.p:
             self.feasible = False
@@ -121,16 +149,16 @@ class Maxp:
             self.current_area2region = copy.copy(self.area2region)
             self.initial_wss = []
             self.attempts = 0
-            for i in range(initial):
-                self.initial_solution()
-                if self.p:
-                    val = self.objective_function()
+            for i, solution in enumerate(self._initial_solutions(initial,
+                                                                 n_jobs)):
+                regions, a2r, enclaves, val = solution
+                if regions:
                     self.initial_wss.append(val)
                     if self.verbose:
                         print 'initial solution: ', i, val, best_val
                     if val < best_val:
-                        self.current_regions = copy.copy(self.regions)
-                        self.current_area2region = copy.copy(self.area2region)
+                        self.current_regions = copy.copy(regions)
+                        self.current_area2region = copy.copy(a2r)
                         best_val = val
                     self.attempts += 1
             self.regions = copy.copy(self.current_regions)
@@ -143,98 +171,43 @@ class Maxp:
             self.swap()
 
     def initial_solution(self):
-        self.p = 0
-        solving = True
-        attempts = 0
-        while solving and attempts <= MAX_ATTEMPTS:
-            regions = []
-            enclaves = []
-            if not self.seeds:
-                candidates = copy.copy(self.w.id_order)
-                candidates = np.random.permutation(candidates)
-                candidates = candidates.tolist()
-            else:
-                seeds = copy.copy(self.seeds)
-                nonseeds = [i for i in self.w.id_order if i not in seeds]
-                candidates = seeds
-                candidates.extend(nonseeds)
-            while candidates:
-                seed = candidates.pop(0)
-                # try to grow it till threshold constraint is satisfied
-                region = [seed]
-                building_region = True
-                while building_region:
-                    # check if floor is satisfied
-                    if self.check_floor(region):
-                        regions.append(region)
-                        building_region = False
-                    else:
-                        potential = []
-                        for area in region:
-                            neighbors = self.w.neighbors[area]
-                            neighbors = [neigh for neigh in neighbors if neigh in candidates]
-                            neighbors = [neigh for neigh in neighbors if neigh not in region]
-                            neighbors = [neigh for neigh in neighbors if neigh not in potential]
-                            potential.extend(neighbors)
-                        if potential:
-                            # add a random neighbor
-                            neigID = np.random.randint(0, len(potential))
-                            neigAdd = potential.pop(neigID)
-                            region.append(neigAdd)
-                            # remove it from candidates
-                            candidates.remove(neigAdd)
-                        else:
-                            #print 'enclave'
-                            #print region
-                            enclaves.extend(region)
-                            building_region = False
-            # check to see if any regions were made before going to enclave stage
-            if regions:
-                feasible = True
-            else:
-                attempts += 1
-                break
-            self.enclaves = enclaves[:]
-            a2r = {}
-            for r, region in enumerate(regions):
-                for area in region:
-                    a2r[area] = r
-            encCount = len(enclaves)
-            encAttempts = 0
-            while enclaves and encAttempts != encCount:
-                enclave = enclaves.pop(0)
-                neighbors = self.w.neighbors[enclave]
-                neighbors = [neighbor for neighbor in neighbors if neighbor not in enclaves]
-                candidates = []
-                for neighbor in neighbors:
-                    region = a2r[neighbor]
-                    if region not in candidates:
-                        candidates.append(region)
-                if candidates:
-                    # add enclave to random region
-                    regID = np.random.randint(0, len(candidates))
-                    rid = candidates[regID]
-                    regions[rid].append(enclave)
-                    a2r[enclave] = rid
-                    # structure to loop over enclaves until no more joining is possible
-                    encCount = len(enclaves)
-                    encAttempts = 0
-                    feasible = True
-                else:
-                    # put back on que, no contiguous regions yet
-                    enclaves.append(enclave)
-                    encAttempts += 1
-                    feasible = False
-            if feasible:
-                solving = False
-                self.regions = regions
-                self.area2region = a2r
-                self.p = len(regions)
-            else:
-                if attempts == MAX_ATTEMPTS:
-                    print 'No initial solution found'
-                    self.p = 0
-                attempts += 1
+        _maxp_init(self.w.neighbors, self.w.id_order, self._index, self._fv,
+                   self.floor, self.seeds, self._z)
+        try:
+            regions, a2r, enclaves = _initial_solution(np.random)
+        finally:
+            _MAXP.clear()
+        self.enclaves = enclaves
+        if regions:
+            self.regions = regions
+            self.area2region = a2r
+            self.p = len(regions)
+        else:
+            self.p = 0
+
+    def _initial_solutions(self, initial, n_jobs=1):
+        """
+        Generate (regions, area2region, enclaves, wss) for initial restarts.
+        """
+        data = (self.w.neighbors, self.w.id_order, self._index, self._fv,
+                self.floor, self.seeds, self._z)
+        if n_jobs == -1:
+            n_jobs = mp.cpu_count()
+        if n_jobs > 1 and initial > 1:
+            seeds = np.random.randint(0, 2 ** 31 - 1, initial)
+            pool = mp.Pool(min(n_jobs, initial), _maxp_init, data)
+            try:
+                solutions = pool.map(_maxp_solution, seeds)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            _maxp_init(*data)
+            try:
+                solutions = [_maxp_solution(None) for i in range(initial)]
+            finally:
+                _MAXP.clear()
+        return solutions
 
     def swap(self):
         swapping = True
@@ -243,6 +216,9 @@ class Maxp:
             print 'Initial solution, objective function: ', self.objective_function()
         total_moves = 0
         self.k = len(self.regions)
+        self._region_stats()
+        self._contiguity = Region_Contiguity(self.w, self.regions,
+                                             self.area2region)
         changed_regions = [1] * self.k
         nr = range(self.k)
         while swapping:
@@ -258,51 +234,34 @@ class Maxp:
                     local_moves = 0
                     # get neighbors
                     members = self.regions[seed]
+                    seen = set(members)
                     neighbors = []
                     for member in members:
-                        candidates = self.w.neighbors[member]
-                        candidates = [candidate for candidate in candidates if candidate not in members]
-                        candidates = [candidate for candidate in candidates if candidate not in neighbors]
-                        neighbors.extend(candidates)
+                        for candidate in self.w.neighbors[member]:
+                            if candidate not in seen:
+                                seen.add(candidate)
+                                neighbors.append(candidate)
                     candidates = []
                     for neighbor in neighbors:
-                        block = copy.copy(self.regions[self.area2region[
-                            neighbor]])
-                        if check_contiguity(self.w, block, neighbor):
-                            block.remove(neighbor)
-                            fv = self.check_floor(block)
-                            if fv:
-                                candidates.append(neighbor)
+                        donor = self.area2region[neighbor]
+                        # a donor left empty has no defined variance
+                        if self._count[donor] == 1:
+                            continue
+                        fv = self._fsum[donor] - self._fv[self._index[neighbor]]
+                        if fv < self.floor:
+                            continue
+                        if self._contiguity.can_leave(neighbor):
+                            candidates.append(neighbor)
                     # find the best local move
                     if not candidates:
                         local_swapping = False
                     else:
-                        nc = len(candidates)
-                        moves = np.zeros([nc, 1], float)
-                        best = None
-                        cv = 0.0
-                        for area in candidates:
-                            current_internal = self.regions[seed]
-                            current_outter = self.regions[self.area2region[
-                                area]]
-                            current = self.objective_function([current_internal, current_outter])
-                            new_internal = copy.copy(current_internal)
-                            new_outter = copy.copy(current_outter)
-                            new_internal.append(area)
-                            new_outter.remove(area)
-                            new = self.objective_function([new_internal,
-                                                           new_outter])
-                            change = new - current
-                            if change < cv:
-                                best = area
-                                cv = change
+                        best = self._best_move(seed, candidates)
                         if best:
                             # make the move
                             area = best
                             old_region = self.area2region[area]
-                            self.regions[old_region].remove(area)
-                            self.area2region[area] = seed
-                            self.regions[seed].append(area)
+                            self._move(area, seed)
                             moves_made += 1
                             changed_regions[seed] = 1
                             changed_regions[old_region] = 1
@@ -327,9 +286,54 @@ class Maxp:
                 print 'moves_made: ', moves_made
                 print 'objective function: ', self.objective_function()
 
+    def _region_stats(self):
+        """
+        Running count, sum of z and sum of floor_variable of each region.
+        """
+        labels = np.array([self.area2region[area]
+                           for area in self.w.id_order])
+        k = len(self.regions)
+        self._count = np.bincount(labels, minlength=k).astype(float)
+        self._zsum = np.array([np.bincount(labels, weights=col, minlength=k)
+                               for col in self._z.T]).T
+        self._fsum = np.bincount(labels, weights=self._fv, minlength=k)
+
+    def _best_move(self, recipient, candidates):
+        """
+        Candidate whose move into recipient lowers the objective the most,
+        None if no move improves it.
+        """
+        rows = [self._index[area] for area in candidates]
+        donors = [self.area2region[area] for area in candidates]
+        x = self._z[rows]
+        n = self._count[recipient]
+        gain = n / (n + 1.) * ((x - self._zsum[recipient] / n) ** 2).sum(1)
+        nd = self._count[donors][:, None]
+        loss = nd / (nd - 1.) * (x - self._zsum[donors] / nd) ** 2
+        change = gain - loss.sum(1)
+        best = change.argmin()
+        if change[best] < 0.0:
+            return candidates[best]
+        return None
+
+    def _move(self, area, recipient):
+        """
+        Move area into recipient, updating the region statistics and
+        articulation points.
+        """
+        donor = self.area2region[area]
+        i = self._index[area]
+        self._contiguity.move(area, recipient)
+        self._count[donor] -= 1
+        self._count[recipient] += 1
+        self._zsum[donor] -= self._z[i]
+        self._zsum[recipient] += self._z[i]
+        self._fsum[donor] -= self._fv[i]
+        self._fsum[recipient] += self._fv[i]
+
     def check_floor(self, region):
-        selectionIDs = [self.w.id_order.index(i) for i in region]
-        cv = sum(self.floor_variable[selectionIDs])
+        selectionIDs = [self._index[i] for i in region]
+        cv = sum(self._fv[selectionIDs])
         if cv >= self.floor:
             #print len(selectionIDs)
             return True
@@ -342,15 +346,9 @@ class Maxp:
         # on. solution does not have to be exhaustive
         if not solution:
             solution = self.regions
-        wss = 0
-        for region in solution:
-            selectionIDs = [self.w.id_order.index(i) for i in region]
-            m = self.z[selectionIDs, :]
-            var = m.var(axis=0)
-            wss += sum(np.transpose(var)) * len(region)
-        return wss
-
-    def inference(self, nperm=99):
+        return _wss(solution, self._index, self._z)
+
+    def inference(self, nperm=99, n_jobs=1):
         """Compare the within sum of squares for the solution against
         simulated solutions where areas are randomly assigned to regions that
         maintain the cardinality of the original solution.
@@ -362,6 +360,10 @@ class Maxp:
                       number of random permutations for calculation of
                       pseudo-p_values
 
+        n_jobs      : int
+                      number of processes generating the random solutions,
+                      see pysal.region.random_region_labels
+
         Attributes
         ----------
 
@@ -397,21 +399,16 @@ class Maxp:
         wsss = np.zeros(nperm + 1)
         self.wss = self.objective_function()
         cards = [len(i) for i in self.regions]
-        sim_solutions = RR.Random_Regions(ids, num_regions,
-                                          cardinality=cards, permutations=nperm)
-        cv = 1
-        c = 1
-        for solution in sim_solutions.solutions_feas:
-            wss = self.objective_function(solution.regions)
-            wsss[c] = wss
-            if wss <= self.wss:
-                cv += 1
-            c += 1
-        self.pvalue = cv / (1. + len(sim_solutions.solutions_feas))
+        labels = RR.random_region_labels(ids, num_regions, cardinality=cards,
+                                         permutations=nperm, n_jobs=n_jobs)
+        sims = RR.region_wss(labels[labels[:, 0] >= 0], self._z)
+        wsss[1:len(sims) + 1] = sims
+        cv = 1 + int((sims <= self.wss).sum())
+        self.pvalue = cv / (1. + len(sims))
         self.wss_perm = wsss
         self.wss_perm[0] = self.wss
 
-    def cinference(self, nperm=99, maxiter=1000):
+    def cinference(self, nperm=99, maxiter=1000, n_jobs=1):
         """Compare the within sum of squares for the solution against
         conditional simulated solutions where areas are randomly assigned to
         regions that maintain the cardinality of the original solution and
@@ -427,6 +424,10 @@ class Maxp:
         maxiter     : int
                       maximum number of attempts to find each permutation
 
+        n_jobs      : int
+                      number of processes generating the random solutions,
+                      see pysal.region.random_region_labels
+
         Attributes
         ----------
 
@@ -472,20 +473,15 @@ class Maxp:
         wsss = np.zeros(nperm + 1)
         self.cwss = self.objective_function()
         cards = [len(i) for i in self.regions]
-        sim_solutions = RR.Random_Regions(ids, num_regions,
-                                          cardinality=cards, contiguity=self.w,
-                                          maxiter=maxiter, permutations=nperm)
-        self.cfeas_sols = len(sim_solutions.solutions_feas)
+        labels = RR.random_region_labels(ids, num_regions, cardinality=cards,
+                                         contiguity=self.w, maxiter=maxiter,
+                                         permutations=nperm, n_jobs=n_jobs)
+        sims = RR.region_wss(labels[labels[:, 0] >= 0], self._z)
+        self.cfeas_sols = len(sims)
         if self.cfeas_sols < nperm:
             raise Exception('not enough feasible solutions found')
-        cv = 1
-        c = 1
-        for solution in sim_solutions.solutions_feas:
-            wss = self.objective_function(solution.regions)
-            wsss[c] = wss
-            if wss <= self.cwss:
-                cv += 1
-            c += 1
+        wsss[1:len(sims) + 1] = sims
+        cv = 1 + int((sims <= self.cwss).sum())
         self.cpvalue = cv / (1. + self.cfeas_sols)
         self.cwss_perm = wsss
         self.cwss_perm[0] = self.cwss
@@ -564,13 +560,160 @@ class Maxp_LISA(Maxp):
     [99, 98, 89]
 
     """
-    def __init__(self, w, z, y, floor, floor_variable, initial=100):
+    def __init__(self, w, z, y, floor, floor_variable, initial=100,
+                 n_jobs=1):
 
         lis = pysal.Moran_Local(y, w)
         ids = np.argsort(lis.Is)
         ids = ids[range(w.n - 1, -1, -1)]
         ids = ids.tolist()
-        mp = Maxp.__init__(
+        Maxp.__init__(
             self, w, z, floor=floor, floor_variable=floor_variable,
-            initial=initial, seeds=ids)
+            initial=initial, seeds=ids, n_jobs=n_jobs)
+
+
+def _wss(regions, index, z):
+    """
+    Within sum of squares of z over a list of regions.
+    """
+    wss = 0
+    for region in regions:
+        m = z[[index[i] for i in region]]
+        var = m.var(axis=0)
+        wss += sum(np.transpose(var)) * len(region)
+    return wss
+
+
+def _maxp_init(neighbors, id_order, index, fv, floor, seeds, z):
+    """
+    Set up a process building Maxp initial solutions.
+    """
+    _MAXP.update(neighbors=neighbors, id_order=id_order, index=index, fv=fv,
+                 floor=floor, seeds=seeds, z=z)
+
+
+def _maxp_solution(seed):
+    """
+    Build an initial solution from its own random stream (seed) or from
+    numpy.random (seed None) and return it with its objective value.
+    """
+    if seed is None:
+        rng = np.random
+    else:
+        rng = np.random.RandomState(seed)
+    regions, a2r, enclaves = _initial_solution(rng)
+    val = None
+    if regions:
+        val = _wss(regions, _MAXP['index'], _MAXP['z'])
+    return regions, a2r, enclaves, val
+
+
+def _initial_solution(rng):
+    """
+    Grow regions from seeds until they reach the floor and assign the
+    enclaves left over to neighboring regions.
+
+    Returns
+    -------
+    regions, area2region, enclaves, with regions None if no feasible
+    solution was found.
+    """
+    neighbors = _MAXP['neighbors']
+    id_order = _MAXP['id_order']
+    index = _MAXP['index']
+    fv = _MAXP['fv']
+    floor = _MAXP['floor']
+    enclaves = []
+    solving = True
+    attempts = 0
+    while solving and attempts <= MAX_ATTEMPTS:
+        regions = []
+        enclaves = []
+        if not _MAXP['seeds']:
+            candidates = rng.permutation(id_order).tolist()
+        else:
+            seeds = copy.copy(_MAXP['seeds'])
+            chosen = set(seeds)
+            candidates = seeds
+            candidates.extend([i for i in id_order if i not in chosen])
+        # areas no longer available to start or join a region
+        taken = set()
+        for seed in candidates:
+            if seed in taken:
+                continue
+            taken.add(seed)
+            # try to grow it till threshold constraint is satisfied
+            region = [seed]
+            cv = fv[index[seed]]
+            building_region = True
+            while building_region:
+                # check if floor is satisfied
+                if cv >= floor:
+                    regions.append(region)
+                    building_region = False
+                else:
+                    potential = []
+                    listed = set()
+                    for area in region:
+                        for neigh in neighbors[area]:
+                            if neigh not in taken and neigh not in listed:
+                                listed.add(neigh)
+                                potential.append(neigh)
+                    if potential:
+                        # add a random neighbor
+                        neigID = rng.randint(0, len(potential))
+                        neigAdd = potential.pop(neigID)
+                        region.append(neigAdd)
+                        taken.add(neigAdd)
+                        cv += fv[index[neigAdd]]
+                    else:
+                        enclaves.extend(region)
+                        building_region = False
+        # check to see if any regions were made before going to enclave stage
+        if regions:
+            feasible = True
+        else:
+            attempts += 1
+            break
+        left = enclaves[:]
+        a2r = {}
+        for r, region in enumerate(regions):
+            for area in region:
+                a2r[area] = r
+        queue = deque(enclaves)
+        waiting = set(enclaves)
+        encCount = len(queue)
+        encAttempts = 0
+        while queue and encAttempts != encCount:
+            enclave = queue.popleft()
+            waiting.discard(enclave)
+            candidates = []
+            for neighbor in neighbors[enclave]:
+                if neighbor not in waiting:
+                    region = a2r[neighbor]
+                    if region not in candidates:
+                        candidates.append(region)
+            if candidates:
+                # add enclave to random region
+                regID = rng.randint(0, len(candidates))
+                rid = candidates[regID]
+                regions[rid].append(enclave)
+                a2r[enclave] = rid
+                # structure to loop over enclaves until no more joining is possible
+                encCount = len(queue)
+                encAttempts = 0
+                feasible = True
+            else:
+                # put back on que, no contiguous regions yet
+                queue.append(enclave)
+                waiting.add(enclave)
+                encAttempts += 1
+                feasible = False
+        enclaves = left
+        if feasible:
+            return regions, a2r, enclaves
+        if attempts == MAX_ATTEMPTS:
+            print 'No initial solution found'
+        attempts += 1
+    return None, None, enclaves
 
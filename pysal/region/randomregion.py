@@ -7,11 +7,17 @@ composition.
 
 __author__ = "David Folch dfolch@fsu.edu, Serge Rey srey@asu.edu"
 
+import multiprocessing as mp
 import numpy as np
-from pysal.region.components import check_contiguity
+from pysal.region.components import articulation_points
+from pysal.esda.permutation import block_size
 from pysal.common import copy
 
-__all__ = ["Random_Regions", "Random_Region"]
+__all__ = ["Random_Regions", "Random_Region", "random_region_labels",
+           "region_wss"]
+
+# per process state of the workers generating random regions
+_RR = {}
 
 
 class Random_Regions:
@@ -198,6 +204,10 @@ class Random_Region:
                       maximum number of swaps to find a feasible solution
                       (only affects contiguity constrained regions)
 
+    seed            : int
+                      (Optional) seed of a random stream used instead of
+                      numpy.random
+
     Attributes
     ----------
 
@@ -288,11 +298,16 @@ class Random_Region:
     """
     def __init__(
         self, area_ids, num_regions=None, cardinality=None, contiguity=None,
-                    maxiter=1000, compact=False, max_swaps=1000000):
+                    maxiter=1000, compact=False, max_swaps=1000000, seed=None):
 
+        if seed is None:
+            # the RandomState behind the numpy.random functions
+            self._rng = np.random.mtrand._rand
+        else:
+            self._rng = np.random.RandomState(seed)
         self.n = len(area_ids)
         ids = copy.copy(area_ids)
-        self.ids = list(np.random.permutation(ids))
+        self.ids = list(self._rng.permutation(ids))
         self.area_ids = area_ids
         self.regions = []
         self.feasible = True
@@ -352,12 +367,12 @@ class Random_Region:
             self.build_noncontig_regions(num_regions, region_breaks)
 
     def get_num_regions(self):
-        return np.random.random_integers(2, self.n)
+        return self._rng.random_integers(2, self.n)
 
     def get_region_breaks(self, num_regions):
         region_breaks = set([])
         while len(region_breaks) < num_regions - 1:
-            region_breaks.add(np.random.random_integers(1, self.n - 1))
+            region_breaks.add(self._rng.random_integers(1, self.n - 1))
         region_breaks = list(region_breaks)
         region_breaks.sort()
         return region_breaks
@@ -393,7 +408,7 @@ class Random_Region:
         # potential areas before adding new potential areas
         add_areas = []
         while potential and len(region) < test_card:
-            pot_index = np.random.random_integers(0, len(potential) - 1)
+            pot_index = self._rng.random_integers(0, len(potential) - 1)
             add_area = potential[pot_index]
             region.append(add_area)
             candidates.remove(add_area)
@@ -409,7 +424,7 @@ class Random_Region:
     def grow_free(self, w, test_card, region, candidates, potential):
         # increment potential areas after each new area is
         # added to the region (faster than the grow_compact)
-        pot_index = np.random.random_integers(0, len(potential) - 1)
+        pot_index = self._rng.random_integers(0, len(potential) - 1)
         add_area = potential[pot_index]
         region.append(add_area)
         candidates.remove(add_area)
@@ -458,18 +473,19 @@ class Random_Region:
                         swap_count += 1
                         swap_out = candidates.pop(0)  # area to remove from candidates
                         swap_neighs = copy.copy(w.neighbors[swap_out])
-                        swap_neighs = list(np.random.permutation(swap_neighs))
+                        swap_neighs = list(self._rng.permutation(swap_neighs))
                         # select area to add to candidates (i.e. remove from an existing region)
                         for i in swap_neighs:
                             if i not in candidates:
                                 join = i  # area linking swap_in to swap_out
                                 swap_index = area2region[join]
                                 swap_region = regions[swap_index]
-                                swap_region = list(np.random.permutation(swap_region))
+                                swap_region = list(self._rng.permutation(swap_region))
+                                # areas that would split the region joined by swap_out
+                                cut = articulation_points(w, swap_region + [swap_out])
                                 for j in swap_region:
                                     # test to ensure region connectivity after removing area
-                                    swap_region_test = swap_region[:] + [swap_out]
-                                    if check_contiguity(w, swap_region_test, j):
+                                    if j not in cut:
                                         swap_in = j
                                         break
                             if swap_in is not None:  # PEP8 E711
@@ -518,7 +534,7 @@ class Random_Region:
             # handling of regionalization result
             if len(regions) < num_regions:
                 # regionalization failed
-                self.ids = list(np.random.permutation(self.ids))
+                self.ids = list(self._rng.permutation(self.ids))
                 regions = []
                 iter += 1
             else:
@@ -527,3 +543,209 @@ class Random_Region:
                 iter = maxiter
         self.regions = regions
 
+
+def random_region_labels(area_ids, num_regions=None, cardinality=None,
+                         contiguity=None, maxiter=100, compact=False,
+                         max_swaps=1000000, permutations=99, n_jobs=1,
+                         seed=None):
+    """Generate random regionalizations as a matrix of region labels.
+
+    Parameters
+    ----------
+
+    area_ids        : list
+                      IDs indexing the areas to be grouped into regions (must
+                      be in the same order as spatial weights matrix if this
+                      is provided)
+
+    num_regions, cardinality, contiguity, maxiter, compact, max_swaps
+                    : see Random_Regions
+
+    permutations    : int
+                      number of random regionalizations to generate
+
+    n_jobs          : int
+                      number of processes generating the regionalizations,
+                      -1 uses all available cores
+
+    seed            : int
+                      (Optional) seed for the random streams. Each solution
+                      draws from its own stream seeded from seed, so the
+                      labels do not depend on n_jobs. If seed is None and
+                      n_jobs is 1 the solutions are drawn from numpy.random
+                      in turn, exactly as Random_Regions draws them
+
+    Returns
+    -------
+
+    labels          : array
+                      (permutations, n) int32 array, labels[j, i] is the
+                      region of area_ids[i] in solution j. Solutions for
+                      which no feasible regionalization was found are rows
+                      of -1
+
+    Examples
+    --------
+
+    >>> import numpy as np
+    >>> import pysal
+    >>> w = pysal.lat2W(10, 10)
+    >>> labels = pysal.region.random_region_labels(w.id_order, num_regions=13,
+    ...                                            contiguity=w,
+    ...                                            permutations=4, seed=10)
+    >>> labels.shape
+    (4, 100)
+    >>> (labels.max(axis=1) + 1).tolist()
+    [13, 13, 13, 13]
+    >>> parallel = pysal.region.random_region_labels(w.id_order, num_regions=13,
+    ...                                              contiguity=w,
+    ...                                              permutations=4, seed=10,
+    ...                                              n_jobs=2)
+    >>> (parallel == labels).all()
+    True
+
+    Without a seed the serial labels match Random_Regions
+
+    >>> np.random.seed(100)
+    >>> labels = pysal.region.random_region_labels(w.id_order, 13,
+    ...                                            permutations=2)
+    >>> np.random.seed(100)
+    >>> t = pysal.region.Random_Regions(w.id_order, 13, permutations=2)
+    >>> t.solutions[1].regions[0]
+    [63, 60, 59]
+    >>> labels[1, t.solutions[1].regions[0]]
+    array([0, 0, 0], dtype=int32)
+    """
+    if n_jobs == -1:
+        n_jobs = mp.cpu_count()
+    if seed is None and n_jobs == 1:
+        seeds = [None] * permutations
+    else:
+        if seed is None:
+            seed = np.random.randint(np.iinfo(np.int32).max)
+        seeds = np.random.RandomState(seed).randint(np.iinfo(np.int32).max,
+                                                    size=permutations)
+        seeds = seeds.tolist()
+    size = block_size(len(area_ids), permutations)
+    if n_jobs > 1:
+        size = min(size, -(-permutations // (4 * n_jobs)))
+    tasks = [seeds[start:start + size]
+             for start in range(0, permutations, size)]
+    data = (area_ids, num_regions, cardinality, contiguity, maxiter, compact,
+            max_swaps)
+    if n_jobs > 1 and len(tasks) > 1:
+        pool = mp.Pool(min(n_jobs, len(tasks)), _rr_init, data)
+        try:
+            results = pool.map(_rr_labels, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _rr_init(*data)
+        try:
+            results = [_rr_labels(task) for task in tasks]
+        finally:
+            _RR.clear()
+    if not results:
+        return np.zeros((0, len(area_ids)), np.int32)
+    return np.vstack(results)
+
+
+def _rr_init(area_ids, num_regions, cardinality, contiguity, maxiter, compact,
+             max_swaps):
+    """
+    Set up a process generating random regionalizations.
+    """
+    _RR.update(area_ids=area_ids,
+               index=dict((area, i) for i, area in enumerate(area_ids)),
+               args=(num_regions, cardinality, contiguity, maxiter, compact,
+                     max_swaps))
+
+
+def _rr_labels(seeds):
+    """
+    Label matrix of the random regionalizations drawn from seeds.
+    """
+    area_ids = _RR['area_ids']
+    index = _RR['index']
+    labels = np.empty((len(seeds), len(area_ids)), np.int32)
+    labels.fill(-1)
+    for row, seed in zip(labels, seeds):
+        solution = Random_Region(area_ids, *_RR['args'], seed=seed)
+        if solution.feasible:
+            for r, region in enumerate(solution.regions):
+                row[[index[area] for area in region]] = r
+    return labels
+
+
+def region_wss(labels, z):
+    """Within sum of squares of z for each solution in a label matrix.
+
+    Parameters
+    ----------
+
+    labels          : array
+                      (s, n) region labels of n areas in s solutions, or a
+                      single solution of n labels, as returned by
+                      random_region_labels
+
+    z               : array
+                      n*m array of observations on m attributes, rows in the
+                      order of the labels
+
+    Returns
+    -------
+
+    wss             : array
+                      (s,) within sum of squares of each solution, nan for
+                      rows with negative (infeasible) labels
+
+    Notes
+    -----
+
+    The within sum of squares of a solution is the total sum of squares of
+    z less the sum over regions of :math:`\\|s_r\\|^2 / n_r`, where
+    :math:`s_r` and :math:`n_r` are the sum of z and the number of areas in
+    region r. Both come from one bincount over a block of solutions.
+
+    Examples
+    --------
+
+    >>> import numpy as np
+    >>> import pysal
+    >>> z = np.array([[1., 2.], [3., 2.], [5., 8.], [7., 6.]])
+    >>> labels = np.array([[0, 0, 1, 1], [0, 1, 0, 1]])
+    >>> region_wss(labels, z)
+    array([  6.,  42.])
+    """
+    labels = np.asarray(labels)
+    single = labels.ndim == 1
+    labels = np.atleast_2d(labels)
+    s, n = labels.shape
+    z = np.asarray(z, dtype=float).reshape(n, -1)
+    # centering keeps the difference of sums of squares accurate
+    z = z - z.mean(axis=0)
+    total = (z ** 2).sum()
+    wss = np.empty(s)
+    wss.fill(np.nan)
+    feasible = (labels >= 0).all(axis=1)
+    k = int(labels.max()) + 1 if labels.size else 0
+    size = block_size(n * (z.shape[1] + 1), s)
+    for start in range(0, s, size):
+        ok = feasible[start:start + size]
+        block = labels[start:start + size][ok]
+        b = block.shape[0]
+        if not b:
+            continue
+        idx = (block + k * np.arange(b)[:, None]).ravel()
+        count = np.bincount(idx, minlength=b * k)
+        between = np.zeros(b * k)
+        for col in z.T:
+            sums = np.bincount(idx, weights=np.tile(col, b), minlength=b * k)
+            between += sums ** 2
+        filled = count > 0
+        between[filled] /= count[filled]
+        wss[start:start + size][ok] = total - between.reshape(b, k).sum(1)
+    if single:
+        return wss[0]
+    return wss
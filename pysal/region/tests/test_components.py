@@ -17,6 +17,30 @@ class Test_Components(unittest.TestCase):
         result = pysal.region.check_contiguity(self.w, [0, 1, 2, 3, 4], 1)
         self.assertEquals(result, False)
 
+    def test_articulation_points(self):
+        ids = [0, 1, 2, 3, 4, 9, 14, 13, 8]
+        result = pysal.region.articulation_points(self.w, ids)
+        self.assertEquals(result, set([1, 2, 3]))
+        for i in ids:
+            self.assertEquals(i not in result,
+                              pysal.region.check_contiguity(self.w, ids, i))
+
+    def test_Region_Contiguity(self):
+        regions = [[0, 1, 2, 3, 4], [5, 6, 7, 8, 9]]
+        rc = pysal.region.Region_Contiguity(self.w, regions)
+        self.assertEquals([rc.can_leave(i) for i in range(10)],
+                          [True, False, False, False, True,
+                           True, False, False, False, True])
+        rc.move(4, 1)
+        self.assertEquals(regions, [[0, 1, 2, 3], [5, 6, 7, 8, 9, 4]])
+        self.assertEquals(rc.area2region[4], 1)
+        self.assertEquals([rc.can_leave(i) for i in [3, 4, 9]],
+                          [True, True, False])
+        # a region in pieces only mends when its lone area leaves
+        rc = pysal.region.Region_Contiguity(self.w, [[0, 1, 24]])
+        self.assertEquals([rc.can_leave(i) for i in [0, 1, 24]],
+                          [False, False, True])
+
 
 suite = unittest.TestLoader().loadTestsFromTestCase(Test_Components)
 
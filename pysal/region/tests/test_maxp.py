@@ -1,6 +1,7 @@
 
 import unittest
 import pysal
+from pysal.region.components import is_component
 import numpy as np
 
 
@@ -19,6 +20,26 @@ class Test_Maxp(unittest.TestCase):
         self.assertEquals(solution.p, 28)
         self.assertEquals(solution.regions[0], [51, 61, 71])
 
+    def test_Maxp_n_jobs(self):
+        w = pysal.lat2W(10, 10)
+        z = np.random.random_sample((w.n, 2))
+        p = np.random.randint(1, 4, w.n)
+        floor = 6
+        solutions = []
+        for i in range(2):
+            np.random.seed(111)
+            solutions.append(pysal.region.Maxp(w, z, floor, floor_variable=p,
+                                               initial=10, n_jobs=2))
+        solution = solutions[0]
+        self.assertEquals(solution.regions, solutions[1].regions)
+        self.assertEquals(len(solution.initial_wss), 10)
+        for r, region in enumerate(solution.regions):
+            self.assertTrue(is_component(w, region))
+            self.assertTrue(p[region].sum() >= floor)
+            self.assertEquals(solution._count[r], len(region))
+            np.testing.assert_allclose(solution._zsum[r], z[region].sum(0))
+            self.assertEquals(solution._fsum[r], p[region].sum())
+
     def test_inference(self):
         w = pysal.weights.lat2W(5, 5)
         z = np.random.random_sample((w.n, 2))
@@ -48,7 +69,7 @@ class Test_Maxp(unittest.TestCase):
         np.random.seed(111)
         mpl = pysal.region.Maxp_LISA(w, z, p, floor=3, floor_variable=p)
         self.assertEquals(mpl.p, 30)
-        self.assertEquals(mpl.regions[0], [99, 89, 79, 88, 78])
+        self.assertEquals(mpl.regions[0], [99, 98, 89])
 
 
 suite = unittest.TestLoader().loadTestsFromTestCase(Test_Maxp)
@@ -190,6 +190,45 @@ class Test_Random_Regions(unittest.TestCase):
         for region in t0.regions:
             self.assertTrue(is_component(self.w, region))
 
+    def test_random_region_labels(self):
+        labels = pysal.region.random_region_labels(
+            self.ids, num_regions=self.nregs, cardinality=self.cards,
+            contiguity=self.w, permutations=6, seed=5)
+        self.assertEquals(labels.shape, (6, 100))
+        self.assertEquals(labels.dtype, np.int32)
+        for row in labels:
+            self.assertEquals(sorted(np.bincount(row)), sorted(self.cards))
+            for r in range(self.nregs):
+                self.assertTrue(is_component(self.w,
+                                             np.flatnonzero(row == r).tolist()))
+        parallel = pysal.region.random_region_labels(
+            self.ids, num_regions=self.nregs, cardinality=self.cards,
+            contiguity=self.w, permutations=6, seed=5, n_jobs=2)
+        np.testing.assert_array_equal(parallel, labels)
+
+        np.random.seed(100)
+        labels = pysal.region.random_region_labels(
+            self.ids, num_regions=self.nregs, permutations=2)
+        np.random.seed(100)
+        t0 = pysal.region.Random_Regions(
+            self.ids, num_regions=self.nregs, permutations=2)
+        for row, solution in zip(labels, t0.solutions):
+            for r, region in enumerate(solution.regions):
+                self.assertTrue((row[region] == r).all())
+
+    def test_region_wss(self):
+        z = np.random.RandomState(0).random_sample((100, 2))
+        labels = pysal.region.random_region_labels(
+            self.ids, num_regions=self.nregs, permutations=5, seed=1)
+        labels[3] = -1
+        wss = pysal.region.region_wss(labels, z)
+        self.assertTrue(np.isnan(wss[3]))
+        for row, value in zip(labels[[0, 1, 2, 4]], wss[[0, 1, 2, 4]]):
+            expected = sum(((z[row == r] - z[row == r].mean(0)) ** 2).sum()
+                           for r in range(row.max() + 1))
+            self.assertAlmostEquals(value, expected)
+            self.assertAlmostEquals(pysal.region.region_wss(row, z), expected)
+
 
 suite = unittest.TestLoader().loadTestsFromTestCase(Test_Random_Regions)
 
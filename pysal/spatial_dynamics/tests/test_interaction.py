@@ -4,7 +4,7 @@ from pysal.spatial_dynamics import interaction
 import numpy as np
 import scipy
 
-scp_version = int(scipy.version.version.split(".")[1])
+scp_version = tuple(int(v) for v in scipy.version.version.split(".")[:2])
 
 
 class SpaceTimeEvents_Tester(unittest.TestCase):
@@ -49,7 +49,7 @@ class Jacquez_Tester(unittest.TestCase):
     def test_jacquez(self):
         result = interaction.jacquez(self.events.space,
                 self.events.t, k=3, permutations=1)
-        if scp_version > 11:
+        if scp_version > (0, 11):
             self.assertEquals(result['stat'], 12)
         else:
             self.assertEquals(result['stat'], 13)
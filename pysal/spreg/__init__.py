@@ -21,3 +21,4 @@ from ml_error_regimes import *
 from sur import *
 from sur_error import *
 from sur_lag import *
+from batch import *
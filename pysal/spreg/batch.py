@@ -0,0 +1,842 @@
+"""
+Batched estimation of many dependent variables against a common set of
+explanatory variables and spatial weights.
+"""
+
+import numpy as np
+import numpy.linalg as la
+from scipy import stats
+from scipy.stats import chi2
+from utils import get_lags, optim_moments, _get_WtW, get_A2_hom
+import user_output as USER
+chisqprob = chi2.sf
+
+__all__ = ["OLS_Batch", "TSLS_Batch", "GM_Lag_Batch", "GM_Error_Batch"]
+
+
+class BaseOLS_Batch(object):
+
+    """
+    Ordinary least squares for several dependent variables sharing the same
+    X (note: no consistency checks, diagnostics or constant added)
+
+    X'X and its inverse are computed once and applied to every column of y.
+
+    Parameters
+    ----------
+    y            : array
+                   nxm array with one dependent variable per column
+    x            : array
+                   Two dimensional array with n rows and one column for each
+                   independent (exogenous) variable, including the constant
+    sig2n_k      : boolean
+                   If True, then use n-k to estimate sigma^2. If False, use n.
+
+    Attributes
+    ----------
+    betas        : array
+                   kxm array of estimated coefficients, one column per
+                   dependent variable
+    u            : array
+                   nxm array of residuals
+    predy        : array
+                   nxm array of predicted y values
+    n            : integer
+                   Number of observations
+    k            : integer
+                   Number of variables for which coefficients are estimated
+                   (including the constant)
+    m            : integer
+                   Number of dependent variables
+    y            : array
+                   nxm array for dependent variables
+    x            : array
+                   Two dimensional array with n rows and one column for each
+                   independent (exogenous) variable, including the constant
+    mean_y       : array
+                   Mean of each dependent variable
+    std_y        : array
+                   Standard deviation of each dependent variable
+    vm           : array
+                   mxkxk array with the variance covariance matrix of each
+                   regression
+    utu          : array
+                   Sum of squared residuals of each regression
+    sig2         : array
+                   Sigma squared of each regression
+    sig2n        : array
+                   Sigma squared (computed with n in the denominator)
+    sig2n_k      : array
+                   Sigma squared (computed with n-k in the denominator)
+    xtx          : array
+                   X'X
+    xtxi         : array
+                   (X'X)^-1
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> import pysal
+    >>> db = pysal.open(pysal.examples.get_path('columbus.dbf'),'r')
+    >>> y = np.array([db.by_col('HOVAL'), db.by_col('CRIME')]).T
+    >>> x = np.array([db.by_col('INC')]).T
+    >>> x = np.hstack((np.ones((49, 1)), x))
+    >>> ols = BaseOLS_Batch(y, x)
+    >>> ols.betas.shape
+    (2, 2)
+    >>> np.around(ols.betas[:, 0], 4)
+    array([ 15.1707,   1.6185])
+    """
+
+    def __init__(self, y, x, sig2n_k=True):
+        self.y = y
+        self.x = x
+        self.n, self.k = x.shape
+        self.m = y.shape[1]
+        self.xtx = np.dot(x.T, x)
+        self.xtxi = la.inv(self.xtx)
+        self.betas = np.dot(self.xtxi, np.dot(x.T, y))
+        self.predy = np.dot(x, self.betas)
+        self.u = y - self.predy
+        _set_sig2(self, sig2n_k)
+        self.vm = self.sig2[:, None, None] * self.xtxi
+
+    @property
+    def mean_y(self):
+        return self.y.mean(0)
+
+    @property
+    def std_y(self):
+        return self.y.std(0, ddof=1)
+
+
+class OLS_Batch(BaseOLS_Batch):
+
+    """
+    Ordinary least squares for several dependent variables sharing the same
+    X, with per-column results and diagnostics.
+
+    Every attribute that is a single value on :class:`pysal.spreg.ols.OLS`
+    is an array with one entry per dependent variable here, and the
+    diagnostics that are (statistic, p-value) tuples on OLS are stored as
+    mx2 arrays.
+
+    Parameters
+    ----------
+    y            : array
+                   nxm array with one dependent variable per column
+    x            : array
+                   Two dimensional array with n rows and one column for each
+                   independent (exogenous) variable, excluding the constant
+    w            : pysal W object
+                   Spatial weights object (required if running spatial
+                   diagnostics)
+    sig2n_k      : boolean
+                   If True, then use n-k to estimate sigma^2. If False, use n.
+    nonspat_diag : boolean
+                   If True, then compute the t-statistics, R squared and F
+                   test of each regression
+    spat_diag    : boolean
+                   If True, then compute the Lagrange multiplier tests
+                   (requires w)
+    moran        : boolean
+                   If True, compute Moran's I on the residuals of each
+                   regression (requires w)
+    name_y       : list of strings
+                   Names of the dependent variables for use in output
+    name_x       : list of strings
+                   Names of independent variables for use in output
+    name_w       : string
+                   Name of weights matrix for use in output
+    name_ds      : string
+                   Name of dataset for use in output
+
+    Attributes
+    ----------
+    betas        : array
+                   kxm array of estimated coefficients
+    std_err      : array
+                   kxm array of standard errors of the betas
+    t_stat       : array
+                   kxmx2 array with the t-statistic and its p-value for each
+                   coefficient and dependent variable
+    r2           : array
+                   R squared of each regression
+    ar2          : array
+                   Adjusted R squared of each regression
+    f_stat       : array
+                   mx2 array with the F-statistic and its p-value
+    lm_error     : array
+                   mx2 array with the LM error test and its p-value
+    lm_lag       : array
+                   mx2 array with the LM lag test and its p-value
+    rlm_error    : array
+                   mx2 array with the robust LM error test and its p-value
+    rlm_lag      : array
+                   mx2 array with the robust LM lag test and its p-value
+    lm_sarma     : array
+                   mx2 array with the LM SARMA test and its p-value
+    moran_res    : array
+                   mx3 array with Moran's I, its standardized value and
+                   p-value for the residuals of each regression
+    u, predy, n, k, m, y, x, vm, utu, sig2, sig2n, sig2n_k, xtx, xtxi
+                 : see :class:`BaseOLS_Batch`
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> import pysal
+    >>> db = pysal.open(pysal.examples.get_path('columbus.dbf'),'r')
+    >>> y = np.array([db.by_col('HOVAL'), db.by_col('CRIME')]).T
+    >>> x = np.array([db.by_col('INC')]).T
+    >>> w = pysal.weights.Rook.from_shapefile(pysal.examples.get_path("columbus.shp"))
+    >>> w.transform = 'r'
+    >>> ols = OLS_Batch(y, x, w, spat_diag=True, moran=True,
+    ...                 name_y=['home value', 'crime'], name_x=['income'])
+    >>> np.around(ols.betas, 4)
+    array([[ 15.1707,  64.4632],
+           [  1.6185,  -2.0407]])
+    >>> np.around(ols.r2, 4)
+    array([ 0.2499,  0.4838])
+    >>> np.around(ols.lm_error[:, 0], 4)
+    array([ 2.3602,  3.8004])
+
+    The results of the second column are the same as those of a single OLS
+    regression of crime on income
+
+    >>> single = pysal.spreg.OLS(y[:, 1:], x, w, spat_diag=True)
+    >>> np.allclose(ols.lm_error[1], single.lm_error)
+    True
+    """
+
+    def __init__(self, y, x, w=None, sig2n_k=True, nonspat_diag=True,
+                 spat_diag=False, moran=False, name_y=None, name_x=None,
+                 name_w=None, name_ds=None):
+        n = USER.check_arrays(x)
+        _check_y_batch(y, n)
+        USER.check_weights(w, y)
+        USER.check_spat_diag(spat_diag, w)
+        x_constant = USER.check_constant(x)
+        BaseOLS_Batch.__init__(self, y=y, x=x_constant, sig2n_k=sig2n_k)
+        self.title = "ORDINARY LEAST SQUARES - BATCH"
+        self.name_ds = USER.set_name_ds(name_ds)
+        self.name_y = _set_name_y_batch(name_y, self.m)
+        self.name_x = USER.set_name_x(name_x, x)
+        self.name_w = USER.set_name_w(name_w, w)
+        self.std_err = _std_err(self)
+        if nonspat_diag:
+            self.t_stat = _t_stat(self, self.n - self.k)
+            tss = ((self.y - self.mean_y) ** 2).sum(0)
+            self.r2 = 1 - self.utu / tss
+            self.ar2 = 1 - (1 - self.r2) * (self.n - 1) / (self.n - self.k)
+            U = ((self.predy - self.mean_y) ** 2).sum(0)
+            fStat = (U / (self.k - 1)) / (self.utu / (self.n - self.k))
+            pValue = stats.f.sf(fStat, self.k - 1, self.n - self.k)
+            self.f_stat = np.column_stack((fStat, pValue))
+        if spat_diag or moran:
+            self._spat_diag(w, spat_diag, moran)
+
+    def _spat_diag(self, w, spat_diag, moran):
+        """
+        LM tests and Moran's I for all columns at once, sharing the traces
+        of W and the X-only matrices of Cliff and Ord (1981) across columns
+        """
+        ws = w.sparse
+        n = self.n
+        wu = ws * self.u
+        utwu = (self.u * wu).sum(0)
+        if spat_diag:
+            t = w.trcWtW_WW
+            sig2n = self.utu / n
+            utwuDs = utwu / sig2n
+            utwyDs = (self.u * (ws * self.y)).sum(0) / sig2n
+            wxb = ws * self.predy
+            xtwxb = np.dot(self.x.T, wxb)
+            num1 = (wxb ** 2).sum(0) - (xtwxb * np.dot(self.xtxi, xtwxb)).sum(0)
+            nj = (num1 + t * sig2n) / sig2n
+            lme = utwuDs ** 2 / t
+            lml = utwyDs ** 2 / nj
+            rlme = (utwuDs - t * utwyDs / nj) ** 2 / (t * (1 - t / nj))
+            rlml = (utwyDs - utwuDs) ** 2 / (nj - t)
+            self.lm_error = np.column_stack((lme, chisqprob(lme, 1)))
+            self.lm_lag = np.column_stack((lml, chisqprob(lml, 1)))
+            self.rlm_error = np.column_stack((rlme, chisqprob(rlme, 1)))
+            self.rlm_lag = np.column_stack((rlml, chisqprob(rlml, 1)))
+            sarma = rlml + lme
+            self.lm_sarma = np.column_stack((sarma, chisqprob(sarma, 2)))
+        if moran:
+            dof = n - self.k
+            I = utwu * (n / w.s0) / self.utu
+            xtwx = np.dot(self.x.T, ws * self.x)
+            trA = np.trace(np.dot(self.xtxi, xtwx))
+            eI = - (n * trA) / (w.s0 * dof)
+            z = get_A2_hom(ws) * self.x
+            A = np.dot(self.xtxi, np.dot(self.x.T, z))
+            B = np.dot(self.xtxi, np.dot(z.T, z))
+            vI = (n ** 2 / (w.s0 ** 2 * dof * (dof + 2.))) * \
+                (w.s1 + 2. * np.trace(np.dot(A, A)) - 4. * np.trace(B) -
+                 ((2. * (trA ** 2)) / dof))
+            zI = np.abs((I - eI) / np.sqrt(vI))
+            self.moran_res = np.column_stack((I, zI, stats.norm.sf(zI) * 2.))
+
+
+class BaseTSLS_Batch(object):
+
+    """
+    Two stage least squares for several dependent variables sharing the same
+    exogenous variables and instruments (note: no consistency checks,
+    diagnostics or constant added)
+
+    H'H, its inverse and the cross-products of the shared columns of Z with
+    H are computed once.
+
+    Parameters
+    ----------
+    y            : array
+                   nxm array with one dependent variable per column
+    x            : array
+                   Two dimensional array with n rows and one column for each
+                   independent (exogenous) variable, including the constant
+    yend         : array
+                   Two dimensional array with n rows and one column for each
+                   endogenous variable shared by all regressions, or None
+    q            : array
+                   Two dimensional array with n rows and one column for each
+                   external exogenous variable to use as instruments (note:
+                   this should not contain any variables from x); cannot be
+                   used in combination with h
+    h            : array
+                   Two dimensional array with n rows and one column for each
+                   exogenous variable to use as instruments (note: this
+                   can contain variables from x); cannot be used in
+                   combination with q
+    yend_m       : array
+                   nxm array with one additional endogenous variable per
+                   regression, appended after yend (e.g. the spatial lag of
+                   each dependent variable); None if all regressions share
+                   the same endogenous variables
+    sig2n_k      : boolean
+                   If True, then use n-k to estimate sigma^2. If False, use n.
+
+    Attributes
+    ----------
+    betas        : array
+                   kxm array of estimated coefficients
+    u            : array
+                   nxm array of residuals
+    predy        : array
+                   nxm array of predicted y values
+    n            : integer
+                   Number of observations
+    k            : integer
+                   Number of variables for which coefficients are estimated
+                   (including the constant)
+    m            : integer
+                   Number of dependent variables
+    h            : array
+                   nxl array of instruments (combination of x and q)
+    hthi         : array
+                   (H'H)^-1
+    varb         : array
+                   mxkxk array with (Z'H (H'H)^-1 H'Z)^-1 of each regression
+    vm           : array
+                   mxkxk array with the variance covariance matrix of each
+                   regression
+    utu          : array
+                   Sum of squared residuals of each regression
+    sig2         : array
+                   Sigma squared of each regression
+    """
+
+    def __init__(self, y, x, yend=None, q=None, h=None, yend_m=None,
+                 sig2n_k=False):
+        if q is not None and h is not None:
+            raise Exception, "Please do not provide 'q' and 'h' together"
+        if q is None and h is None:
+            raise Exception, "Please provide either 'q' or 'h'"
+        self.y = y
+        self.x = x
+        self.n, self.m = y.shape
+        z = x if yend is None else np.hstack((x, yend))
+        if h is None:
+            h = np.hstack((x, q))
+        self.z = z
+        self.h = h
+        self.q = q
+        self.yend = yend
+        self.yend_m = yend_m
+        k0 = z.shape[1]
+        self.k = k0 if yend_m is None else k0 + 1
+        self.hthi = la.inv(np.dot(h.T, h))
+        zth = np.dot(z.T, h)
+        hty = np.dot(h.T, y)
+        if yend_m is None:
+            factor_1 = np.dot(zth, self.hthi)
+            varb = la.inv(np.dot(factor_1, zth.T))
+            self.betas = np.dot(np.dot(varb, factor_1), hty)
+            self.varb = np.repeat(varb[None], self.m, 0)
+            self.predy = np.dot(z, self.betas)
+        else:
+            zth = np.concatenate((np.repeat(zth[None], self.m, 0),
+                                  np.dot(yend_m.T, h)[:, None, :]), 1)
+            factor_1 = np.dot(zth, self.hthi)
+            self.varb = la.inv(np.matmul(factor_1, zth.transpose(0, 2, 1)))
+            factor_3 = np.matmul(self.varb, factor_1)
+            self.betas = np.einsum('jkl,lj->kj', factor_3, hty)
+            self.predy = np.dot(z, self.betas[:k0]) + \
+                yend_m * self.betas[k0]
+        self.u = y - self.predy
+        _set_sig2(self, sig2n_k)
+        self.vm = self.sig2[:, None, None] * self.varb
+
+    @property
+    def mean_y(self):
+        return self.y.mean(0)
+
+    @property
+    def std_y(self):
+        return self.y.std(0, ddof=1)
+
+
+class TSLS_Batch(BaseTSLS_Batch):
+
+    """
+    Two stage least squares for several dependent variables sharing the same
+    exogenous variables, endogenous variables and instruments, with
+    per-column results and diagnostics.
+
+    Parameters
+    ----------
+    y            : array
+                   nxm array with one dependent variable per column
+    x            : array
+                   Two dimensional array with n rows and one column for each
+                   independent (exogenous) variable, excluding the constant
+    yend         : array
+                   Two dimensional array with n rows and one column for each
+                   endogenous variable
+    q            : array
+                   Two dimensional array with n rows and one column for each
+                   external exogenous variable to use as instruments (note:
+                   this should not contain any variables from x)
+    sig2n_k      : boolean
+                   If True, then use n-k to estimate sigma^2. If False, use n.
+    name_y       : list of strings
+                   Names of the dependent variables for use in output
+    name_x       : list of strings
+                   Names of independent variables for use in output
+    name_yend    : list of strings
+                   Names of endogenous variables for use in output
+    name_q       : list of strings
+                   Names of instruments for use in output
+    name_ds      : string
+                   Name of dataset for use in output
+
+    Attributes
+    ----------
+    std_err      : array
+                   kxm array of standard errors of the betas
+    z_stat       : array
+                   kxmx2 array with the z-statistic and its p-value for each
+                   coefficient and dependent variable
+    pr2          : array
+                   Pseudo R squared (squared correlation between y and ypred)
+                   of each regression
+    betas, u, predy, n, k, m, h, hthi, varb, vm, utu, sig2
+                 : see :class:`BaseTSLS_Batch`
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> import pysal
+    >>> db = pysal.open(pysal.examples.get_path("columbus.dbf"),'r')
+    >>> y = np.array([db.by_col("CRIME"), db.by_col("HOVAL")]).T
+    >>> X = np.array([db.by_col("INC")]).T
+    >>> yd = np.array([db.by_col("DISCBD")]).T
+    >>> q = np.array([db.by_col("CP")]).T
+    >>> reg = TSLS_Batch(y, X, yd, q)
+    >>> np.around(reg.betas[:, 0], 4)
+    array([ 69.8387,  -0.8179,  -8.0477])
+    >>> single = pysal.spreg.TSLS(y[:, :1], X, yd, q)
+    >>> np.allclose(reg.betas[:, :1], single.betas)
+    True
+    """
+
+    def __init__(self, y, x, yend, q, sig2n_k=False, name_y=None,
+                 name_x=None, name_yend=None, name_q=None, name_ds=None):
+        n = USER.check_arrays(x, yend, q)
+        _check_y_batch(y, n)
+        x_constant = USER.check_constant(x)
+        BaseTSLS_Batch.__init__(self, y=y, x=x_constant, yend=yend, q=q,
+                                sig2n_k=sig2n_k)
+        self.title = "TWO STAGE LEAST SQUARES - BATCH"
+        self.name_ds = USER.set_name_ds(name_ds)
+        self.name_y = _set_name_y_batch(name_y, self.m)
+        self.name_x = USER.set_name_x(name_x, x)
+        self.name_yend = USER.set_name_yend(name_yend, yend)
+        self.name_z = self.name_x + self.name_yend
+        self.name_q = USER.set_name_q(name_q, q)
+        self.name_h = USER.set_name_h(self.name_x, self.name_q)
+        _beta_diag(self)
+
+
+class GM_Lag_Batch(BaseTSLS_Batch):
+
+    """
+    Spatial two stage least squares (S2SLS) for several dependent variables
+    sharing the same exogenous variables, instruments and weights.
+
+    The spatial lags of X used as instruments, H'H and the cross-products of
+    X with H are built once; only the spatial lag of each y is column
+    specific.
+
+    Parameters
+    ----------
+    y            : array
+                   nxm array with one dependent variable per column
+    x            : array
+                   Two dimensional array with n rows and one column for each
+                   independent (exogenous) variable, excluding the constant
+    yend         : array
+                   Two dimensional array with n rows and one column for each
+                   endogenous variable
+    q            : array
+                   Two dimensional array with n rows and one column for each
+                   external exogenous variable to use as instruments (note:
+                   this should not contain any variables from x)
+    w            : pysal W object
+                   Spatial weights object
+    w_lags       : integer
+                   Orders of W to include as instruments for the spatially
+                   lagged dependent variable
+    lag_q        : boolean
+                   If True, then include spatial lags of the additional
+                   instruments (q).
+    sig2n_k      : boolean
+                   If True, then use n-k to estimate sigma^2. If False, use n.
+    name_y       : list of strings
+                   Names of the dependent variables for use in output
+    name_x       : list of strings
+                   Names of independent variables for use in output
+    name_yend    : list of strings
+                   Names of endogenous variables for use in output
+    name_q       : list of strings
+                   Names of instruments for use in output
+    name_w       : string
+                   Name of weights matrix for use in output
+    name_ds      : string
+                   Name of dataset for use in output
+
+    Attributes
+    ----------
+    rho          : array
+                   Spatial autoregressive coefficient of each regression
+    std_err      : array
+                   kxm array of standard errors of the betas
+    z_stat       : array
+                   kxmx2 array with the z-statistic and its p-value for each
+                   coefficient and dependent variable
+    pr2          : array
+                   Pseudo R squared (squared correlation between y and ypred)
+                   of each regression
+    betas, u, predy, n, k, m, h, hthi, varb, vm, utu, sig2
+                 : see :class:`BaseTSLS_Batch`
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> import pysal
+    >>> w = pysal.rook_from_shapefile(pysal.examples.get_path("columbus.shp"))
+    >>> w.transform = 'r'
+    >>> db = pysal.open(pysal.examples.get_path("columbus.dbf"),'r')
+    >>> y = np.array([db.by_col("HOVAL"), db.by_col("CRIME")]).T
+    >>> X = np.array([db.by_col("INC")]).T
+    >>> reg = GM_Lag_Batch(y, X, w=w, w_lags=2)
+    >>> np.around(reg.rho, 4)
+    array([ 0.1851,  0.431 ])
+    >>> single = pysal.spreg.GM_Lag(y[:, :1], X, w=w, w_lags=2)
+    >>> np.allclose(reg.betas[:, :1], single.betas)
+    True
+    """
+
+    def __init__(self, y, x, yend=None, q=None, w=None, w_lags=1,
+                 lag_q=True, sig2n_k=False, name_y=None, name_x=None,
+                 name_yend=None, name_q=None, name_w=None, name_ds=None):
+        n = USER.check_arrays(x, yend, q)
+        _check_y_batch(y, n)
+        USER.check_weights(w, y, w_required=True)
+        if yend is not None:
+            lag_vars = np.hstack((x, q)) if lag_q else x
+            q2 = np.hstack((q, get_lags(w, lag_vars, w_lags)))
+        else:
+            q2 = get_lags(w, x, w_lags)
+        x_constant = USER.check_constant(x)
+        BaseTSLS_Batch.__init__(self, y=y, x=x_constant, yend=yend, q=q2,
+                                yend_m=w.sparse * y, sig2n_k=sig2n_k)
+        self.rho = self.betas[-1]
+        self.title = "SPATIAL TWO STAGE LEAST SQUARES - BATCH"
+        self.name_ds = USER.set_name_ds(name_ds)
+        self.name_y = _set_name_y_batch(name_y, self.m)
+        self.name_x = USER.set_name_x(name_x, x)
+        self.name_yend = USER.set_name_yend(name_yend, yend)
+        self.name_yend.append('W_dep_var')
+        self.name_z = self.name_x + self.name_yend
+        self.name_q = USER.set_name_q(name_q, q)
+        self.name_q.extend(
+            USER.set_name_q_sp(self.name_x, w_lags, self.name_q, lag_q))
+        self.name_h = USER.set_name_h(self.name_x, self.name_q)
+        self.name_w = USER.set_name_w(name_w, w)
+        _beta_diag(self)
+
+
+class BaseGM_Error_Batch(object):
+
+    """
+    GMM spatial error model for several dependent variables sharing the same
+    X and W (note: no consistency checks, diagnostics or constant added);
+    based on Kelejian and Prucha (1998, 1999) [Kelejian1998]_
+    [Kelejian1999]_.
+
+    WX, the cross-products of X and WX, and tr(W'W) are computed once. The
+    spatially filtered cross-products of each column are assembled from them
+    given its own lambda, so the filtered X is never formed.
+
+    Parameters
+    ----------
+    y            : array
+                   nxm array with one dependent variable per column
+    x            : array
+                   Two dimensional array with n rows and one column for each
+                   independent (exogenous) variable, including the constant
+    w            : Sparse matrix
+                   Spatial weights sparse matrix
+
+    Attributes
+    ----------
+    betas        : array
+                   (k+1)xm array of estimated coefficients, the last row
+                   holding lambda
+    u            : array
+                   nxm array of residuals
+    e_filtered   : array
+                   nxm array of spatially filtered residuals
+    predy        : array
+                   nxm array of predicted y values
+    n            : integer
+                   Number of observations
+    k            : integer
+                   Number of variables for which coefficients are estimated
+                   (including the constant)
+    m            : integer
+                   Number of dependent variables
+    vm           : array
+                   mxkxk array with the variance covariance matrix of the
+                   betas (excluding lambda) of each regression
+    sig2         : array
+                   Sigma squared of each regression
+    """
+
+    def __init__(self, y, x, w):
+        # 1a. OLS --> \tilde{betas}
+        ols = BaseOLS_Batch(y=y, x=x)
+        self.n, self.k = ols.x.shape
+        self.m = ols.m
+        self.x = ols.x
+        self.y = ols.y
+        # 1b. GMM --> \tilde{\lambda1}
+        lambdas = np.array([float(optim_moments(moments))
+                            for moments in _momentsGM_Error_Batch(w, ols.u)])
+        # 2a. OLS -->\hat{betas} from the filtered cross-products
+        wx = w * x
+        wy = w * y
+        xwx = np.dot(x.T, wx)
+        xsxs = ols.xtx - lambdas[:, None, None] * (xwx + xwx.T) + \
+            (lambdas ** 2)[:, None, None] * np.dot(wx.T, wx)
+        xsys = np.dot(x.T, y) - lambdas * (np.dot(wx.T, y) + np.dot(x.T, wy)) + \
+            lambdas ** 2 * np.dot(wx.T, wy)
+        xsxsi = la.inv(xsxs)
+        betas = np.einsum('jkl,lj->kj', xsxsi, xsys)
+        # Output
+        self.predy = np.dot(self.x, betas)
+        self.u = y - self.predy
+        self.betas = np.vstack((betas, lambdas))
+        self.e_filtered = self.u - lambdas * (w * self.u)
+        self.sig2 = (self.e_filtered ** 2).sum(0) / self.n
+        self.vm = self.sig2[:, None, None] * xsxsi
+
+    @property
+    def mean_y(self):
+        return self.y.mean(0)
+
+    @property
+    def std_y(self):
+        return self.y.std(0, ddof=1)
+
+
+class GM_Error_Batch(BaseGM_Error_Batch):
+
+    """
+    GMM spatial error model for several dependent variables sharing the same
+    X and W, with per-column results and diagnostics; based on Kelejian and
+    Prucha (1998, 1999) [Kelejian1998]_ [Kelejian1999]_.
+
+    Parameters
+    ----------
+    y            : array
+                   nxm array with one dependent variable per column
+    x            : array
+                   Two dimensional array with n rows and one column for each
+                   independent (exogenous) variable, excluding the constant
+    w            : pysal W object
+                   Spatial weights object
+    name_y       : list of strings
+                   Names of the dependent variables for use in output
+    name_x       : list of strings
+                   Names of independent variables for use in output
+    name_w       : string
+                   Name of weights matrix for use in output
+    name_ds      : string
+                   Name of dataset for use in output
+
+    Attributes
+    ----------
+    std_err      : array
+                   kxm array of standard errors of the betas (excluding
+                   lambda)
+    z_stat       : array
+                   kxmx2 array with the z-statistic and its p-value for each
+                   coefficient (excluding lambda) and dependent variable
+    pr2          : array
+                   Pseudo R squared (squared correlation between y and ypred)
+                   of each regression
+    betas, u, e_filtered, predy, n, k, m, vm, sig2
+                 : see :class:`BaseGM_Error_Batch`
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> import pysal
+    >>> db = pysal.open(pysal.examples.get_path("columbus.dbf"),'r')
+    >>> y = np.array([db.by_col("HOVAL"), db.by_col("CRIME")]).T
+    >>> x = np.array([db.by_col('INC'), db.by_col('DISCBD')]).T
+    >>> w = pysal.open(pysal.examples.get_path("columbus.gal"), 'r').read()
+    >>> w.transform = 'r'
+    >>> model = GM_Error_Batch(y, x, w)
+    >>> single = pysal.spreg.GM_Error(y[:, 1:], x, w)
+    >>> np.allclose(model.betas[:, 1:], single.betas)
+    True
+    """
+
+    def __init__(self, y, x, w, name_y=None, name_x=None, name_w=None,
+                 name_ds=None):
+        n = USER.check_arrays(x)
+        _check_y_batch(y, n)
+        USER.check_weights(w, y, w_required=True)
+        x_constant = USER.check_constant(x)
+        BaseGM_Error_Batch.__init__(self, y=y, x=x_constant, w=w.sparse)
+        self.title = "SPATIALLY WEIGHTED LEAST SQUARES - BATCH"
+        self.name_ds = USER.set_name_ds(name_ds)
+        self.name_y = _set_name_y_batch(name_y, self.m)
+        self.name_x = USER.set_name_x(name_x, x)
+        self.name_x.append('lambda')
+        self.name_w = USER.set_name_w(name_w, w)
+        _beta_diag(self)
+
+
+def _momentsGM_Error_Batch(w, u):
+    """
+    Moments of the GM error model (see error_sp._momentsGM_Error) for every
+    column of u, sharing tr(W'W)
+    """
+    n = w.shape[0]
+    wu = w * u
+    wwu = w * wu
+    u2 = (u * u).sum(0)
+    uwu = (u * wu).sum(0)
+    wu2 = (wu * wu).sum(0)
+    uwwu = (u * wwu).sum(0)
+    wwu2 = (wwu * wwu).sum(0)
+    wuwwu = (wu * wwu).sum(0)
+    trWtW = np.sum(_get_WtW(w).diagonal())
+    moments = []
+    for j in range(u.shape[1]):
+        g = np.array([[u2[j], wu2[j], uwu[j]]]).T / n
+        G = np.array(
+            [[2 * uwu[j], -wu2[j], n], [2 * wuwwu[j], -wwu2[j], trWtW],
+             [uwwu[j] + wu2[j], -wuwwu[j], 0.]]) / n
+        moments.append([G, g])
+    return moments
+
+
+def _set_sig2(reg, sig2n_k):
+    reg.utu = (reg.u ** 2).sum(0)
+    reg.sig2n = reg.utu / reg.n
+    reg.sig2n_k = reg.utu / (reg.n - reg.k)
+    if sig2n_k:
+        reg.sig2 = reg.sig2n_k
+    else:
+        reg.sig2 = reg.sig2n
+
+
+def _std_err(reg):
+    """kxm standard errors from the mxkxk variance-covariance matrices"""
+    return np.sqrt(np.diagonal(reg.vm, axis1=1, axis2=2)).T
+
+
+def _t_stat(reg, df=None):
+    """
+    kxmx2 array of t-statistics and p-values; normal p-values (z-statistic)
+    if df is None
+    """
+    ts = reg.betas[:reg.std_err.shape[0]] / reg.std_err
+    if df is None:
+        p = stats.norm.sf(np.abs(ts)) * 2
+    else:
+        p = stats.t.sf(np.abs(ts), df) * 2
+    return np.dstack((ts, p))
+
+
+def _beta_diag(reg):
+    reg.std_err = _std_err(reg)
+    reg.z_stat = _t_stat(reg)
+    yc = reg.y - reg.mean_y
+    pc = reg.predy - reg.predy.mean(0)
+    reg.pr2 = (yc * pc).sum(0) ** 2 / ((yc ** 2).sum(0) * (pc ** 2).sum(0))
+
+
+def _check_y_batch(y, n):
+    """
+    Check that y is an nxm array of finite values
+
+    Parameters
+    ----------
+    y       : anything
+              Object passed by the user to a batch regression class
+    n       : int
+              number of observations
+    """
+    if not isinstance(y, np.ndarray):
+        raise Exception, "y must be a numpy array"
+    if y.ndim != 2 or y.shape[0] != n:
+        raise Exception, "y must be a two dimensional array with n rows"
+    if not np.isfinite(y).all():
+        raise Exception, "y contains missing or infinite values"
+
+
+def _set_name_y_batch(name_y, m):
+    if not name_y:
+        return ['dep_var_' + str(j + 1) for j in range(m)]
+    if len(name_y) != m:
+        raise Exception, "name_y must have one name per column of y"
+    return list(name_y)
+
+
+def _test():
+    import doctest
+    start_suppress = np.get_printoptions()['suppress']
+    np.set_printoptions(suppress=True)
+    doctest.testmod()
+    np.set_printoptions(suppress=start_suppress)
+
+if __name__ == '__main__':
+    _test()
@@ -3,7 +3,7 @@ Spatial diagnostics module
 """
 __author__ = "Luc Anselin luc.anselin@asu.edu, Daniel Arribas-Bel darribas@asu.edu"
 
-from utils import spdot
+from utils import spdot, get_A2_hom
 from scipy.stats import chi2
 chisqprob = chi2.sf
 from scipy.stats import norm
@@ -451,6 +451,12 @@ class spDcache:
     trA         : float
                   Trace of A as in Cliff & Ord (1981)
 
+    Notes
+    -----
+    Pieces that only depend on the weights, such as T and the symmetric
+    part of W used in AB, are cached with w and shared by every regression
+    using it; only the pieces involving the regression are computed here.
+
     """
 
     def __init__(self, reg, w):
@@ -493,8 +499,7 @@ class spDcache:
     @property
     def t(self):
         if 't' not in self._cache:
-            prod = (self.w.sparse.T + self.w.sparse) * self.w.sparse
-            self._cache['t'] = np.sum(prod.diagonal())
+            self._cache['t'] = self.w.trcWtW_WW
         return self._cache['t']
 
     @property
@@ -511,7 +516,7 @@ class spDcache:
         Computes A and B matrices as in Cliff-Ord 1981, p. 203
         """
         if 'AB' not in self._cache:
-            U = (self.w.sparse + self.w.sparse.T) / 2.
+            U = get_A2_hom(self.w.sparse)
             z = spdot(U, self.reg.x, array_out=False)
             c1 = spdot(self.reg.x.T, z, array_out=False)
             c2 = spdot(z.T, z, array_out=False)
@@ -780,6 +780,12 @@ class GM_Combo(BaseGM_Combo):
     lag_q        : boolean
                    If True, then include spatial lags of the additional 
                    instruments (q).
+    inv_method   : string
+                   If "power_exp", then compute inverse using the power
+                   expansion. If "true_inv", then compute the true inverse.
+                   Note that true_inv will fail for large n. If "lu",
+                   "gmres" or "bicgstab", then solve the sparse system
+                   (see utils.sparse_solve).
     vm           : boolean
                    If True, include variance-covariance matrix in summary
                    results
@@ -983,7 +989,7 @@ class GM_Combo(BaseGM_Combo):
     """
 
     def __init__(self, y, x, yend=None, q=None,
-                 w=None, w_lags=1, lag_q=True,
+                 w=None, w_lags=1, lag_q=True, inv_method='power_exp',
                  vm=False, name_y=None, name_x=None,
                  name_yend=None, name_q=None,
                  name_w=None, name_ds=None):
@@ -998,7 +1004,8 @@ class GM_Combo(BaseGM_Combo):
             w_lags=w_lags, lag_q=lag_q)
         self.rho = self.betas[-2]
         self.predy_e, self.e_pred, warn = sp_att(w, self.y,
-                                                 self.predy, yend2[:, -1].reshape(self.n, 1), self.rho)
+                                                 self.predy, yend2[:, -1].reshape(self.n, 1), self.rho,
+                                                 inv_method=inv_method)
         set_warn(self, warn)
         self.title = "SPATIALLY WEIGHTED TWO STAGE LEAST SQUARES"
         self.name_ds = USER.set_name_ds(name_ds)
@@ -384,7 +384,9 @@ class BaseGM_Endog_Error_Het(RegressionPropsY):
     inv_method   : string
                    If "power_exp", then compute inverse using the power
                    expansion. If "true_inv", then compute the true inverse.
-                   Note that true_inv will fail for large n.
+                   Note that true_inv will fail for large n. If "lu",
+                   "gmres" or "bicgstab", then solve the sparse system
+                   (see utils.sparse_solve).
 
 
     Attributes
@@ -550,7 +552,9 @@ class GM_Endog_Error_Het(BaseGM_Endog_Error_Het):
     inv_method   : string
                    If "power_exp", then compute inverse using the power
                    expansion. If "true_inv", then compute the true inverse.
-                   Note that true_inv will fail for large n.
+                   Note that true_inv will fail for large n. If "lu",
+                   "gmres" or "bicgstab", then solve the sparse system
+                   (see utils.sparse_solve).
     vm           : boolean
                    If True, include variance-covariance matrix in summary
                    results
@@ -804,7 +808,9 @@ class BaseGM_Combo_Het(BaseGM_Endog_Error_Het):
     inv_method   : string
                    If "power_exp", then compute inverse using the power
                    expansion. If "true_inv", then compute the true inverse.
-                   Note that true_inv will fail for large n.
+                   Note that true_inv will fail for large n. If "lu",
+                   "gmres" or "bicgstab", then solve the sparse system
+                   (see utils.sparse_solve).
 
 
     Attributes
@@ -951,7 +957,9 @@ class GM_Combo_Het(BaseGM_Combo_Het):
     inv_method   : string
                    If "power_exp", then compute inverse using the power
                    expansion. If "true_inv", then compute the true inverse.
-                   Note that true_inv will fail for large n.
+                   Note that true_inv will fail for large n. If "lu",
+                   "gmres" or "bicgstab", then solve the sparse system
+                   (see utils.sparse_solve).
     vm           : boolean
                    If True, include variance-covariance matrix in summary
                    results
@@ -1174,7 +1182,8 @@ class GM_Combo_Het(BaseGM_Combo_Het):
                                   epsilon=epsilon, inv_method=inv_method)
         self.rho = self.betas[-2]
         self.predy_e, self.e_pred, warn = UTILS.sp_att(w, self.y, self.predy,
-                                                       yend2[:, -1].reshape(self.n, 1), self.rho)
+                                                       yend2[:, -1].reshape(self.n, 1), self.rho,
+                                                       inv_method=inv_method)
         UTILS.set_warn(self, warn)
         self.title = "SPATIALLY WEIGHTED TWO STAGE LEAST SQUARES (HET)"
         self.name_ds = USER.set_name_ds(name_ds)
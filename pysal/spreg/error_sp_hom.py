@@ -15,6 +15,7 @@ from utils import power_expansion, set_endog, iter_msg, sp_att
 from utils import get_A1_hom, get_A2_hom, get_A1_het, optim_moments
 from utils import get_spFilter, get_lags, _moments2eqs
 from utils import spdot, RegressionPropsY, set_warn
+from w_utils import sparse_cache
 import twosls as TSLS
 import user_output as USER
 import summary_output as SUMMARY
@@ -961,6 +962,12 @@ class GM_Combo_Hom(BaseGM_Combo_Hom):
                    al. If A1='hom', then as in Anselin (2011).  If
                    A1='hom_sc' (default), then as in Drukker, Egger and Prucha (2010)
                    and Drukker, Prucha and Raciborski (2010).
+    inv_method   : string
+                   If "power_exp", then compute inverse using the power
+                   expansion. If "true_inv", then compute the true inverse.
+                   Note that true_inv will fail for large n. If "lu",
+                   "gmres" or "bicgstab", then solve the sparse system
+                   (see utils.sparse_solve).
     vm           : boolean
                    If True, include variance-covariance matrix in summary
                    results
@@ -1164,6 +1171,7 @@ class GM_Combo_Hom(BaseGM_Combo_Hom):
     def __init__(self, y, x, yend=None, q=None,
                  w=None, w_lags=1, lag_q=True,
                  max_iter=1, epsilon=0.00001, A1='hom_sc',
+                 inv_method='power_exp',
                  vm=False, name_y=None, name_x=None,
                  name_yend=None, name_q=None,
                  name_w=None, name_ds=None):
@@ -1179,7 +1187,8 @@ class GM_Combo_Hom(BaseGM_Combo_Hom):
             max_iter=max_iter, epsilon=epsilon)
         self.rho = self.betas[-2]
         self.predy_e, self.e_pred, warn = sp_att(w, self.y, self.predy,
-                                                 yend2[:, -1].reshape(self.n, 1), self.rho)
+                                                 yend2[:, -1].reshape(self.n, 1), self.rho,
+                                                 inv_method=inv_method)
         set_warn(self, warn)
         self.title = "SPATIALLY WEIGHTED TWO STAGE LEAST SQUARES (HOM)"
         self.name_ds = USER.set_name_ds(name_ds)
@@ -1281,13 +1290,18 @@ def get_vc_hom(w, wA1, wA2, reg, lambdapar, z_s=None, for_omegaOLS=False):
     mu3 = np.sum(u_s ** 3) / n
     mu4 = np.sum(u_s ** 4) / n
 
-    tr11 = wA1 * wA1
-    tr11 = np.sum(tr11.diagonal())
-    tr12 = wA1 * (wA2 * 2)
-    tr12 = np.sum(tr12.diagonal())
-    tr22 = wA2 * wA2 * 2
-    tr22 = np.sum(tr22.diagonal())
-    vecd1 = np.array([wA1.diagonal()]).T
+    # tr(AB) = sum(A * B'); the traces of squares only depend on the
+    # weights, so they are shared across models
+    cache = sparse_cache(wA1)
+    if 'vc_hom' not in cache:
+        cache['vc_hom'] = (np.sum(wA1.multiply(wA1.T)),
+                           np.array([wA1.diagonal()]).T)
+    tr11, vecd1 = cache['vc_hom']
+    cache = sparse_cache(wA2)
+    if 'vc_hom' not in cache:
+        cache['vc_hom'] = np.sum(wA2.multiply(wA2.T)) * 2
+    tr22 = cache['vc_hom']
+    tr12 = np.sum(wA1.multiply(wA2.T)) * 2
 
     psi11 = 2 * sig2 ** 2 * tr11 + \
         (mu4 - 3 * sig2 ** 2) * np.dot(vecd1.T, vecd1)
@@ -5,7 +5,6 @@ Spatial Error Models with regimes module
 __author__ = "Luc Anselin luc.anselin@asu.edu, Pedro V. Amaral pedro.amaral@asu.edu"
 
 import numpy as np
-import multiprocessing as mp
 import regimes as REGI
 import user_output as USER
 import summary_output as SUMMARY
@@ -16,7 +15,6 @@ from error_sp import BaseGM_Error, BaseGM_Endog_Error, _momentsGM_Error
 from utils import set_endog, iter_msg, sp_att, set_warn
 from utils import optim_moments, get_spFilter, get_lags
 from utils import spdot, RegressionPropsY
-from platform import system
 
 
 class GM_Error_Regimes(RegressionPropsY, REGI.Regimes_Frame):
@@ -58,8 +56,9 @@ class GM_Error_Regimes(RegressionPropsY, REGI.Regimes_Frame):
     vm           : boolean
                    If True, include variance-covariance matrix in summary
                    results
-    cores        : boolean
-                   Specifies if multiprocessing is to be used
+    cores        : boolean or integer
+                   Specifies if multiprocessing is to be used; True uses every
+                   available CPU and an integer sets the number of processes
                    Default: no multiprocessing, cores = False
                    Note: Multiprocessing may not work on all platforms.
     name_y       : string
@@ -336,26 +335,9 @@ class GM_Error_Regimes(RegressionPropsY, REGI.Regimes_Frame):
                              cols2regi, vm, name_x):
         regi_ids = dict(
             (r, list(np.where(np.array(regimes) == r)[0])) for r in self.regimes_set)
-        results_p = {}
-        """
-        for r in self.regimes_set:
-            if system() == 'Windows':
-                results_p[r] = _work_error(*(y,x,regi_ids,r,w,self.name_ds,self.name_y,name_x+['lambda'],self.name_w,self.name_regimes))
-                is_win = True
-            else:
-                pool = mp.Pool(cores)                
-                results_p[r] = pool.apply_async(_work_error,args=(y,x,regi_ids,r,w,self.name_ds,self.name_y,name_x+['lambda'],self.name_w,self.name_regimes, ))
-                is_win = False
-        """
-        for r in self.regimes_set:
-            if cores:
-                pool = mp.Pool(None)
-                results_p[r] = pool.apply_async(_work_error, args=(
-                    y, x, regi_ids, r, w, self.name_ds, self.name_y, name_x + ['lambda'], self.name_w, self.name_regimes, ))
-            else:
-                results_p[r] = _work_error(
-                    *(y, x, regi_ids, r, w, self.name_ds, self.name_y, name_x + ['lambda'], self.name_w, self.name_regimes))
-
+        results = REGI.regimes_map(_work_error, regi_ids, cores, w=w, args=(
+            self.name_ds, self.name_y, name_x + ['lambda'], self.name_w, self.name_regimes),
+            y=y, x=x)
         self.kryd = 0
         self.kr = len(cols2regi)
         self.kf = 0
@@ -365,30 +347,9 @@ class GM_Error_Regimes(RegressionPropsY, REGI.Regimes_Frame):
         self.u = np.zeros((self.n, 1), float)
         self.predy = np.zeros((self.n, 1), float)
         self.e_filtered = np.zeros((self.n, 1), float)
-        """
-        if not is_win:
-            pool.close()
-            pool.join()
-        """
-        if cores:
-            pool.close()
-            pool.join()
-
-        results = {}
         self.name_y, self.name_x = [], []
         counter = 0
         for r in self.regimes_set:
-            """
-            if is_win:
-                results[r] = results_p[r]
-            else:
-                results[r] = results_p[r].get()
-            """
-            if not cores:
-                results[r] = results_p[r]
-            else:
-                results[r] = results_p[r].get()
-
             self.vm[(counter * self.kr):((counter + 1) * self.kr),
                     (counter * self.kr):((counter + 1) * self.kr)] = results[r].vm
             self.betas[
@@ -452,8 +413,9 @@ class GM_Endog_Error_Regimes(RegressionPropsY, REGI.Regimes_Frame):
     vm           : boolean
                    If True, include variance-covariance matrix in summary
                    results
-    cores        : boolean
-                   Specifies if multiprocessing is to be used
+    cores        : boolean or integer
+                   Specifies if multiprocessing is to be used; True uses every
+                   available CPU and an integer sets the number of processes
                    Default: no multiprocessing, cores = False
                    Note: Multiprocessing may not work on all platforms.
     name_y       : string
@@ -787,26 +749,9 @@ class GM_Endog_Error_Regimes(RegressionPropsY, REGI.Regimes_Frame):
             cols2regi += [True]
             self.predy_e = np.zeros((self.n, 1), float)
             self.e_pred = np.zeros((self.n, 1), float)
-        results_p = {}
-        for r in self.regimes_set:
-            """
-            if system() == 'Windows':
-                results_p[r] = _work_endog_error(*(y,x,yend,q,regi_ids,r,w,self.name_ds,self.name_y,name_x,name_yend,name_q,self.name_w,self.name_regimes,add_lag))
-                is_win = True
-            else:
-                pool = mp.Pool(cores)        
-                results_p[r] = pool.apply_async(_work_endog_error,args=(y,x,yend,q,regi_ids,r,w,self.name_ds,self.name_y,name_x,name_yend,name_q,self.name_w,self.name_regimes,add_lag, ))
-                is_win = False
-            """
-        for r in self.regimes_set:
-            if cores:
-                pool = mp.Pool(None)
-                results_p[r] = pool.apply_async(_work_endog_error, args=(
-                    y, x, yend, q, regi_ids, r, w, self.name_ds, self.name_y, name_x, name_yend, name_q, self.name_w, self.name_regimes, add_lag, ))
-            else:
-                results_p[r] = _work_endog_error(
-                    *(y, x, yend, q, regi_ids, r, w, self.name_ds, self.name_y, name_x, name_yend, name_q, self.name_w, self.name_regimes, add_lag))
-
+        results = REGI.regimes_map(_work_endog_error, regi_ids, cores, w=w, args=(
+            self.name_ds, self.name_y, name_x, name_yend, name_q, self.name_w, self.name_regimes, add_lag),
+            y=y, x=x, yend=yend, q=q)
         self.kryd, self.kf = 0, 0
         self.kr = len(cols2regi)
         self.nr = len(self.regimes_set)
@@ -815,31 +760,10 @@ class GM_Endog_Error_Regimes(RegressionPropsY, REGI.Regimes_Frame):
         self.u = np.zeros((self.n, 1), float)
         self.predy = np.zeros((self.n, 1), float)
         self.e_filtered = np.zeros((self.n, 1), float)
-        """
-        if not is_win:
-            pool.close()
-            pool.join()
-        """
-        if cores:
-            pool.close()
-            pool.join()
-
-        results = {}
         self.name_y, self.name_x, self.name_yend, self.name_q, self.name_z, self.name_h = [
         ], [], [], [], [], []
         counter = 0
         for r in self.regimes_set:
-            """
-            if is_win:
-                results[r] = results_p[r]
-            else:
-                results[r] = results_p[r].get()
-            """
-            if not cores:
-                results[r] = results_p[r]
-            else:
-                results[r] = results_p[r].get()
-
             self.vm[(counter * self.kr):((counter + 1) * self.kr),
                     (counter * self.kr):((counter + 1) * self.kr)] = results[r].vm
             self.betas[
@@ -923,8 +847,9 @@ class GM_Combo_Regimes(GM_Endog_Error_Regimes, REGI.Regimes_Frame):
     vm           : boolean
                    If True, include variance-covariance matrix in summary
                    results
-    cores        : boolean
-                   Specifies if multiprocessing is to be used
+    cores        : boolean or integer
+                   Specifies if multiprocessing is to be used; True uses every
+                   available CPU and an integer sets the number of processes
                    Default: no multiprocessing, cores = False
                    Note: Multiprocessing may not work on all platforms.
     name_y       : string
@@ -1260,10 +1185,11 @@ class GM_Combo_Regimes(GM_Endog_Error_Regimes, REGI.Regimes_Frame):
             SUMMARY.GM_Combo(reg=self, w=w, vm=vm, regimes=True)
 
 
-def _work_error(y, x, regi_ids, r, w, name_ds, name_y, name_x, name_w, name_regimes):
-    w_r, warn = REGI.w_regime(w, regi_ids[r], r, transform=True)
-    y_r = y[regi_ids[r]]
-    x_r = x[regi_ids[r]]
+def _work_error(regime, name_ds, name_y, name_x, name_w, name_regimes):
+    r = regime.r
+    w_r, warn = regime.w_regime(transform=True)
+    y_r = regime.y
+    x_r = regime.x
     x_constant = USER.check_constant(x_r)
     model = BaseGM_Error(y_r, x_constant, w_r.sparse)
     set_warn(model, warn)
@@ -1277,15 +1203,12 @@ def _work_error(y, x, regi_ids, r, w, name_ds, name_y, name_x, name_w, name_regi
     return model
 
 
-def _work_endog_error(y, x, yend, q, regi_ids, r, w, name_ds, name_y, name_x, name_yend, name_q, name_w, name_regimes, add_lag):
-    w_r, warn = REGI.w_regime(w, regi_ids[r], r, transform=True)
-    y_r = y[regi_ids[r]]
-    x_r = x[regi_ids[r]]
-    if yend is not None:
-        yend_r = yend[regi_ids[r]]
-        q_r = q[regi_ids[r]]
-    else:
-        yend_r, q_r = None, None
+def _work_endog_error(regime, name_ds, name_y, name_x, name_yend, name_q, name_w, name_regimes, add_lag):
+    r = regime.r
+    w_r, warn = regime.w_regime(transform=True)
+    y_r = regime.y
+    x_r = regime.x
+    yend_r, q_r = regime.yend, regime.q
     if add_lag != False:
         yend_r, q_r = set_endog(
             y_r, x_r, w_r, yend_r, q_r, add_lag[0], add_lag[1])
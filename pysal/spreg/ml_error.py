@@ -16,7 +16,7 @@ import diagnostics as DIAG
 import user_output as USER
 import summary_output as SUMMARY
 import regimes as REGI
-from w_utils import symmetrize
+from w_utils import symmetrize, logdet
 try:
     from scipy.optimize import minimize_scalar
     minimize_scalar_available = True
@@ -46,11 +46,18 @@ class BaseML_Error(RegressionPropsY, RegressionPropsVM, REGI.Regimes_Frame):
                    if 'full', brute force calculation (full matrix expressions)
                    if 'ord', Ord eigenvalue calculation
                    if 'LU', LU decomposition for sparse matrices
+                   if 'cheb', Chebyshev approximation of the log determinant
+                   if 'mc', Monte Carlo approximation of the log determinant
+                   if 'grid', spline interpolation of sparse LU log determinants
     epsilon      : float
                    tolerance criterion in mimimize_scalar function and inverse_product
     regimes_att  : dictionary
                    Dictionary containing elements to be used in case of a regimes model,
                    i.e. 'x' before regimes, 'regimes' list and 'cols2regi'
+    seed         : int
+                   seed of the stochastic traces of the 'cheb' and 'mc'
+                   approximations; if None, drawn from numpy's global
+                   random state
 
 
     Attributes
@@ -154,7 +161,8 @@ class BaseML_Error(RegressionPropsY, RegressionPropsVM, REGI.Regimes_Frame):
 
     """
 
-    def __init__(self, y, x, w, method='full', epsilon=0.0000001, regimes_att=None):
+    def __init__(self, y, x, w, method='full', epsilon=0.0000001, regimes_att=None,
+                 seed=None):
         # set up main regression variables and spatial filters
         self.y = y
         if regimes_att:
@@ -173,7 +181,7 @@ class BaseML_Error(RegressionPropsY, RegressionPropsVM, REGI.Regimes_Frame):
 
         # call minimizer using concentrated log-likelihood to get lambda
         methodML = method.upper()
-        if methodML in ['FULL', 'LU', 'ORD']:
+        if methodML in ['FULL', 'LU', 'ORD', 'CHEB', 'MC', 'GRID']:
             if methodML == 'FULL':  
                 W = w.full()[0]      # need dense here
                 res = minimize_scalar(err_c_loglik, 0.0, bounds=(-1.0, 1.0),
@@ -203,6 +211,17 @@ class BaseML_Error(RegressionPropsY, RegressionPropsVM, REGI.Regimes_Frame):
                     args=(self.n, self.y, ylag, self.x,
                           xlag, evals), method='bounded',
                     tol=epsilon)
+            else:
+                W = w.sparse
+                # the grid is exact, only the traces are stochastic
+                kwargs = {}
+                if seed is not None and methodML != 'GRID':
+                    kwargs['seed'] = seed
+                ld = logdet(w, methodML, **kwargs)
+                res = minimize_scalar(err_c_loglik_ld, 0.0, bounds=(-1.0, 1.0),
+                                      args=(self.n, self.y, ylag,
+                                            self.x, xlag, ld),
+                                      method='bounded', tol=epsilon)
         else:
             raise Exception("{0} is an unsupported method".format(method))
 
@@ -298,8 +317,15 @@ class ML_Error(BaseML_Error):
                    if 'full', brute force calculation (full matrix expressions)
                    if 'ord', Ord eigenvalue method
                    if 'LU', LU sparse matrix decomposition
+                   if 'cheb', Chebyshev approximation of the log determinant
+                   if 'mc', Monte Carlo approximation of the log determinant
+                   if 'grid', spline interpolation of sparse LU log determinants
     epsilon      : float
                    tolerance criterion in mimimize_scalar function and inverse_product
+    seed         : int
+                   seed of the stochastic traces of the 'cheb' and 'mc'
+                   approximations; if None, drawn from numpy's global
+                   random state
     spat_diag    : boolean
                    if True, include spatial diagnostics
     vm           : boolean
@@ -445,14 +471,14 @@ class ML_Error(BaseML_Error):
 
     def __init__(self, y, x, w, method='full', epsilon=0.0000001,
                  spat_diag=False, vm=False, name_y=None, name_x=None,
-                 name_w=None, name_ds=None):
+                 name_w=None, name_ds=None, seed=None):
         n = USER.check_arrays(y, x)
         USER.check_y(y, n)
         USER.check_weights(w, y, w_required=True)
         x_constant = USER.check_constant(x)
         method = method.upper()
         BaseML_Error.__init__(self, y=y, x=x_constant,
-                              w=w, method=method, epsilon=epsilon)
+                              w=w, method=method, epsilon=epsilon, seed=seed)
         self.title = "MAXIMUM LIKELIHOOD SPATIAL ERROR" + \
             " (METHOD = " + method + ")"
         self.name_ds = USER.set_name_ds(name_ds)
@@ -509,6 +535,26 @@ def err_c_loglik_sp(lam, n, y, ylag, x, xlag, I, Wsp):
     return clik
 
 
+def err_c_loglik_ld(lam, n, y, ylag, x, xlag, ld):
+    # concentrated log-lik for error model, precomputed log determinant
+    if isinstance(lam, np.ndarray):
+        if lam.shape == (1,1):
+            lam = lam[0][0]
+    ys = y - lam * ylag
+    xs = x - lam * xlag
+    ysys = np.dot(ys.T, ys)
+    xsxs = np.dot(xs.T, xs)
+    xsxsi = np.linalg.inv(xsxs)
+    xsys = np.dot(xs.T, ys)
+    x1 = np.dot(xsxsi, xsys)
+    x2 = np.dot(xsys.T, x1)
+    ee = ysys - x2
+    sig2 = ee[0][0] / n
+    nlsig2 = (n / 2.0) * np.log(sig2)
+    # this is the negative of the concentrated log lik for minimization
+    clik = nlsig2 - ld(lam)
+    return clik
+
 def err_c_loglik_ord(lam, n, y, ylag, x, xlag, evals):
     # concentrated log-lik for error model, no constants, eigenvalues
     ys = y - lam * ylag
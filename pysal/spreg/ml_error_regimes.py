@@ -6,14 +6,12 @@ __author__ = "Luc Anselin luc.anselin@asu.edu, Pedro V. Amaral pedro.amaral@asu.
 
 import pysal
 import numpy as np
-import multiprocessing as mp
 import regimes as REGI
 import user_output as USER
 import summary_output as SUMMARY
 import diagnostics as DIAG
 from utils import set_warn
 from ml_error import BaseML_Error
-from platform import system
 
 __all__ = ["ML_Error_Regimes"]
 
@@ -54,14 +52,18 @@ class ML_Error_Regimes(BaseML_Error, REGI.Regimes_Frame):
                    if 'full', brute force calculation (full matrix expressions)
                    if 'ord', Ord eigenvalue computation
                    if 'LU', LU sparse matrix decomposition
+                   if 'cheb', Chebyshev approximation of the log determinant
+                   if 'mc', Monte Carlo approximation of the log determinant
+                   if 'grid', spline interpolation of sparse LU log determinants
     epsilon      : float
                    tolerance criterion in mimimize_scalar function and inverse_product
     regime_err_sep : boolean
                    If True, a separate regression is run for each regime.
     regime_lag_sep : boolean
                    Always False, kept for consistency in function call, ignored.
-    cores        : boolean
-                   Specifies if multiprocessing is to be used
+    cores        : boolean or integer
+                   Specifies if multiprocessing is to be used; True uses every
+                   available CPU and an integer sets the number of processes
                    Default: no multiprocessing, cores = False
                    Note: Multiprocessing may not work on all platforms.
     spat_diag    : boolean
@@ -116,6 +118,9 @@ class ML_Error_Regimes(BaseML_Error, REGI.Regimes_Frame):
                    if 'full': brute force (full matrix computations)
                    if 'ord', Ord eigenvalue computation
                    if 'LU', LU sparse matrix decomposition
+                   if 'cheb', Chebyshev approximation of the log determinant
+                   if 'mc', Monte Carlo approximation of the log determinant
+                   if 'grid', spline interpolation of sparse LU log determinants
     epsilon      : float
                    tolerance criterion used in minimize_scalar function and inverse_product
     mean_y       : float
@@ -329,26 +334,9 @@ class ML_Error_Regimes(BaseML_Error, REGI.Regimes_Frame):
 
         regi_ids = dict(
             (r, list(np.where(np.array(regimes) == r)[0])) for r in self.regimes_set)
-        results_p = {}
-        """
-        for r in self.regimes_set:
-            if system() == 'Windows':
-                is_win = True
-                results_p[r] = _work_error(*(y,x,regi_ids,r,w,method,epsilon,self.name_ds,self.name_y,name_x+['lambda'],self.name_w,self.name_regimes))
-            else:
-                pool = mp.Pool(cores)
-                results_p[r] = pool.apply_async(_work_error,args=(y,x,regi_ids,r,w,method,epsilon,self.name_ds,self.name_y,name_x+['lambda'],self.name_w,self.name_regimes, ))
-                is_win = False
-        """
-        for r in self.regimes_set:
-            if cores:
-                pool = mp.Pool(None)
-                results_p[r] = pool.apply_async(_work_error, args=(
-                    y, x, regi_ids, r, w, method, epsilon, self.name_ds, self.name_y, name_x + ['lambda'], self.name_w, self.name_regimes, ))
-            else:
-                results_p[r] = _work_error(
-                    *(y, x, regi_ids, r, w, method, epsilon, self.name_ds, self.name_y, name_x + ['lambda'], self.name_w, self.name_regimes))
-
+        results = REGI.regimes_map(_work_error, regi_ids, cores, w=w, args=(
+            method, epsilon, self.name_ds, self.name_y, name_x + ['lambda'], self.name_w, self.name_regimes),
+            y=y, x=x)
         self.kryd = 0
         self.kr = len(cols2regi) + 1
         self.kf = 0
@@ -359,29 +347,8 @@ class ML_Error_Regimes(BaseML_Error, REGI.Regimes_Frame):
         self.predy = np.zeros((self.n, 1), float)
         self.e_filtered = np.zeros((self.n, 1), float)
         self.name_y, self.name_x = [], []
-        """
-        if not is_win:
-            pool.close()
-            pool.join()
-        """
-        if cores:
-            pool.close()
-            pool.join()
-
-        results = {}
         counter = 0
         for r in self.regimes_set:
-            """
-            if is_win:
-                results[r] = results_p[r]
-            else:
-                results[r] = results_p[r].get()
-            """
-            if not cores:
-                results[r] = results_p[r]
-            else:
-                results[r] = results_p[r].get()
-
             self.vm[(counter * self.kr):((counter + 1) * self.kr),
                     (counter * self.kr):((counter + 1) * self.kr)] = results[r].vm
             self.betas[
@@ -398,10 +365,11 @@ class ML_Error_Regimes(BaseML_Error, REGI.Regimes_Frame):
             reg=self, multireg=self.multi, vm=vm, spat_diag=spat_diag, regimes=True, w=w)
 
 
-def _work_error(y, x, regi_ids, r, w, method, epsilon, name_ds, name_y, name_x, name_w, name_regimes):
-    w_r, warn = REGI.w_regime(w, regi_ids[r], r, transform=True)
-    y_r = y[regi_ids[r]]
-    x_r = x[regi_ids[r]]
+def _work_error(regime, method, epsilon, name_ds, name_y, name_x, name_w, name_regimes):
+    r = regime.r
+    w_r, warn = regime.w_regime(transform=True)
+    y_r = regime.y
+    x_r = regime.x
     x_constant = USER.check_constant(x_r)
     model = BaseML_Error(
         y=y_r, x=x_constant, w=w_r, method=method, epsilon=epsilon)
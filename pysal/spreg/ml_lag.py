@@ -16,7 +16,7 @@ from sputils import spdot, spfill_diagonal, spinv, spbroadcast
 import diagnostics as DIAG
 import user_output as USER
 import summary_output as SUMMARY
-from w_utils import symmetrize
+from w_utils import symmetrize, logdet
 try:
     from scipy.optimize import minimize_scalar
     minimize_scalar_available = True
@@ -45,8 +45,15 @@ class BaseML_Lag(RegressionPropsY, RegressionPropsVM):
                    if 'full', brute force calculation (full matrix expressions)
                    if 'ord', Ord eigenvalue method
                    if 'LU', LU sparse matrix decomposition
+                   if 'cheb', Chebyshev approximation of the log determinant
+                   if 'mc', Monte Carlo approximation of the log determinant
+                   if 'grid', spline interpolation of sparse LU log determinants
     epsilon      : float
                    tolerance criterion in mimimize_scalar function and inverse_product
+    seed         : int
+                   seed of the stochastic traces of the 'cheb' and 'mc'
+                   approximations; if None, drawn from numpy's global
+                   random state
 
     Attributes
     ----------
@@ -172,7 +179,8 @@ class BaseML_Lag(RegressionPropsY, RegressionPropsVM):
 
     """
 
-    def __init__(self, y, x, w, method='full', epsilon=0.0000001):
+    def __init__(self, y, x, w, method='full', epsilon=0.0000001,
+                 seed=None):
         # set up main regression variables and spatial filters
         self.y = y
         self.x = x
@@ -193,7 +201,7 @@ class BaseML_Lag(RegressionPropsY, RegressionPropsVM):
         e1 = ylag - spdot(x, b1)
         methodML = method.upper()
         # call minimizer using concentrated log-likelihood to get rho
-        if methodML in ['FULL', 'LU', 'ORD']:
+        if methodML in ['FULL', 'LU', 'ORD', 'CHEB', 'MC', 'GRID']:
             if methodML == 'FULL':
                 W = w.full()[0]     # moved here
                 res = minimize_scalar(lag_c_loglik, 0.0, bounds=(-1.0, 1.0),
@@ -221,6 +229,16 @@ class BaseML_Lag(RegressionPropsY, RegressionPropsVM):
                                       args=(
                                           self.n, e0, e1, evals), method='bounded',
                                       tol=epsilon)
+            else:
+                W = w.sparse
+                # the grid is exact, only the traces are stochastic
+                kwargs = {}
+                if seed is not None and methodML != 'GRID':
+                    kwargs['seed'] = seed
+                ld = logdet(w, methodML, **kwargs)
+                res = minimize_scalar(lag_c_loglik_ld, 0.0, bounds=(-1.0, 1.0),
+                                      args=(self.n, e0, e1, ld),
+                                      method='bounded', tol=epsilon)
         else:
             # program will crash, need to catch
             print("{0} is an unsupported method".format(methodML))
@@ -303,8 +321,15 @@ class ML_Lag(BaseML_Lag):
     method       : string
                    if 'full', brute force calculation (full matrix expressions)
                    if 'ord', Ord eigenvalue method
+                   if 'cheb', Chebyshev approximation of the log determinant
+                   if 'mc', Monte Carlo approximation of the log determinant
+                   if 'grid', spline interpolation of sparse LU log determinants
     epsilon      : float
                    tolerance criterion in mimimize_scalar function and inverse_product
+    seed         : int
+                   seed of the stochastic traces of the 'cheb' and 'mc'
+                   approximations; if None, drawn from numpy's global
+                   random state
     spat_diag    : boolean
                    if True, include spatial diagnostics
     vm           : boolean
@@ -540,14 +565,15 @@ class ML_Lag(BaseML_Lag):
 
     def __init__(self, y, x, w, method='full', epsilon=0.0000001,
                  spat_diag=False, vm=False, name_y=None, name_x=None,
-                 name_w=None, name_ds=None):
+                 name_w=None, name_ds=None, seed=None):
         n = USER.check_arrays(y, x)
         USER.check_y(y, n)
         USER.check_weights(w, y, w_required=True)
         x_constant = USER.check_constant(x)
         method = method.upper()
         BaseML_Lag.__init__(
-            self, y=y, x=x_constant, w=w, method=method, epsilon=epsilon)
+            self, y=y, x=x_constant, w=w, method=method, epsilon=epsilon,
+            seed=seed)
         # increase by 1 to have correct aic and sc, include rho in count
         self.k += 1
         self.title = "MAXIMUM LIKELIHOOD SPATIAL LAG" + \
@@ -588,6 +614,17 @@ def lag_c_loglik_sp(rho, n, e0, e1, I, Wsp):
     clike = nlsig2 - jacob
     return clike
 
+def lag_c_loglik_ld(rho, n, e0, e1, ld):
+    # concentrated log-lik for lag model, precomputed log determinant
+    if isinstance(rho, np.ndarray):
+        if rho.shape == (1,1):
+            rho = rho[0][0]
+    er = e0 - rho * e1
+    sig2 = np.dot(er.T, er) / n
+    nlsig2 = (n / 2.0) * np.log(sig2)
+    clike = nlsig2 - ld(rho)
+    return clike
+
 def lag_c_loglik_ord(rho, n, e0, e1, evals):
     # concentrated log-lik for lag model, no constants, Ord eigenvalue method
     er = e0 - rho * e1
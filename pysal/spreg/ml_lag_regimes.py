@@ -10,10 +10,8 @@ import regimes as REGI
 import user_output as USER
 import summary_output as SUMMARY
 import diagnostics as DIAG
-import multiprocessing as mp
 from ml_lag import BaseML_Lag
 from utils import set_warn
-from platform import system
 
 __all__ = ["ML_Lag_Regimes"]
 
@@ -54,14 +52,18 @@ class ML_Lag_Regimes(BaseML_Lag, REGI.Regimes_Frame):
                    if 'full', brute force calculation (full matrix expressions)
                    if 'ord', Ord eigenvalue method
                    if 'LU', LU sparse matrix decomposition
+                   if 'cheb', Chebyshev approximation of the log determinant
+                   if 'mc', Monte Carlo approximation of the log determinant
+                   if 'grid', spline interpolation of sparse LU log determinants
     epsilon      : float
                    tolerance criterion in mimimize_scalar function and inverse_product
     regime_lag_sep: boolean
                    If True, the spatial parameter for spatial lag is also
                    computed according to different regimes. If False (default), 
                    the spatial parameter is fixed accross regimes.
-    cores        : boolean
-                   Specifies if multiprocessing is to be used
+    cores        : boolean or integer
+                   Specifies if multiprocessing is to be used; True uses every
+                   available CPU and an integer sets the number of processes
                    Default: no multiprocessing, cores = False
                    Note: Multiprocessing may not work on all platforms.
     spat_diag    : boolean
@@ -114,6 +116,9 @@ class ML_Lag_Regimes(BaseML_Lag, REGI.Regimes_Frame):
                    if 'full': brute force (full matrix computations)
                    if 'ord', Ord eigenvalue method
                    if 'LU', LU sparse matrix decomposition
+                   if 'cheb', Chebyshev approximation of the log determinant
+                   if 'mc', Monte Carlo approximation of the log determinant
+                   if 'grid', spline interpolation of sparse LU log determinants
     epsilon      : float
                    tolerance criterion used in minimize_scalar function and inverse_product
     mean_y       : float
@@ -358,27 +363,10 @@ class ML_Lag_Regimes(BaseML_Lag, REGI.Regimes_Frame):
                              cores, cols2regi, method, epsilon,
                              spat_diag, vm, name_y, name_x,
                              name_regimes, name_w, name_ds):
-        #        pool = mp.Pool(cores)
         name_x = USER.set_name_x(name_x, x) + [USER.set_name_yend_sp(name_y)]
-        results_p = {}
-        """
-        for r in self.regimes_set:
-            if system() == 'Windows':
-                is_win = True
-                results_p[r] = _work(*(y,x,regi_ids,r,w_i[r],method,epsilon,name_ds,name_y,name_x,name_w,name_regimes))
-            else:                
-                results_p[r] = pool.apply_async(_work,args=(y,x,regi_ids,r,w_i[r],method,epsilon,name_ds,name_y,name_x,name_w,name_regimes, ))
-                is_win = False
-        """
-        for r in self.regimes_set:
-            if cores:
-                pool = mp.Pool(None)
-                results_p[r] = pool.apply_async(_work, args=(y, x, regi_ids, r, w_i[
-                                                r], method, epsilon, name_ds, name_y, name_x, name_w, name_regimes, ))
-            else:
-                results_p[r] = _work(
-                    *(y, x, regi_ids, r, w_i[r], method, epsilon, name_ds, name_y, name_x, name_w, name_regimes))
-
+        results = REGI.regimes_map(_work, regi_ids, cores, w=w, args=(
+            method, epsilon, name_ds, name_y, name_x, name_w, name_regimes),
+            y=y, x=x)
         self.kryd = 0
         self.kr = len(cols2regi) + 1
         self.kf = 0
@@ -391,29 +379,9 @@ class ML_Lag_Regimes(BaseML_Lag, REGI.Regimes_Frame):
         self.predy = np.zeros((self.n, 1), float)
         self.predy_e = np.zeros((self.n, 1), float)
         self.e_pred = np.zeros((self.n, 1), float)
-        """
-        if not is_win:
-            pool.close()
-            pool.join()
-        """
-        if cores:
-            pool.close()
-            pool.join()
-
-        results = {}
         self.name_y, self.name_x = [], []
         counter = 0
         for r in self.regimes_set:
-            """
-            if is_win:
-                results[r] = results_p[r]
-            else:
-                results[r] = results_p[r].get()
-            """
-            if not cores:
-                results[r] = results_p[r]
-            else:
-                results[r] = results_p[r].get()
             self.vm[(counter * self.kr):((counter + 1) * self.kr),
                     (counter * self.kr):((counter + 1) * self.kr)] = results[r].vm
             self.betas[
@@ -431,9 +399,11 @@ class ML_Lag_Regimes(BaseML_Lag, REGI.Regimes_Frame):
             reg=self, multireg=self.multi, vm=vm, spat_diag=spat_diag, regimes=True, w=w)
 
 
-def _work(y, x, regi_ids, r, w_r, method, epsilon, name_ds, name_y, name_x, name_w, name_regimes):
-    y_r = y[regi_ids[r]]
-    x_r = x[regi_ids[r]]
+def _work(regime, method, epsilon, name_ds, name_y, name_x, name_w, name_regimes):
+    r = regime.r
+    w_r = regime.w_regime(transform=True)[0]
+    y_r = regime.y
+    x_r = regime.x
     x_constant = USER.check_constant(x_r)
     model = BaseML_Lag(y_r, x_constant, w_r, method=method, epsilon=epsilon)
     model.title = "MAXIMUM LIKELIHOOD SPATIAL LAG - REGIME " + \
@@ -6,13 +6,11 @@ __author__ = "Luc Anselin luc.anselin@asu.edu, Pedro V. Amaral pedro.amaral@asu.
 
 import regimes as REGI
 import user_output as USER
-import multiprocessing as mp
 from ols import BaseOLS
 from utils import set_warn, spbroadcast, RegressionProps_basic, RegressionPropsY, spdot
 from robust import hac_multi
 import summary_output as SUMMARY
 import numpy as np
-from platform import system
 import scipy.sparse as SP
 
 
@@ -75,8 +73,9 @@ class OLS_Regimes(BaseOLS, REGI.Regimes_Frame, RegressionPropsY):
                    If 'all' (default), all the variables vary by regime.
     regime_err_sep  : boolean
                    If True, a separate regression is run for each regime.
-    cores        : boolean
-                   Specifies if multiprocessing is to be used
+    cores        : boolean or integer
+                   Specifies if multiprocessing is to be used; True uses every
+                   available CPU and an integer sets the number of processes
                    Default: no multiprocessing, cores = False
                    Note: Multiprocessing may not work on all platforms.
     name_y       : string
@@ -414,26 +413,8 @@ class OLS_Regimes(BaseOLS, REGI.Regimes_Frame, RegressionPropsY):
 
     def _ols_regimes_multi(self, x, w, regi_ids, cores,
                            gwk, sig2n_k, robust, nonspat_diag, spat_diag, vm, name_x, moran, white_test):
-        results_p = {}
-        """
-        for r in self.regimes_set:
-            if system() == 'Windows':
-                is_win = True
-                results_p[r] = _work(*(self.y,x,w,regi_ids,r,robust,sig2n_k,self.name_ds,self.name_y,name_x,self.name_w,self.name_regimes))
-            else:
-                pool = mp.Pool(cores)
-                results_p[r] = pool.apply_async(_work,args=(self.y,x,w,regi_ids,r,robust,sig2n_k,self.name_ds,self.name_y,name_x,self.name_w,self.name_regimes))
-                is_win = False
-        """
-        for r in self.regimes_set:
-            if cores:
-                pool = mp.Pool(None)
-                results_p[r] = pool.apply_async(_work, args=(
-                    self.y, x, w, regi_ids, r, robust, sig2n_k, self.name_ds, self.name_y, name_x, self.name_w, self.name_regimes))
-            else:
-                results_p[r] = _work(*(self.y, x, w, regi_ids, r, robust, sig2n_k,
-                                       self.name_ds, self.name_y, name_x, self.name_w, self.name_regimes))
-
+        results = REGI.regimes_map(_work, regi_ids, cores, w=w, args=(
+            robust, sig2n_k, self.name_ds, self.name_y, name_x, self.name_w, self.name_regimes), y=self.y, x=x)
         self.kryd = 0
         self.kr = x.shape[1] + 1
         self.kf = 0
@@ -442,30 +423,9 @@ class OLS_Regimes(BaseOLS, REGI.Regimes_Frame, RegressionPropsY):
         self.betas = np.zeros((self.nr * self.kr, 1), float)
         self.u = np.zeros((self.n, 1), float)
         self.predy = np.zeros((self.n, 1), float)
-        """
-        if not is_win:
-            pool.close()
-            pool.join()
-        """
-        if cores:
-            pool.close()
-            pool.join()
-
-        results = {}
         self.name_y, self.name_x = [], []
         counter = 0
         for r in self.regimes_set:
-            """
-            if is_win:
-                results[r] = results_p[r]
-            else:
-                results[r] = results_p[r].get()
-            """
-            if not cores:
-                results[r] = results_p[r]
-            else:
-                results[r] = results_p[r].get()
-
             self.vm[(counter * self.kr):((counter + 1) * self.kr),
                     (counter * self.kr):((counter + 1) * self.kr)] = results[r].vm
             self.betas[
@@ -495,9 +455,10 @@ class OLS_Regimes(BaseOLS, REGI.Regimes_Frame, RegressionPropsY):
         self.xtxi = np.linalg.inv(self.xtx)
 
 
-def _work(y, x, w, regi_ids, r, robust, sig2n_k, name_ds, name_y, name_x, name_w, name_regimes):
-    y_r = y[regi_ids[r]]
-    x_r = x[regi_ids[r]]
+def _work(regime, robust, sig2n_k, name_ds, name_y, name_x, name_w, name_regimes):
+    r = regime.r
+    y_r = regime.y
+    x_r = regime.x
     x_constant = USER.check_constant(x_r)
     if robust == 'hac':
         robust = None
@@ -509,8 +470,8 @@ def _work(y, x, w, regi_ids, r, robust, sig2n_k, name_ds, name_y, name_x, name_w
     model.name_x = ['%s_%s' % (str(r), i) for i in name_x]
     model.name_w = name_w
     model.name_regimes = name_regimes
-    if w:
-        w_r, warn = REGI.w_regime(w, regi_ids[r], r, transform=True)
+    if regime.has_w:
+        w_r, warn = regime.w_regime(transform=True)
         set_warn(model, warn)
         model.w = w_r
     return model
@@ -5,6 +5,11 @@ import itertools as iter
 from scipy.stats import f, chi2
 chisqprob = chi2.sf
 import numpy.linalg as la
+import multiprocessing as mp
+import os
+import shutil
+import tempfile
+import atexit
 from utils import spbroadcast
 
 """
@@ -671,6 +676,228 @@ def _get_weighted_var(regimes, regimes_set, sig2n_k, u, y, x, yend=None, q=None)
         return y2, x2
 
 
+# Regime-parallel execution
+#
+# Models estimated separately by regime hand every regime to a worker. The
+# variables of the model and the connectivity of W are written once per
+# model to .npy files (in /dev/shm when available) that the workers memory
+# map, so each task only carries the row indices of its regime. The pool is
+# created once and reused by every model run with the same number of cores.
+
+_POOL = [None, 0]
+_SHARED = {}
+_SHM = '/dev/shm'
+
+
+def get_cores(cores):
+    """
+    Number of worker processes requested through the 'cores' argument of
+    the regimes models: False/None/0 and 1 run sequentially, True uses
+    every available CPU and an integer sets the number of processes.
+    """
+    if cores is True:
+        return mp.cpu_count()
+    if not cores:
+        return 1
+    cores = int(cores)
+    if cores < 1:
+        raise Exception, "cores must be True, False or a positive integer"
+    return cores
+
+
+def get_pool(cores):
+    """
+    Return the process pool shared by the regimes models, creating it (or
+    replacing one with a different size) only when needed. None if 'cores'
+    asks for sequential estimation.
+    """
+    processes = get_cores(cores)
+    if processes == 1:
+        return None
+    if _POOL[0] is None or _POOL[1] != processes:
+        close_pool()
+        _POOL[0], _POOL[1] = mp.Pool(processes), processes
+    return _POOL[0]
+
+
+def close_pool():
+    """
+    Shut down the process pool shared by the regimes models
+    """
+    pool = _POOL[0]
+    _POOL[0], _POOL[1] = None, 0
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+atexit.register(close_pool)
+
+
+class Regime(object):
+
+    """
+    Observations of a single regime handed to the estimation of that regime.
+
+    Parameters
+    ----------
+    r           : string or float
+                  Regime tag
+    ids         : array
+                  Rows of the regime in the full dataset
+    arrays      : dictionary
+                  Full arrays by name (None values are kept as None)
+    pattern     : tuple
+                  (indptr, indices) with the connectivity of W in CSR form,
+                  or None if there is no W
+    w_ids       : list
+                  W ids of the regime observations
+    transform   : string
+                  Transformation of W to apply to the regime weights
+
+    Attributes
+    ----------
+    r           : string or float
+                  Regime tag
+    ids         : array
+                  Rows of the regime in the full dataset
+    has_w       : boolean
+                  True if the weights of the regime are available through
+                  w_regime
+    <name>      : array
+                  One attribute per array with the rows of the regime
+    """
+
+    def __init__(self, r, ids, arrays, pattern=None, w_ids=None,
+                 transform='O'):
+        self.r = r
+        self.ids = ids
+        for name, arr in arrays.items():
+            setattr(self, name, None if arr is None else np.array(arr[ids]))
+        self._pattern = pattern
+        self._w_ids = w_ids
+        self._transform = transform
+        self.has_w = pattern is not None
+
+    def w_regime(self, transform=True, min_n=None):
+        """
+        Subset of W for the regime, as returned by :func:`w_regime`
+        """
+        indptr, indices = self._pattern
+        ids = self.ids
+        starts = indptr[ids]
+        lens = indptr[ids + 1] - starts
+        offsets = np.cumsum(lens) - lens
+        cols = indices[np.repeat(starts - offsets, lens) +
+                       np.arange(lens.sum())]
+        local = np.searchsorted(ids, cols)
+        local[local == len(ids)] = 0
+        keep = ids[local] == cols
+        row = np.repeat(np.arange(len(ids)), lens)
+        w_ids = self._w_ids
+        neighbors = dict((i, []) for i in w_ids)
+        for i, j in zip(row[keep], local[keep]):
+            neighbors[w_ids[i]].append(w_ids[j])
+        w_regi_i = pysal.W(neighbors, id_order=list(w_ids),
+                           silent_island_warning=True)
+        if min_n:
+            if w_regi_i.n < min_n:
+                raise Exception, "There are less observations than variables in regime %s." % self.r
+        warn = None
+        if transform:
+            w_regi_i.transform = self._transform
+        if w_regi_i.islands:
+            warn = "The regimes operation resulted in islands for regime %s." % self.r
+        return w_regi_i, warn
+
+
+def regimes_map(func, regi_ids, cores=False, w=None, args=(), **arrays):
+    """
+    Estimate func on every regime, in parallel if cores asks for it.
+
+    Parameters
+    ----------
+    func        : function
+                  Module level function called as func(regime, *args) for
+                  every regime, where regime is a :class:`Regime`
+    regi_ids    : dictionary
+                  Rows of every regime, keyed by regime tag
+    cores       : boolean or integer
+                  Specifies if multiprocessing is to be used (see
+                  :func:`get_cores`)
+    w           : pysal W object
+                  Spatial weights object from which the regime weights are
+                  taken, or None
+    args        : tuple
+                  Additional arguments shared by every regime
+    arrays      : arrays
+                  Variables of the model (None if not used), passed to the
+                  workers once and sliced by regime
+
+    Returns
+    -------
+    results     : dictionary
+                  Output of func keyed by regime tag
+    """
+    pattern, w_ids, transform = None, {}, 'O'
+    if w is not None:
+        s = w.sparse
+        pattern = (s.indptr, s.indices)
+        transform = w.get_transform()
+    ids = dict((r, np.asarray(regi_ids[r], dtype=int)) for r in regi_ids)
+    if w is not None:
+        w_ids = dict((r, [w.id_order[i] for i in ids[r]]) for r in ids)
+    pool = get_pool(cores)
+    if pool is None:
+        return dict((r, func(Regime(r, ids[r], arrays, pattern, w_ids.get(r),
+                                    transform), *args)) for r in ids)
+    folder = tempfile.mkdtemp(prefix='pysal_regimes_',
+                              dir=_SHM if os.path.isdir(_SHM) else None)
+    try:
+        handle = (folder, _share(folder, arrays),
+                  _share(folder, {'indptr': pattern[0],
+                                  'indices': pattern[1]}) if pattern else None,
+                  transform)
+        results_p = dict((r, pool.apply_async(_regimes_task, args=(
+            func, handle, r, ids[r], w_ids.get(r), args))) for r in ids)
+        return dict((r, results_p[r].get()) for r in results_p)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def _share(folder, arrays):
+    paths = {}
+    for name, arr in arrays.items():
+        if arr is None:
+            paths[name] = None
+        else:
+            paths[name] = os.path.join(folder, name + '.npy')
+            np.save(paths[name], np.asarray(arr))
+    return paths
+
+
+def _attach(folder, paths):
+    if folder not in _SHARED:
+        _SHARED.clear()
+        _SHARED[folder] = {}
+    cache = _SHARED[folder]
+    for path in paths.values():
+        if path is not None and path not in cache:
+            cache[path] = np.load(path, mmap_mode='r')
+    return dict((name, None if path is None else cache[path])
+                for name, path in paths.items())
+
+
+def _regimes_task(func, handle, r, ids, w_ids, args):
+    folder, paths, w_paths, transform = handle
+    pattern = None
+    if w_paths is not None:
+        w_arrays = _attach(folder, w_paths)
+        pattern = (w_arrays['indptr'], w_arrays['indices'])
+    regime = Regime(r, ids, _attach(folder, paths), pattern, w_ids,
+                    transform)
+    return func(regime, *args)
+
+
 def _test():
     import doctest
     start_suppress = np.get_printoptions()['suppress']
@@ -0,0 +1,97 @@
+import unittest
+import pysal
+import numpy as np
+from pysal.spreg import batch as B
+from pysal.spreg.ols import OLS
+from pysal.spreg.twosls import TSLS
+from pysal.spreg.twosls_sp import GM_Lag
+from pysal.spreg.error_sp import GM_Error
+from pysal.common import RTOL
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        db = pysal.open(pysal.examples.get_path("columbus.dbf"), "r")
+        self.y = np.array([db.by_col(name) for name in
+                           ["HOVAL", "CRIME", "OPEN", "PLUMB"]]).T
+        self.x = np.array([db.by_col("INC"), db.by_col("DISCBD")]).T
+        self.yd = np.array([db.by_col("NSA")]).T
+        self.q = np.array([db.by_col("CP")]).T
+        self.w = pysal.rook_from_shapefile(
+            pysal.examples.get_path("columbus.shp"))
+        self.w.transform = 'r'
+
+    def test_ols(self):
+        reg = B.OLS_Batch(self.y, self.x, self.w, spat_diag=True,
+                          moran=True)
+        self.assertEqual(reg.betas.shape, (3, 4))
+        self.assertEqual(reg.name_y, ['dep_var_1', 'dep_var_2',
+                                      'dep_var_3', 'dep_var_4'])
+        for j in range(reg.m):
+            single = OLS(self.y[:, j:j + 1], self.x, self.w, spat_diag=True,
+                         moran=True)
+            np.testing.assert_allclose(reg.betas[:, j:j + 1], single.betas,
+                                       RTOL)
+            np.testing.assert_allclose(reg.vm[j], single.vm, RTOL)
+            np.testing.assert_allclose(reg.std_err[:, j], single.std_err,
+                                       RTOL)
+            np.testing.assert_allclose(reg.t_stat[:, j],
+                                       np.array(single.t_stat), RTOL)
+            self.assertAlmostEqual(reg.r2[j], single.r2)
+            self.assertAlmostEqual(reg.ar2[j], single.ar2)
+            np.testing.assert_allclose(reg.f_stat[j], single.f_stat, RTOL)
+            for name in ['lm_error', 'lm_lag', 'rlm_error', 'rlm_lag',
+                         'lm_sarma', 'moran_res']:
+                np.testing.assert_allclose(getattr(reg, name)[j],
+                                           getattr(single, name), RTOL)
+
+    def test_tsls(self):
+        reg = B.TSLS_Batch(self.y, self.x, self.yd, self.q)
+        for j in range(reg.m):
+            single = TSLS(self.y[:, j:j + 1], self.x, self.yd, self.q)
+            np.testing.assert_allclose(reg.betas[:, j:j + 1], single.betas,
+                                       RTOL)
+            np.testing.assert_allclose(reg.vm[j], single.vm, RTOL)
+            np.testing.assert_allclose(reg.z_stat[:, j],
+                                       np.array(single.z_stat), RTOL)
+            self.assertAlmostEqual(reg.pr2[j], single.pr2)
+
+    def test_gm_lag(self):
+        reg = B.GM_Lag_Batch(self.y, self.x, self.yd, self.q, w=self.w,
+                             w_lags=2)
+        self.assertEqual(reg.name_z[-1], 'W_dep_var')
+        for j in range(reg.m):
+            single = GM_Lag(self.y[:, j:j + 1], self.x, self.yd, self.q,
+                            w=self.w, w_lags=2)
+            np.testing.assert_allclose(reg.betas[:, j:j + 1], single.betas,
+                                       RTOL)
+            np.testing.assert_allclose(reg.vm[j], single.vm, RTOL)
+            np.testing.assert_allclose(reg.u[:, j:j + 1], single.u, RTOL)
+            self.assertAlmostEqual(reg.pr2[j], single.pr2)
+
+    def test_gm_error(self):
+        reg = B.GM_Error_Batch(self.y, self.x, self.w)
+        self.assertEqual(reg.betas.shape, (4, 4))
+        for j in range(reg.m):
+            single = GM_Error(self.y[:, j:j + 1], self.x, self.w)
+            np.testing.assert_allclose(reg.betas[:, j:j + 1], single.betas,
+                                       RTOL)
+            np.testing.assert_allclose(reg.vm[j], single.vm, RTOL)
+            np.testing.assert_allclose(reg.e_filtered[:, j:j + 1],
+                                       single.e_filtered, RTOL)
+            np.testing.assert_allclose(reg.std_err[:, j], single.std_err,
+                                       RTOL)
+            self.assertAlmostEqual(reg.pr2[j], single.pr2)
+
+    def test_check_y(self):
+        self.assertRaises(Exception, B.OLS_Batch, self.y[:10], self.x)
+        self.assertRaises(Exception, B.OLS_Batch, self.y[:, 0], self.x)
+        self.assertRaises(Exception, B.OLS_Batch, self.y, self.x,
+                          name_y=['a'])
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestBatch)
+
+if __name__ == '__main__':
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
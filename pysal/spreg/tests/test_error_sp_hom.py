@@ -41,6 +41,20 @@ class BaseGM_Error_Hom_Tester(unittest.TestCase):
         xtx = np.array([[  4.90000000e+01,   7.04371999e+02, 1.72131237e+03], [  7.04371999e+02,   1.16866734e+04,   2.15575320e+04], [  1.72131237e+03,   2.15575320e+04, 7.39058986e+04]])
         np.testing.assert_allclose(reg.xtx,xtx,RTOL)
 
+    def test_shared_moments(self):
+        s = self.w.sparse
+        A1 = HOM.get_A1_hom(s, scalarKP=True)
+        self.assertTrue(HOM.get_A1_hom(self.w.sparse, scalarKP=True) is A1)
+        self.assertFalse(HOM.get_A1_hom(s) is A1)
+        self.assertTrue(HOM.get_A2_hom(s) is HOM.get_A2_hom(self.w.sparse))
+        wtw = (s.T * s).toarray()
+        twtw = np.trace(wtw) / self.w.n
+        known = (wtw - twtw * np.eye(self.w.n)) / (1. + twtw ** 2)
+        np.testing.assert_allclose(A1.toarray(), known, RTOL)
+        # a new transformation gets its own moments
+        self.w.transform = 'b'
+        self.assertFalse(HOM.get_A1_hom(self.w.sparse, scalarKP=True) is A1)
+
 class GM_Error_Hom_Tester(unittest.TestCase):
     def setUp(self):
         db=pysal.open(pysal.examples.get_path("columbus.dbf"),"r")
@@ -271,6 +271,15 @@ class TestGM_Error_Regimes(unittest.TestCase):
         chow_j = 0.64531386285872072
         np.testing.assert_allclose(reg.chow.joint[0],chow_j,RTOL)
 
+    def test_model_combo_regi_error_cores(self):
+        reg = SP.GM_Combo_Regimes(self.y, self.X1, self.regimes, self.yd, self.q, w=self.w, regime_lag_sep=True, regime_err_sep=True)
+        reg_c = SP.GM_Combo_Regimes(self.y, self.X1, self.regimes, self.yd, self.q, w=self.w, regime_lag_sep=True, regime_err_sep=True, cores=2)
+        np.testing.assert_allclose(reg_c.betas,reg.betas,RTOL)
+        np.testing.assert_allclose(reg_c.vm,reg.vm,RTOL)
+        np.testing.assert_allclose(reg_c.e_filtered,reg.e_filtered,RTOL)
+        np.testing.assert_allclose(reg_c.e_pred,reg.e_pred,RTOL)
+        self.assertEqual(reg_c.summary,reg.summary)
+
     def test_model_combo_regi_error(self):
         #Columbus:
         reg = SP.GM_Combo_Regimes(self.y, self.X1, self.regimes, self.yd, self.q, w=self.w, regime_lag_sep=True, regime_err_sep=True)
@@ -79,6 +79,17 @@ class TestMLError(unittest.TestCase):
     def test_LU(self):
         self._estimate_and_compare(method='LU', RTOL=RTOL*10)
 
+    def test_grid(self):
+        self._estimate_and_compare(method='GRID', RTOL=RTOL*10)
+
+    def test_logdet_approx(self):
+        np.random.seed(12345)
+        lu = ML_Error(self.y, self.x, w=self.w, method='LU')
+        for method in ('CHEB', 'MC'):
+            reg = ML_Error(self.y, self.x, w=self.w, method=method)
+            np.testing.assert_allclose(reg.lam, lu.lam, rtol=0.01)
+            np.testing.assert_allclose(reg.logll, lu.logll, rtol=0.001)
+
     def test_ord(self):
         reg = ML_Error(self.y, self.x, w=self.w,
                      name_y=self.y_name, name_x=self.x_names,
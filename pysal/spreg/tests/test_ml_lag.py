@@ -4,6 +4,7 @@ import scipy
 import numpy as np
 from pysal.spreg.ml_lag import ML_Lag
 from pysal.spreg import utils
+from pysal.spreg.w_utils import sparse_cache
 from pysal.common import RTOL
 from skip import SKIP
 
@@ -120,5 +121,38 @@ class TestMLError(unittest.TestCase):
     def test_LU(self):
         self._estimate_and_compare(method='LU')
 
+    def test_grid(self):
+        self._estimate_and_compare(method='GRID')
+
+    def test_logdet_approx(self):
+        np.random.seed(12345)
+        lu = ML_Lag(self.y, self.x, w=self.w, method='LU')
+        for method in ('CHEB', 'MC'):
+            reg = ML_Lag(self.y, self.x, w=self.w, method=method)
+            np.testing.assert_allclose(reg.rho, lu.rho, rtol=0.01)
+            np.testing.assert_allclose(reg.logll, lu.logll, rtol=0.001)
+            self.assertEqual(reg.title,
+                'MAXIMUM LIKELIHOOD SPATIAL LAG (METHOD = %s)' % method)
+        # approximations are built once per weights object
+        cache = sparse_cache(self.w)
+        ld = cache[('logdet', 'mc')]
+        reg = ML_Lag(self.y, self.x, w=self.w, method='mc')
+        self.assertTrue(cache[('logdet', 'mc')] is ld)
+
+    def test_logdet_seed(self):
+        for method in ('CHEB', 'MC'):
+            np.random.seed(1)
+            reg1 = ML_Lag(self.y, self.x, w=self.w, method=method, seed=10)
+            ld1 = sparse_cache(self.w)[('logdet', method.lower(),
+                                        ('seed', 10))]
+            sparse_cache(self.w).clear()
+            np.random.seed(2)
+            reg2 = ML_Lag(self.y, self.x, w=self.w, method=method, seed=10)
+            ld2 = sparse_cache(self.w)[('logdet', method.lower(),
+                                        ('seed', 10))]
+            self.assertFalse(ld1 is ld2)
+            np.testing.assert_array_equal(ld1.traces, ld2.traces)
+            self.assertEqual(reg1.rho, reg2.rho)
+
 if __name__ == '__main__':
     unittest.main()
@@ -3,6 +3,7 @@ import numpy as np
 import pysal
 from pysal.spreg.ols import OLS
 from pysal.spreg.ols_regimes import OLS_Regimes
+from pysal.spreg import regimes as REGI
 from pysal.common import RTOL
 
 PEGP = pysal.examples.get_path
@@ -142,5 +143,36 @@ class TestOLS_regimes(unittest.TestCase):
                 7.776650625274256e-18,RTOL)
         np.set_printoptions(suppress=start_suppress)
         
+    def test_OLS_cores(self):
+        ols = OLS_Regimes(self.y, self.x, self.regimes, w=self.w, spat_diag=True, moran=True, name_regimes=self.r_var)
+        ols_c = OLS_Regimes(self.y, self.x, self.regimes, w=self.w, spat_diag=True, moran=True, name_regimes=self.r_var, cores=2)
+        np.testing.assert_allclose(ols_c.betas, ols.betas, RTOL)
+        np.testing.assert_allclose(ols_c.u, ols.u, RTOL)
+        for r in ols.multi:
+            np.testing.assert_allclose(ols_c.multi[r].vm, ols.multi[r].vm, RTOL)
+        self.assertEqual(ols_c.summary, ols.summary)
+        # the pool is kept for the next model with the same cores
+        pool = REGI.get_pool(2)
+        OLS_Regimes(self.y, self.x, self.regimes, w=self.w, cores=2)
+        self.assertTrue(REGI.get_pool(2) is pool)
+        self.assertTrue(REGI.get_pool(False) is None)
+        self.assertEqual(REGI.get_cores(3), 3)
+        self.assertRaises(Exception, REGI.get_cores, -1)
+        REGI.close_pool()
+
+    def test_regime_w(self):
+        regi_ids = np.where(np.array(self.regimes) == 1)[0]
+        w_ids = [self.w.id_order[i] for i in regi_ids]
+        regime = REGI.Regime(1, regi_ids, {'y': self.y, 'x': None},
+                             (self.w.sparse.indptr, self.w.sparse.indices),
+                             w_ids, self.w.get_transform())
+        np.testing.assert_array_equal(regime.y, self.y[regi_ids])
+        self.assertTrue(regime.x is None)
+        w_r, warn = regime.w_regime()
+        w_r0, warn0 = REGI.w_regime(self.w, list(regi_ids), 1)
+        self.assertEqual(w_r.id_order, w_r0.id_order)
+        np.testing.assert_allclose(w_r.full()[0], w_r0.full()[0])
+        self.assertEqual(warn, warn0)
+
 if __name__ == '__main__':
     unittest.main()
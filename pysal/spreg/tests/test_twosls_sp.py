@@ -329,6 +329,25 @@ class TestGMLag(unittest.TestCase):
         ak_test = np.array([ 2.52597326,  0.11198567])
         np.testing.assert_allclose(reg.ak_test, ak_test,RTOL)
 
+    def test_inv_method(self):
+        X = np.array(self.db.by_col("INC"))
+        X = np.reshape(X, (49,1))
+        base = GM_Lag(self.y, X, w=self.w)
+        for inv_method in ('lu', 'gmres', 'bicgstab'):
+            reg = GM_Lag(self.y, X, w=self.w, inv_method=inv_method)
+            np.testing.assert_allclose(reg.betas, base.betas, RTOL)
+            np.testing.assert_allclose(reg.predy_e, base.predy_e, RTOL)
+            np.testing.assert_allclose(reg.e_pred, base.e_pred, RTOL)
+        # transposed systems, as used for a1 and a2 in GM_Endog_Error_Het
+        v = base.u
+        known = pysal.spreg.utils.inverse_prod(
+            self.w, v, 0.9, post_multiply=True)
+        for inv_method in ('lu', 'gmres', 'bicgstab'):
+            inv = pysal.spreg.utils.inverse_prod(
+                self.w, v, 0.9, post_multiply=True, inv_method=inv_method)
+            self.assertEqual(inv.shape, (1, 49))
+            np.testing.assert_allclose(inv, known, RTOL)
+
     def test_names(self):
         X = np.array(self.db.by_col("INC"))
         X = np.reshape(X, (49,1))
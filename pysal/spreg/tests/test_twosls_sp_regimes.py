@@ -180,6 +180,20 @@ class TestGMLag_Regimes(unittest.TestCase):
         np.testing.assert_allclose(reg.chow.regi, chow_regi,RTOL)
         np.testing.assert_allclose(reg.chow.joint[0], 0.54288190938307757,RTOL)
     
+    def test_regi_lag_cores(self):
+        X = np.array(self.db.by_col("INC"))
+        X = np.reshape(X, (49,1))
+        yd = np.array(self.db.by_col("HOVAL"))
+        yd = np.reshape(yd, (49,1))
+        q = np.array(self.db.by_col("DISCBD"))
+        q = np.reshape(q, (49,1))
+        reg = GM_Lag_Regimes(self.y, X, self.regimes, yend=yd, q=q, w=self.w, regime_lag_sep=True, regime_err_sep=True)
+        reg_c = GM_Lag_Regimes(self.y, X, self.regimes, yend=yd, q=q, w=self.w, regime_lag_sep=True, regime_err_sep=True, cores=2)
+        np.testing.assert_allclose(reg_c.betas, reg.betas,RTOL)
+        np.testing.assert_allclose(reg_c.vm, reg.vm,RTOL)
+        np.testing.assert_allclose(reg_c.predy_e, reg.predy_e,RTOL)
+        self.assertEqual(reg_c.summary, reg.summary)
+
     def test_all_regi(self):
         X = np.array(self.db.by_col("INC"))
         X = np.reshape(X, (49,1))
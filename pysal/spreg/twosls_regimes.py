@@ -1,13 +1,11 @@
 import numpy as np
 import regimes as REGI
 import user_output as USER
-import multiprocessing as mp
 import scipy.sparse as SP
 from utils import sphstack, set_warn, RegressionProps_basic, spdot, sphstack
 from twosls import BaseTSLS
 from robust import hac_multi
 import summary_output as SUMMARY
-from platform import system
 
 """
 Two-stage Least Squares estimation with regimes.
@@ -69,8 +67,9 @@ class TSLS_Regimes(BaseTSLS, REGI.Regimes_Frame):
                    If True, then use n-k to estimate sigma^2. If False, use n.
     vm           : boolean
                    If True, include variance-covariance matrix in summary
-    cores        : boolean
-                   Specifies if multiprocessing is to be used
+    cores        : boolean or integer
+                   Specifies if multiprocessing is to be used; True uses every
+                   available CPU and an integer sets the number of processes
                    Default: no multiprocessing, cores = False
                    Note: Multiprocessing may not work on all platforms.
     name_y       : string
@@ -333,26 +332,9 @@ class TSLS_Regimes(BaseTSLS, REGI.Regimes_Frame):
 
     def _tsls_regimes_multi(self, x, yend, q, w, regi_ids, cores,
                             gwk, sig2n_k, robust, spat_diag, vm, name_x, name_yend, name_q):
-        results_p = {}
-        """
-        for r in self.regimes_set:
-            if system() != 'Windows':
-                is_win = True
-                results_p[r] = _work(*(self.y,x,w,regi_ids,r,yend,q,robust,sig2n_k,self.name_ds,self.name_y,name_x,name_yend,name_q,self.name_w,self.name_regimes))
-            else:
-                pool = mp.Pool(cores)
-                results_p[r] = pool.apply_async(_work,args=(self.y,x,w,regi_ids,r,yend,q,robust,sig2n_k,self.name_ds,self.name_y,name_x,name_yend,name_q,self.name_w,self.name_regimes))
-                is_win = False
-        """
-        for r in self.regimes_set:
-            if cores:
-                pool = mp.Pool(None)
-                results_p[r] = pool.apply_async(_work, args=(
-                    self.y, x, w, regi_ids, r, yend, q, robust, sig2n_k, self.name_ds, self.name_y, name_x, name_yend, name_q, self.name_w, self.name_regimes))
-            else:
-                results_p[r] = _work(*(self.y, x, w, regi_ids, r, yend, q, robust, sig2n_k,
-                                       self.name_ds, self.name_y, name_x, name_yend, name_q, self.name_w, self.name_regimes))
-
+        results = REGI.regimes_map(_work, regi_ids, cores, w=w, args=(
+            robust, sig2n_k, self.name_ds, self.name_y, name_x, name_yend, name_q, self.name_w, self.name_regimes),
+            y=self.y, x=x, yend=yend, q=q)
         self.kryd = 0
         self.kr = x.shape[1] + yend.shape[1] + 1
         self.kf = 0
@@ -361,31 +343,10 @@ class TSLS_Regimes(BaseTSLS, REGI.Regimes_Frame):
         self.betas = np.zeros((self.nr * self.kr, 1), float)
         self.u = np.zeros((self.n, 1), float)
         self.predy = np.zeros((self.n, 1), float)
-        """
-        if not is_win:
-            pool.close()
-            pool.join()
-        """
-        if cores:
-            pool.close()
-            pool.join()
-
-        results = {}
         self.name_y, self.name_x, self.name_yend, self.name_q, self.name_z, self.name_h = [
         ], [], [], [], [], []
         counter = 0
         for r in self.regimes_set:
-            """
-            if is_win:
-                results[r] = results_p[r]
-            else:
-                results[r] = results_p[r].get()
-            """
-            if not cores:
-                results[r] = results_p[r]
-            else:
-                results[r] = results_p[r].get()
-
             self.vm[(counter * self.kr):((counter + 1) * self.kr),
                     (counter * self.kr):((counter + 1) * self.kr)] = results[r].vm
             self.betas[
@@ -426,11 +387,12 @@ class TSLS_Regimes(BaseTSLS, REGI.Regimes_Frame):
         self.varb = np.linalg.inv(spdot(spdot(zth, hthi), zth.T))
 
 
-def _work(y, x, w, regi_ids, r, yend, q, robust, sig2n_k, name_ds, name_y, name_x, name_yend, name_q, name_w, name_regimes):
-    y_r = y[regi_ids[r]]
-    x_r = x[regi_ids[r]]
-    yend_r = yend[regi_ids[r]]
-    q_r = q[regi_ids[r]]
+def _work(regime, robust, sig2n_k, name_ds, name_y, name_x, name_yend, name_q, name_w, name_regimes):
+    r = regime.r
+    y_r = regime.y
+    x_r = regime.x
+    yend_r = regime.yend
+    q_r = regime.q
     x_constant = USER.check_constant(x_r)
     if robust == 'hac' or robust == 'ogmm':
         robust2 = None
@@ -451,8 +413,8 @@ def _work(y, x, w, regi_ids, r, yend, q, robust, sig2n_k, name_ds, name_y, name_
     model.name_h = model.name_x + model.name_q
     model.name_w = name_w
     model.name_regimes = name_regimes
-    if w:
-        w_r, warn = REGI.w_regime(w, regi_ids[r], r, transform=True)
+    if regime.has_w:
+        w_r, warn = regime.w_regime(transform=True)
         set_warn(model, warn)
         model.w = w_r
     return model
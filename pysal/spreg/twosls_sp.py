@@ -219,6 +219,12 @@ class GM_Lag(BaseGM_Lag):
                    If True, then use n-k to estimate sigma^2. If False, use n.
     spat_diag    : boolean
                    If True, then compute Anselin-Kelejian test
+    inv_method   : string
+                   If "power_exp", then compute inverse using the power
+                   expansion. If "true_inv", then compute the true inverse.
+                   Note that true_inv will fail for large n. If "lu",
+                   "gmres" or "bicgstab", then solve the sparse system
+                   (see utils.sparse_solve).
     vm           : boolean
                    If True, include variance-covariance matrix in summary
                    results
@@ -461,7 +467,7 @@ class GM_Lag(BaseGM_Lag):
     def __init__(self, y, x, yend=None, q=None,
                  w=None, w_lags=1, lag_q=True,
                  robust=None, gwk=None, sig2n_k=False,
-                 spat_diag=False,
+                 spat_diag=False, inv_method='power_exp',
                  vm=False, name_y=None, name_x=None,
                  name_yend=None, name_q=None,
                  name_w=None, name_gwk=None, name_ds=None):
@@ -478,7 +484,8 @@ class GM_Lag(BaseGM_Lag):
             lag_q=lag_q, sig2n_k=sig2n_k)
         self.rho = self.betas[-1]
         self.predy_e, self.e_pred, warn = sp_att(w, self.y, self.predy,
-                                                 yend2[:, -1].reshape(self.n, 1), self.rho)
+                                                 yend2[:, -1].reshape(self.n, 1), self.rho,
+                                                 inv_method=inv_method)
         set_warn(self, warn)
         self.title = "SPATIAL TWO STAGE LEAST SQUARES"
         self.name_ds = USER.set_name_ds(name_ds)
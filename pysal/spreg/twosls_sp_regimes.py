@@ -9,12 +9,10 @@ import pysal
 import regimes as REGI
 import user_output as USER
 import summary_output as SUMMARY
-import multiprocessing as mp
 from twosls_regimes import TSLS_Regimes, _optimal_weight
 from twosls import BaseTSLS
 from utils import set_endog, set_endog_sparse, sp_att, set_warn, sphstack, spdot
 from robust import hac_multi
-from platform import system
 
 
 class GM_Lag_Regimes(TSLS_Regimes, REGI.Regimes_Frame):
@@ -89,8 +87,9 @@ class GM_Lag_Regimes(TSLS_Regimes, REGI.Regimes_Frame):
     vm           : boolean
                    If True, include variance-covariance matrix in summary
                    results
-    cores        : boolean
-                   Specifies if multiprocessing is to be used
+    cores        : boolean or integer
+                   Specifies if multiprocessing is to be used; True uses every
+                   available CPU and an integer sets the number of processes
                    Default: no multiprocessing, cores = False
                    Note: Multiprocessing may not work on all platforms.
     name_y       : string
@@ -484,7 +483,7 @@ class GM_Lag_Regimes(TSLS_Regimes, REGI.Regimes_Frame):
             name_yend.append(USER.set_name_yend_sp(name_y))
             TSLS_Regimes.__init__(self, y=y, x=x, yend=yend2, q=q2,
                                   regimes=regimes, w=w, robust=robust, gwk=gwk,
-                                  sig2n_k=sig2n_k, spat_diag=spat_diag, vm=vm,
+                                  sig2n_k=sig2n_k, spat_diag=spat_diag, vm=vm, cores=cores,
                                   constant_regi=constant_regi, cols2regi=cols2regi, regime_err_sep=regime_err_sep,
                                   name_y=name_y, name_x=name_x, name_yend=name_yend, name_q=name_q,
                                   name_regimes=name_regimes, name_w=name_w, name_gwk=name_gwk,
@@ -507,33 +506,14 @@ class GM_Lag_Regimes(TSLS_Regimes, REGI.Regimes_Frame):
                              spat_diag=False, vm=False, name_y=None, name_x=None,
                              name_yend=None, name_q=None, name_regimes=None,
                              name_w=None, name_gwk=None, name_ds=None):
-        #        pool = mp.Pool(cores)
         self.name_ds = USER.set_name_ds(name_ds)
         name_x = USER.set_name_x(name_x, x)
         name_yend.append(USER.set_name_yend_sp(name_y))
         self.name_w = USER.set_name_w(name_w, w_i)
         self.name_gwk = USER.set_name_w(name_gwk, gwk)
-        results_p = {}
-        """
-        for r in self.regimes_set:
-            w_r = w_i[r].sparse
-            if system() == 'Windows':
-                is_win = True
-                results_p[r] = _work(*(y,x,regi_ids,r,yend,q,w_r,w_lags,lag_q,robust,sig2n_k,self.name_ds,name_y,name_x,name_yend,name_q,self.name_w,name_regimes))
-            else:                
-                results_p[r] = pool.apply_async(_work,args=(y,x,regi_ids,r,yend,q,w_r,w_lags,lag_q,robust,sig2n_k,self.name_ds,name_y,name_x,name_yend,name_q,self.name_w,name_regimes, ))
-                is_win = False
-        """
-        for r in self.regimes_set:
-            w_r = w_i[r].sparse
-            if cores:
-                pool = mp.Pool(None)
-                results_p[r] = pool.apply_async(_work, args=(
-                    y, x, regi_ids, r, yend, q, w_r, w_lags, lag_q, robust, sig2n_k, self.name_ds, name_y, name_x, name_yend, name_q, self.name_w, name_regimes, ))
-            else:
-                results_p[r] = _work(*(y, x, regi_ids, r, yend, q, w_r, w_lags, lag_q, robust,
-                                       sig2n_k, self.name_ds, name_y, name_x, name_yend, name_q, self.name_w, name_regimes))
-
+        results = REGI.regimes_map(_work, regi_ids, cores, w=w, args=(
+            w_lags, lag_q, robust, sig2n_k, self.name_ds, name_y, name_x, name_yend, name_q, self.name_w, name_regimes),
+            y=y, x=x, yend=yend, q=q)
         self.kryd = 0
         self.kr = len(cols2regi) + 1
         self.kf = 0
@@ -546,29 +526,10 @@ class GM_Lag_Regimes(TSLS_Regimes, REGI.Regimes_Frame):
         self.predy = np.zeros((self.n, 1), float)
         self.predy_e = np.zeros((self.n, 1), float)
         self.e_pred = np.zeros((self.n, 1), float)
-        """
-        if not is_win:
-            pool.close()
-            pool.join()
-        """
-        if cores:
-            pool.close()
-            pool.join()
-        results = {}
         self.name_y, self.name_x, self.name_yend, self.name_q, self.name_z, self.name_h = [
         ], [], [], [], [], []
         counter = 0
         for r in self.regimes_set:
-            """
-            if is_win:
-                results[r] = results_p[r]
-            else:
-                results[r] = results_p[r].get()
-            """
-            if not cores:
-                results[r] = results_p[r]
-            else:
-                results[r] = results_p[r].get()
             results[r].predy_e, results[r].e_pred, warn = sp_att(w_i[r], results[r].y, results[
                                                                  r].predy, results[r].yend[:, -1].reshape(results[r].n, 1), results[r].rho)
             set_warn(results[r], warn)
@@ -633,17 +594,13 @@ class GM_Lag_Regimes(TSLS_Regimes, REGI.Regimes_Frame):
         self.varb = np.linalg.inv(spdot(spdot(zth, hthi), zth.T))
 
 
-def _work(y, x, regi_ids, r, yend, q, w_r, w_lags, lag_q, robust, sig2n_k, name_ds, name_y, name_x, name_yend, name_q, name_w, name_regimes):
-    y_r = y[regi_ids[r]]
-    x_r = x[regi_ids[r]]
-    if yend is not None:
-        yend_r = yend[regi_ids[r]]
-    else:
-        yend_r = yend
-    if q is not None:
-        q_r = q[regi_ids[r]]
-    else:
-        q_r = q
+def _work(regime, w_lags, lag_q, robust, sig2n_k, name_ds, name_y, name_x, name_yend, name_q, name_w, name_regimes):
+    r = regime.r
+    y_r = regime.y
+    x_r = regime.x
+    yend_r = regime.yend
+    q_r = regime.q
+    w_r = regime.w_regime(transform=True)[0].sparse
     yend_r, q_r = set_endog_sparse(y_r, x_r, w_r, yend_r, q_r, w_lags, lag_q)
     x_constant = USER.check_constant(x_r)
     if robust == 'hac' or robust == 'ogmm':
@@ -15,6 +15,7 @@ import scipy.optimize as op
 import numpy.linalg as la
 from pysal import lag_spatial
 from sputils import *
+from w_utils import sparse_cache
 import copy
 
 
@@ -212,10 +213,14 @@ def get_A1_het(S):
                       A1 matrix in scipy sparse format
 
     """
-    StS = S.T * S
-    d = SP.spdiags([StS.diagonal()], [0], S.get_shape()[0], S.get_shape()[1])
-    d = d.asformat('csr')
-    return StS - d
+    cache = sparse_cache(S)
+    if 'A1_het' not in cache:
+        StS = _get_WtW(S)
+        d = SP.spdiags([StS.diagonal()], [0], S.get_shape()[0],
+                       S.get_shape()[1])
+        d = d.asformat('csr')
+        cache['A1_het'] = StS - d
+    return cache['A1_het']
 
 
 def get_A1_hom(s, scalarKP=False):
@@ -244,17 +249,19 @@ def get_A1_hom(s, scalarKP=False):
     Implicit        : csr_matrix
                       A1 matrix in scipy sparse format
     """
-    n = float(s.shape[0])
-    wpw = s.T * s
-    twpw = np.sum(wpw.diagonal())
-    e = SP.eye(n, n, format='csr')
-    e.data = np.ones(int(n)) * (twpw / n)
-    num = wpw - e
-    if not scalarKP:
-        return num
-    else:
-        den = 1. + (twpw / n) ** 2.
-        return num / den
+    cache = sparse_cache(s)
+    key = ('A1_hom', scalarKP)
+    if key not in cache:
+        n = float(s.shape[0])
+        wpw = _get_WtW(s)
+        twpw = np.sum(wpw.diagonal())
+        e = SP.eye(n, n, format='csr')
+        e.data = np.ones(int(n)) * (twpw / n)
+        num = wpw - e
+        if scalarKP:
+            num = num / (1. + (twpw / n) ** 2.)
+        cache[key] = num
+    return cache[key]
 
 
 def get_A2_hom(s):
@@ -277,7 +284,18 @@ def get_A2_hom(s):
     Implicit        : csr_matrix
                       A2 matrix in scipy sparse format
     """
-    return (s + s.T) / 2.
+    cache = sparse_cache(s)
+    if 'A2_hom' not in cache:
+        cache['A2_hom'] = (s + s.T) / 2.
+    return cache['A2_hom']
+
+
+def _get_WtW(s):
+    """W'W for the sparse weights s, shared through sparse_cache"""
+    cache = sparse_cache(s)
+    if 'WtW' not in cache:
+        cache['WtW'] = s.T * s
+    return cache['WtW']
 
 
 def _moments2eqs(A1, s, u):
@@ -489,15 +507,22 @@ def inverse_prod(w, data, scalar, post_multiply=False, inv_method="power_exp", t
     inv_method      : string
                       If "true_inv" uses the true inverse of W (slow);
                       If "power_exp" uses the power expansion method (default)
+                      If "lu" solves with a sparse LU factorization, reused
+                      while the scalar does not change;
+                      If "gmres" or "bicgstab" solves with the preconditioned
+                      Krylov method, warm started from the previous solution
+                      (see sparse_solve)
 
     threshold       : float
                       Test value to stop the iterations. Test is against
                       sqrt(increment' * increment), where increment is a
                       vector representing the contribution from each
-                      iteration.
+                      iteration. For the Krylov methods, tolerance on the
+                      relative residual.
 
     max_iterations  : integer
-                      Maximum number of iterations for the expansion.   
+                      Maximum number of iterations for the expansion or the
+                      Krylov method.
 
     Examples
     --------
@@ -520,6 +545,12 @@ def inverse_prod(w, data, scalar, post_multiply=False, inv_method="power_exp", t
     >>> inv_reg = inverse_prod(w, data, rho, inv_method="true_inv", post_multiply=True)
     >>> np.allclose(inv_pow, inv_reg, atol=0.0001)
     True
+    >>> # sparse solvers
+    >>> inv_lu = inverse_prod(w, data, rho, inv_method="lu")
+    >>> inv_gmres = inverse_prod(w, data, rho, inv_method="gmres")
+    >>> inv_reg = inverse_prod(w, data, rho, inv_method="true_inv")
+    >>> np.allclose(inv_lu, inv_reg) and np.allclose(inv_gmres, inv_reg)
+    True
 
     """
     if inv_method == "power_exp":
@@ -535,6 +566,10 @@ def inverse_prod(w, data, scalar, post_multiply=False, inv_method="power_exp", t
             inv_prod = spdot(data.T, matrix)
         else:
             inv_prod = spdot(matrix, data)
+    elif inv_method in SPARSE_SOLVERS:
+        inv_prod = sparse_solve(
+            w, data, scalar, post_multiply=post_multiply, method=inv_method,
+            threshold=threshold, max_iterations=max_iterations)
     else:
         raise Exception, "Invalid method selected for inversion."
     return inv_prod
@@ -580,6 +615,106 @@ def power_expansion(w, data, scalar, post_multiply=False, threshold=0.0000000001
     return running_total
 
 
+def sparse_solve(w, data, scalar, post_multiply=False, method="lu",
+                 threshold=0.0000000001, max_iterations=None):
+    """
+    Compute the product of the inverse of a spatial filter and a data array
+    by solving the sparse system
+
+        .. math::
+            (I - \rho W) x = v
+
+    or its transpose when post-multiplying.
+
+    Parameters
+    ----------
+
+    w               : Pysal W object or sparse matrix
+                      nxn spatial weights
+    data            : Numpy array
+                      nxk array of data
+    scalar          : float
+                      Scalar value (typically rho or lambda)
+    post_multiply   : boolean
+                      If True returns data times the inverse of the spatial
+                      filter, if false the inverse times data
+    method          : string
+                      "lu" for a sparse LU factorization, or "gmres" or
+                      "bicgstab" for the Krylov method preconditioned with
+                      the first order power expansion I + rho W
+    threshold       : float
+                      Tolerance on the relative residual of the Krylov
+                      methods
+    max_iterations  : integer
+                      Maximum number of iterations of the Krylov methods
+
+    Returns
+    -------
+
+    x               : Numpy array
+                      solution, shaped as the result of inverse_prod
+
+    Notes
+    -----
+    The factorization, and the last solution used as the starting point of
+    the Krylov methods, are kept in the sparse_cache of the weights. Later
+    solves with the same scalar reuse the factorization, and the
+    iterations of GM estimators start close to their solution.
+
+    Examples
+    --------
+    Tests for this function are in inverse_prod()
+
+    """
+    try:
+        ws = w.sparse
+    except:
+        ws = w
+    n = ws.shape[0]
+    scalar = float(np.squeeze(scalar))
+    b = np.asarray(data, dtype=float)
+    vector = b.ndim == 1
+    b = b.reshape(n, -1)
+    cache = sparse_cache(ws)
+    if method == "lu":
+        if cache.get('splu', (None,))[0] != scalar:
+            a = SP.identity(n, format='csc') - scalar * SP.csc_matrix(ws)
+            cache['splu'] = (scalar, SPla.splu(a))
+        x = cache['splu'][1].solve(b, trans='T' if post_multiply else 'N')
+    elif method in SPARSE_SOLVERS:
+        wt = ws.T.tocsr() if post_multiply else ws
+        a = SPla.LinearOperator((n, n), matvec=lambda v: v - scalar * (wt * v),
+                                dtype=float)
+        m = SPla.LinearOperator((n, n), matvec=lambda v: v + scalar * (wt * v),
+                                dtype=float)
+        key = ('krylov', post_multiply)
+        x0 = cache.get(key)
+        if x0 is None or x0.shape != b.shape:
+            x0 = b
+        x = np.empty(b.shape)
+        for j in range(b.shape[1]):
+            x[:, j], info = _krylov(SPARSE_SOLVERS[method], a, b[:, j],
+                                    x0[:, j], m, threshold, max_iterations)
+            if info != 0:
+                raise Exception, "%s did not converge, check model specification and that weight are less than 1" % method
+        cache[key] = x
+    else:
+        raise Exception, "Invalid method selected for inversion."
+    if vector:
+        x = x.ravel()
+    return x.T if post_multiply else x
+
+
+def _krylov(solver, a, b, x0, m, tol, maxiter):
+    try:
+        return solver(a, b, x0=x0, tol=tol, atol=0., maxiter=maxiter, M=m)
+    except TypeError:  # scipy < 1.1 has no atol
+        return solver(a, b, x0=x0, tol=tol, maxiter=maxiter, M=m)
+
+
+SPARSE_SOLVERS = {'lu': None, 'gmres': SPla.gmres, 'bicgstab': SPla.bicgstab}
+
+
 def set_endog(y, x, w, yend, q, w_lags, lag_q):
     # Create spatial lag of y
     yl = lag_spatial(w, y)
@@ -641,10 +776,10 @@ def iter_msg(iteration, max_iter):
     return iter_stop
 
 
-def sp_att(w, y, predy, w_y, rho):
+def sp_att(w, y, predy, w_y, rho, inv_method="power_exp"):
     xb = predy - rho * w_y
     if np.abs(rho) < 1:
-        predy_sp = inverse_prod(w, xb, rho)
+        predy_sp = inverse_prod(w, xb, rho, inv_method=inv_method)
         warn = None
         # Note 1: Here if omitting pseudo-R2; If not, see Note 2.
         resid_sp = y - predy_sp
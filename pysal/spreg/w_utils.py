@@ -1,6 +1,9 @@
+import weakref
 import numpy as np
 import pysal as ps
 import scipy.sparse as SPARSE
+from scipy.sparse.linalg import splu as SuperLU
+from scipy.interpolate import InterpolatedUnivariateSpline
 
 
 def symmetrize(w):
@@ -25,3 +28,264 @@ def symmetrize(w):
     D12 = SPARSE.spdiags(d, [0], w.n, w.n)
     w.transform = 'r'
     return D12 * w.sparse * Di12
+
+
+_SPARSE_CACHE = {}
+
+
+def sparse_cache(s):
+    """Dictionary for the quantities that only depend on a sparse weights
+    matrix, shared by every model estimated on it
+
+    Parameters
+    ----------
+    s       : sparse matrix or W
+              weights; for a W object the dictionary of w.sparse is used
+
+    Returns
+    -------
+    dictionary kept for as long as s is alive
+
+    Notes
+    -----
+    A W object hands out the same sparse matrix until its transformation
+    or its neighbors change, so the cache is in effect keyed by the weights
+    object and its transformation. Matrices must not be modified in place
+    once they have been cached.
+
+    Examples
+    --------
+    >>> w = ps.lat2W(3, 3)
+    >>> sparse_cache(w) is sparse_cache(w.sparse)
+    True
+    >>> w.transform = 'r'
+    >>> sparse_cache(w) is sparse_cache(w.sparse)
+    True
+    >>> cache = sparse_cache(w)
+    >>> w.transform = 'b'
+    >>> sparse_cache(w) is cache
+    False
+
+    """
+    if not SPARSE.issparse(s):
+        s = s.sparse
+    key = id(s)
+    entry = _SPARSE_CACHE.get(key)
+    if entry is None or entry[0]() is not s:
+        def drop(ref, key=key):
+            if _SPARSE_CACHE.get(key, (None,))[0] is ref:
+                del _SPARSE_CACHE[key]
+        entry = (weakref.ref(s, drop), {})
+        _SPARSE_CACHE[key] = entry
+    return entry[1]
+
+
+def logdet(w, method='cheb', **kwargs):
+    """Approximation of log|I - rho W| for a weights object, built once and
+    shared by every model estimated on w
+
+    Parameters
+    ----------
+    w       : W
+              weights object, with the transformation used in the model
+    method  : string
+              'cheb' for LogDet_Cheb, 'mc' for LogDet_MC or 'grid' for
+              LogDet_Grid
+    kwargs  : options passed to the approximation, such as the seed of
+              the stochastic traces of 'cheb' and 'mc'
+
+    Returns
+    -------
+    callable taking rho and returning log|I - rho W|
+
+    Notes
+    -----
+    The approximation is kept in the sparse_cache of w, so it is rebuilt
+    when the transformation or the neighbors of w change.
+
+    Examples
+    --------
+    >>> w = ps.lat2W(10, 10)
+    >>> w.transform = 'r'
+    >>> ld = logdet(w, 'grid')
+    >>> logdet(w, 'grid') is ld
+    True
+    >>> a = SPARSE.identity(w.n) - 0.5 * w.sparse
+    >>> np.allclose(ld(0.5), np.linalg.slogdet(a.toarray())[1])
+    True
+
+    """
+    method = method.lower()
+    if method not in LOGDET_METHODS:
+        raise ValueError("{0} is an unsupported method".format(method))
+    key = ('logdet', method) + tuple(sorted(kwargs.items()))
+    cache = sparse_cache(w)
+    if key not in cache:
+        cache[key] = LOGDET_METHODS[method](w.sparse, **kwargs)
+    return cache[key]
+
+
+class LogDet_Cheb(object):
+    """Chebyshev approximation of log|I - rho W| [Pace2004]_
+
+    Parameters
+    ----------
+    W           : sparse matrix
+                  weights with eigenvalues in [-1, 1], as for row
+                  standardized weights
+    order       : int
+                  order of the Chebyshev polynomial
+    iterations  : int
+                  number of random vectors for the traces of the
+                  polynomials of order 3 and higher, which are estimated
+                  stochastically; orders 0 to 2 are exact
+    seed        : int
+                  seed of the random vectors. If None, it is drawn from
+                  numpy's global random state, so np.random.seed still
+                  makes the traces reproducible
+
+    Attributes
+    ----------
+    traces      : array
+                  (order+1, ), tr(T_j(W)) for the Chebyshev polynomials T_j
+
+    """
+
+    def __init__(self, W, order=20, iterations=50, seed=None):
+        W = SPARSE.csr_matrix(W)
+        n = W.shape[0]
+        self.n = n
+        self.order = order
+        traces = np.zeros(order + 1)
+        traces[0] = n
+        traces[1] = W.diagonal().sum()
+        if order > 1:
+            traces[2] = 2 * W.multiply(W.T).sum() - n
+        if order > 2:
+            # T_{j+1}(W)v = 2 W T_j(W)v - T_{j-1}(W)v on Rademacher vectors
+            v = np.sign(_rng(seed).random_sample((n, iterations)) - 0.5)
+            t0, t1 = v, W * v
+            for j in range(2, order + 1):
+                t0, t1 = t1, 2 * (W * t1) - t0
+                if j > 2:
+                    traces[j] = (v * t1).sum() / iterations
+        self.traces = traces
+
+    def __call__(self, rho):
+        q = self.order + 1
+        theta = np.pi * (np.arange(q) + 0.5) / q
+        f = np.log(1 - np.multiply.outer(rho, np.cos(theta)))
+        c = 2.0 / q * np.dot(f, np.cos(np.outer(theta, np.arange(q))))
+        return np.dot(c, self.traces) - c[..., 0] * self.n / 2.0
+
+
+class LogDet_MC(object):
+    """Monte Carlo approximation of log|I - rho W| [Barry1999]_
+
+    Parameters
+    ----------
+    W           : sparse matrix
+                  weights with eigenvalues in [-1, 1], as for row
+                  standardized weights
+    order       : int
+                  number of terms of the series
+                  -sum_k rho^k tr(W^k) / k
+    iterations  : int
+                  number of random vectors for the traces of the powers
+                  of order 3 and higher, which are estimated
+                  stochastically; tr(W) and tr(W^2) are exact
+    seed        : int
+                  seed of the random vectors. If None, it is drawn from
+                  numpy's global random state, so np.random.seed still
+                  makes the traces reproducible
+
+    Attributes
+    ----------
+    traces      : array
+                  (order, ), tr(W^k) for k = 1, ..., order
+
+    """
+
+    def __init__(self, W, order=50, iterations=50, seed=None):
+        W = SPARSE.csr_matrix(W)
+        n = W.shape[0]
+        self.order = order
+        traces = np.zeros(order)
+        traces[0] = W.diagonal().sum()
+        if order > 1:
+            traces[1] = W.multiply(W.T).sum()
+        if order > 2:
+            v = _rng(seed).standard_normal((n, iterations))
+            vv = (v * v).sum(0)
+            u = W * v
+            for k in range(1, order):
+                u = W * u
+                if k > 1:
+                    traces[k] = n * ((v * u).sum(0) / vv).mean()
+        self.traces = traces
+
+    def __call__(self, rho):
+        k = np.arange(1, self.order + 1)
+        powers = np.power.outer(rho, k)
+        return -np.dot(powers, self.traces / k)
+
+
+class LogDet_Grid(object):
+    """Spline interpolation of log|I - rho W| between exact values on a
+    grid of rho
+
+    Parameters
+    ----------
+    W           : sparse matrix
+                  weights
+    lower       : float
+                  smallest rho of the grid
+    upper       : float
+                  largest rho of the grid
+    step        : float
+                  spacing of the grid
+
+    Attributes
+    ----------
+    grid        : array
+                  values of rho with an exact log determinant
+    values      : array
+                  log|I - rho W| at each value of the grid
+
+    Notes
+    -----
+    Each point of the grid costs one sparse LU factorization, so the grid
+    pays for itself when it is shared by several models. Values of rho
+    outside the grid are computed exactly.
+
+    """
+
+    def __init__(self, W, lower=-0.99, upper=0.99, step=0.01):
+        self.W = SPARSE.csc_matrix(W)
+        self.I = SPARSE.identity(W.shape[0], format='csc')
+        self.grid = np.linspace(lower, upper,
+                                int(round((upper - lower) / step)) + 1)
+        self.values = np.array([self.exact(rho) for rho in self.grid])
+        self._spline = InterpolatedUnivariateSpline(self.grid, self.values)
+
+    def exact(self, rho):
+        """log|I - rho W| from the sparse LU factorization"""
+        LU = SuperLU(self.I - rho * self.W)
+        return np.sum(np.log(np.abs(LU.U.diagonal())))
+
+    def __call__(self, rho):
+        if np.ndim(rho):
+            return np.array([self(r) for r in rho])
+        if self.grid[0] <= rho <= self.grid[-1]:
+            return float(self._spline(rho))
+        return self.exact(rho)
+
+
+def _rng(seed):
+    """RandomState of the stochastic traces, seeded as in esda.permutation"""
+    if seed is None:
+        seed = np.random.randint(np.iinfo(np.int32).max)
+    return np.random.RandomState(seed)
+
+
+LOGDET_METHODS = {'cheb': LogDet_Cheb, 'mc': LogDet_MC, 'grid': LogDet_Grid}
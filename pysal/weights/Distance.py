@@ -1,8 +1,9 @@
-from ..cg.kdtree import KDTree
+from ..cg.kdtree import KDTree, Arc_KDTree
 from .weights import W
 from .util import isKDTree, get_ids, get_points_array_from_shapefile, get_points_array
 import copy
 from warnings import warn as Warn
+from itertools import chain
 import numpy as np
 
 __all__ = ["KNN", "Kernel", "DistanceBand"]
@@ -103,17 +104,20 @@ class KNN(W):
         this_nnq = self.kdtree.query(self.data, k=k+1, p=p)
         
         to_weight = this_nnq[1]
+        n = to_weight.shape[0]
+        # drop each focal observation from its own query; if it is not
+        # returned (coincident points) the farthest candidate is dropped
+        focal = to_weight == np.arange(n)[:, None]
+        drop = np.where(focal.any(axis=1), focal.argmax(axis=1), k)
+        keep = np.ones(to_weight.shape, dtype=bool)
+        keep[np.arange(n), drop] = False
+        indices = to_weight[keep]
+        indptr = np.arange(0, n * k + 1, k)
+        sparse = sp.csr_matrix((np.ones(n * k), indices, indptr),
+                               shape=(n, n))
         if ids is None:
-            ids = list(range(to_weight.shape[0]))
-        
-        neighbors = {}
-        for i,row in enumerate(to_weight):
-            row = row.tolist()
-            row.remove(i)
-            row = [ids[j] for j in row]
-            focal = ids[i]
-            neighbors[focal] = row
-        W.__init__(self, neighbors, id_order=ids)
+            ids = list(range(n))
+        self._init_from_sparse(sparse, id_order=ids, sort_indices=False)
     
     @classmethod
     def from_shapefile(cls, filepath, **kwargs):
@@ -506,7 +510,7 @@ class Kernel(W):
         self.function = function.lower()
         self.fixed = fixed
         self.eps = eps
-        if bandwidth:
+        if bandwidth is not None:
             try:
                 bandwidth = np.array(bandwidth)
                 bandwidth.shape = (len(bandwidth), 1)
@@ -517,11 +521,14 @@ class Kernel(W):
             self._set_bw()
 
         self._eval_kernel()
-        neighbors, weights = self._k_to_W(ids)
+        kernel = self._kernel
         if diagonal:
-            for i in neighbors:
-                weights[i][neighbors[i].index(i)] = 1.0
-        W.__init__(self, neighbors, weights, ids)
+            kernel = kernel.copy()
+            kernel[self._rows == self._cols] = 1.0
+        n = len(self.bandwidth)
+        sparse = sp.csr_matrix((kernel, self._cols, self._indptr),
+                               shape=(n, n))
+        self._init_from_sparse(sparse, id_order=ids, sort_indices=False)
     
     @classmethod
     def from_shapefile(cls, filepath, idVariable=None,  **kwargs):
@@ -593,22 +600,6 @@ class Kernel(W):
             ids = df[ids].tolist()
         return cls(pts, ids=ids, **kwargs)
 
-    def _k_to_W(self, ids=None):
-        allneighbors = {}
-        weights = {}
-        if ids:
-            ids = np.array(ids)
-        else:
-            ids = np.arange(len(self.data))
-        for i, neighbors in enumerate(self.kernel):
-            if len(self.neigh[i]) == 0:
-                allneighbors[ids[i]] = []
-                weights[ids[i]] = []
-            else:
-                allneighbors[ids[i]] = list(ids[self.neigh[i]])
-                weights[ids[i]] = self.kernel[i].tolist()
-        return allneighbors, weights
-
     def _set_bw(self):
         dmat, neigh = self.kdt.query(self.data, k=self.k)
         if self.fixed:
@@ -621,44 +612,71 @@ class Kernel(W):
             self.bandwidth = dmat.max(axis=1) * self.eps
             self.bandwidth.shape = (self.bandwidth.size, 1)
             # identify knn neighbors for each point
-            nnq = self.kdt.query(self.data, k=self.k)
-            self.neigh = nnq[1]
+            self.neigh = neigh
+            self._dmat = dmat
+
+    def _pair_distances(self, rows, cols):
+        """Distances between the points in rows and the points in cols.
+
+        """
+        data = np.asarray(self.data, dtype=float)
+        d = np.sqrt(((data[rows] - data[cols]) ** 2).sum(axis=1))
+        if isinstance(self.kdt, Arc_KDTree):
+            # chord length on the unit sphere to arc distance
+            theta = np.degrees(np.arccos((2 - d ** 2) / 2.))
+            d = theta * self.kdt.circumference / 360.0
+        return d
 
     def _eval_kernel(self):
-        # get points within bandwidth distance of each point
-        if not hasattr(self, 'neigh'):
-            kdtq = self.kdt.query_ball_point
-            neighbors = [kdtq(self.data[i], r=bwi[0]) for i,
-                         bwi in enumerate(self.bandwidth)]
-            self.neigh = neighbors
-        # get distances for neighbors
-        bw = self.bandwidth
-
-        kdtq = self.kdt.query
-        z = []
-        for i, nids in enumerate(self.neigh):
-            di, ni = kdtq(self.data[i], k=len(nids))
-            if not isinstance(di, np.ndarray):
-                di = np.asarray([di] * len(nids))
-                ni = np.asarray([ni] * len(nids))
-            zi = np.array([dict(zip(ni, di))[nid] for nid in nids]) / bw[i]
-            z.append(zi)
-        zs = z
+        bw = self.bandwidth.flatten()
+        n = len(bw)
+        # neighbors and distances as flat arrays aligned with the rows of the
+        # weights matrix
+        if hasattr(self, 'neigh'):
+            neigh = np.asarray(self.neigh)
+            counts = np.ones(n, dtype=int) * neigh.shape[1]
+            rows = np.repeat(np.arange(n), counts)
+            cols = neigh.flatten()
+            d = self._dmat.flatten()
+        else:
+            # get points within bandwidth distance of each point, with one
+            # query per distinct bandwidth
+            data = np.asarray(self.data)
+            candidates = [None] * n
+            for radius in np.unique(bw):
+                idx = np.flatnonzero(bw == radius)
+                found = self.kdt.query_ball_point(data[idx], r=radius)
+                for i, c in zip(idx, found):
+                    candidates[i] = c
+            counts = np.array([len(c) for c in candidates], dtype=int)
+            rows = np.repeat(np.arange(n), counts)
+            cols = np.fromiter(chain.from_iterable(candidates), dtype=int,
+                               count=counts.sum())
+            d = self._pair_distances(rows, cols)
+        indptr = np.zeros(n + 1, dtype=int)
+        indptr[1:] = np.cumsum(counts)
+        z = d / bw[rows]
         # functions follow Anselin and Rey (2010) table 5.4
         if self.function == 'triangular':
-            self.kernel = [1 - zi for zi in zs]
+            kernel = 1 - z
         elif self.function == 'uniform':
-            self.kernel = [np.ones(zi.shape) * 0.5 for zi in zs]
+            kernel = np.ones(z.shape) * 0.5
         elif self.function == 'quadratic':
-            self.kernel = [(3. / 4) * (1 - zi ** 2) for zi in zs]
+            kernel = (3. / 4) * (1 - z ** 2)
         elif self.function == 'quartic':
-            self.kernel = [(15. / 16) * (1 - zi ** 2) ** 2 for zi in zs]
+            kernel = (15. / 16) * (1 - z ** 2) ** 2
         elif self.function == 'gaussian':
             c = np.pi * 2
             c = c ** (-0.5)
-            self.kernel = [c * np.exp(-(zi ** 2) / 2.) for zi in zs]
+            kernel = c * np.exp(-(z ** 2) / 2.)
         else:
             print('Unsupported kernel function', self.function)
+            return
+        self._rows, self._cols, self._indptr = rows, cols, indptr
+        self._kernel = kernel
+        splits = indptr[1:-1]
+        self.neigh = np.split(cols, splits)
+        self.kernel = np.split(kernel, splits)
 
 
 class DistanceBand(W):
@@ -734,7 +752,7 @@ class DistanceBand(W):
     WARNING: there is one disconnected observation (no neighbors)
     Island id:  [2]
     >>> w.weights[0]
-    [0.10000000000000001, 0.089442719099991588]
+    [0.1, 0.08944271909999159]
     >>> w.neighbors[0]
     [1, 3]
     >>>
@@ -745,7 +763,7 @@ class DistanceBand(W):
     WARNING: there is one disconnected observation (no neighbors)
     Island id:  [2]
     >>> w.weights[0]
-    [0.01, 0.0079999999999999984]
+    [0.01, 0.007999999999999998]
 
     Notes
     -----
@@ -788,8 +806,9 @@ class DistanceBand(W):
                 self.data = data
                 self.kd = None       
         self._band()
-        neighbors, weights = self._distance_to_W(ids)
-        W.__init__(self, neighbors, weights, ids, silent_island_warning=self.silent)
+        self._init_from_sparse(self._distance_to_W(), id_order=ids,
+                               silent_island_warning=self.silent,
+                               sort_indices=False)
 
     @classmethod
     def from_shapefile(cls, filepath, threshold, idVariable=None, **kwargs):
@@ -878,26 +897,19 @@ class DistanceBand(W):
             self.dmat = self._spdistance_matrix(self.data, self.data, self.threshold)
 
 
-    def _distance_to_W(self, ids=None):
+    def _distance_to_W(self):
+        """Weights matrix from the sparse distance matrix.
+
+        """
         if self.binary:
             self.dmat[self.dmat>0] = 1
             self.dmat.eliminate_zeros()
-            tempW = WSP2W(WSP(self.dmat, id_order=ids), silent_island_warning=self.silent)
-            neighbors = tempW.neighbors
-            weight_keys = tempW.weights.keys()
-            weight_vals = tempW.weights.values()
-            weights = dict(zip(weight_keys, map(list, weight_vals)))
-            return neighbors, weights
+            return self.dmat
         else:
             weighted = self.dmat.power(self.alpha)
             weighted[weighted==np.inf] = 0
             weighted.eliminate_zeros()
-            tempW = WSP2W(WSP(weighted, id_order=ids), silent_island_warning=self.silent)
-            neighbors = tempW.neighbors
-            weight_keys = tempW.weights.keys()
-            weight_vals = tempW.weights.values()
-            weights = dict(zip(weight_keys, map(list, weight_vals)))
-            return neighbors, weights
+            return weighted
 
     def _spdistance_matrix(self, x,y, threshold=None):
         dist = distance_matrix(x,y)
@@ -113,6 +113,17 @@ class Test_KNN(ut.TestCase, Distance_Mixin):
         wnew = w.reweight(k=4, p=1, new_data=new_point, inplace=False)
         self.assertEqual(wnew[0], {1: 1.0, 3: 1.0, 4: 1.0, 6: 1.0})
 
+    def test_id_order_set(self):
+        w = d.KNN(self.points, k=2)
+        self.assertTrue(w.id_order_set)
+        self.assertEqual(w.id_order, range(6))
+        self.assertTrue(d.KNN.from_shapefile(self.polygon_path).id_order_set)
+        # smoothers require the id order of w
+        e = np.array([10, 8, 1, 4, 3, 5])
+        b = np.array([100, 95, 20, 80, 60, 40])
+        sr = ps.esda.smoothing.Spatial_Rate(e, b, w)
+        np.testing.assert_allclose(sr.r[0], (10 + 8 + 4) / 275.)
+
 class Test_DistanceBand(ut.TestCase, Distance_Mixin):
     def setUp(self):
         Distance_Mixin.setUp(self)
@@ -298,6 +309,38 @@ class Test_Kernel(ut.TestCase, Distance_Mixin):
         bws = w.bandwidth.tolist()
         np.testing.assert_allclose(bws, self.known_w4_abws, rtol=RTOL)
 
+    def test_functions(self):
+        points = np.asarray(self.poly_centroids)
+        dist = np.sqrt(((points[:, None] - points[None, :]) ** 2).sum(-1))
+        bws = np.linspace(0.8, 1.2, len(points))
+        z = dist / bws[:, None]
+        known = {'triangular': 1 - z,
+                 'uniform': np.ones(z.shape) * 0.5,
+                 'quadratic': (3. / 4) * (1 - z ** 2),
+                 'quartic': (15. / 16) * (1 - z ** 2) ** 2,
+                 'gaussian': (2 * np.pi) ** (-0.5) * np.exp(-(z ** 2) / 2.)}
+        for function, kernel in known.items():
+            w = d.Kernel(points, bandwidth=bws, function=function,
+                         diagonal=True)
+            np.fill_diagonal(kernel, 1.0)
+            kernel[z > 1] = 0
+            np.testing.assert_allclose(w.sparse.toarray(), kernel,
+                                       rtol=RTOL, atol=ATOL)
+
+    def test_arcdist(self):
+        w = d.Kernel(self.arc_kdt, fixed=False, k=4)
+        dmat, neigh = self.arc_kdt.query(self.arc_kdt.data, k=5)
+        known = 1 - dmat / w.bandwidth
+        for i in range(w.n):
+            np.testing.assert_allclose(w.weights[i], known[i], rtol=RTOL)
+        w = d.Kernel(self.arc_kdt, bandwidth=100.)
+        for i in range(w.n):
+            d_i, n_i = self.arc_kdt.query(self.arc_kdt.data[i],
+                                          k=len(w.neighbors[i]))
+            self.assertEqual(sorted(w.neighbors[i]), sorted(n_i))
+            np.testing.assert_allclose(sorted(w.weights[i]),
+                                       sorted(1 - d_i / 100.), rtol=RTOL)
+
 knn = ut.TestLoader().loadTestsFromTestCase(Test_KNN)
 kern = ut.TestLoader().loadTestsFromTestCase(Test_Kernel)
 db = ut.TestLoader().loadTestsFromTestCase(Test_DistanceBand)
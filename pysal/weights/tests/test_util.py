@@ -6,6 +6,7 @@ import numpy as np
 from scipy import sparse, float32
 from scipy.spatial import KDTree
 import os
+import tempfile
 import gc
 
 
@@ -92,6 +93,32 @@ class Testutil(unittest.TestCase):
         w5_20 = {2: 1.0, 10: 1.0, 6: 1.0}
         self.assertEquals(w5_20, w5_2[0])
 
+    def test_higher_order_csr(self):
+        w = pysal.lat2W(6, 7, rook=False)
+        dense = w.full()[0]
+        powers = [np.linalg.matrix_power(dense, j) > 0 for j in range(5)]
+        cum = np.zeros(dense.shape, bool)
+        lower = np.zeros(dense.shape, bool)
+        for k in range(1, 5):
+            exact = powers[k] & ~lower
+            lower |= powers[k]
+            cum |= exact
+            wk = pysal.weights.util.higher_order_csr(w.sparse, k, size=5)
+            np.testing.assert_array_equal(wk.toarray(),
+                                          exact & ~np.eye(w.n, dtype=bool))
+            wc = pysal.weights.util.higher_order_csr(w.sparse, k,
+                                                     cumulative=True,
+                                                     n_jobs=2, size=10)
+            np.testing.assert_array_equal(wc.toarray(),
+                                          cum & ~np.eye(w.n, dtype=bool))
+            wd = pysal.weights.util.higher_order_csr(w.sparse, k,
+                                                     diagonal=True)
+            np.testing.assert_array_equal(wd.toarray(), exact)
+            walks = pysal.weights.util.higher_order_csr(w.sparse, k,
+                                                        shortest_path=False,
+                                                        diagonal=True)
+            np.testing.assert_array_equal(walks.toarray(), powers[k])
+
     def test_shimbel(self):
         w5 = pysal.lat2W()
         w5_shimbel = pysal.shimbel(w5)
@@ -100,6 +127,28 @@ class Testutil(unittest.TestCase):
         w5_shimbel004 = [-1, 1, 2, 3]
         self.assertEquals(w5_shimbel004, w5_shimbel[0][0:4])
 
+    def test_shimbel_matrix(self):
+        w5 = pysal.lat2W()
+        w5_shimbel = pysal.shimbel(w5)
+        s = pysal.weights.util.shimbel_matrix(w5)
+        self.assertEquals(s.dtype, np.int32)
+        np.testing.assert_array_equal(s, [w5_shimbel[i] for i in w5.id_order])
+        s2 = pysal.weights.util.shimbel_matrix(w5.sparse, kmax=2,
+                                               dtype=np.int16, size=3,
+                                               n_jobs=2)
+        np.testing.assert_array_equal(s2, np.where(s > 2, 0, s))
+        self.assertRaises(ValueError, pysal.weights.util.shimbel_matrix,
+                          pysal.lat2W(150, 1), dtype=np.int8)
+        fd, filename = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            s3 = pysal.weights.util.shimbel_matrix(w5, filename=filename)
+            self.assertIsInstance(s3, np.memmap)
+            np.testing.assert_array_equal(s3, s)
+            del s3
+        finally:
+            os.remove(filename)
+
     def test_full(self):
         neighbors = {'first': ['second'], 'second': ['first',
                                                      'third'], 'third': ['second']}
@@ -204,6 +204,79 @@ class TestW(unittest.TestCase):
         w.transform = 'r'
         self.assertEquals(w.weights[0], [0.5, 0.5])
 
+    def test_transform_cache(self):
+        w = pysal.open(pysal.examples.get_path("stl.gal")).read()
+        w.transform = 'r'
+        sparse_r = w.sparse
+        s0_r = w.s0
+        w.transform = 'b'
+        self.assertEqual(w.s0, w.nonzero)
+        w.transform = 'r'
+        self.assertTrue(w.sparse is sparse_r)
+        self.assertEqual(w.s0, s0_r)
+        # every transformation matches the one built from its weights
+        for value in ['O', 'B', 'R', 'D', 'V']:
+            w.transform = value
+            full = np.zeros((w.n, w.n))
+            for i, id_i in enumerate(w.id_order):
+                for j, wij in zip(w.neighbors[id_i], w.weights[id_i]):
+                    full[i, w.id2i[j]] = wij
+            NPTA3E(w.sparse.toarray(), full)
+            NPTA3E(w.trcW2, np.trace(full.dot(full)))
+            NPTA3E(w.diagW2, np.diag(full.dot(full)))
+            NPTA3E(w.diagWtW, np.diag(full.T.dot(full)))
+            NPTA3E(w.trcWtW, np.trace(full.T.dot(full)))
+        w.transform = 'd'
+        NPTA3E(w.s0, 1.0)
+        w.transform = 'v'
+        NPTA3E(w.s0, w.n)
+        # changing the order drops the caches of all the transformations
+        w.id_order = w.id_order[::-1]
+        w.transform = 'r'
+        self.assertFalse(w.sparse is sparse_r)
+        NPTA3E(w.sparse.toarray(), sparse_r.toarray()[::-1, ::-1])
+
+    def test_user_weights(self):
+        w = pysal.lat2W(3, 3)
+        w.transform = 'r'
+        weights = dict((i, list(wi)) for i, wi in w.weights.items())
+        weights[0] = [10., 10.]
+        w.weights = weights
+        w._reset()
+        NPTA3E(w.sparse[0].data, [10., 10.])
+        self.assertEqual(w.s0, 28.)
+        # weights edited in place are used once w is reset
+        w = pysal.lat2W(3, 3)
+        w.transform = 'r'
+        w.weights[0][0] = 7.
+        w._reset()
+        NPTA3E(w.sparse[0].toarray(), [[0., 0.5, 0., 7., 0., 0., 0., 0., 0.]])
+        w.transform = 'b'
+        NPTA3E(w.sparse[0].data, [1., 1.])
+
+    def test_from_sparse(self):
+        sparse = self.w3x3.sparse
+        w = pysal.W.from_sparse(sparse)
+        self.assertTrue(w._neighbors is None)
+        self.assertEqual(w.n, 9)
+        self.assertEqual(w.cardinalities, self.w3x3.cardinalities)
+        NPTA3E(w.sparse.toarray(), sparse.toarray())
+        w.transform = 'r'
+        self.w3x3.transform = 'r'
+        NPTA3E(w.sparse.toarray(), self.w3x3.sparse.toarray())
+        self.assertTrue(w._neighbors is None)
+        self.assertEqual(w.neighbors[4], [1, 3, 5, 7])
+        self.assertEqual(w.weights[4], [0.25] * 4)
+        ids = ['id%i' % i for i in range(9)]
+        w = pysal.W.from_sparse(sparse, id_order=ids)
+        self.assertEqual(w.neighbors['id4'], ['id1', 'id3', 'id5', 'id7'])
+        self.assertEqual(w['id0'], {'id1': 1.0, 'id3': 1.0})
+        # reordering switches w over to the dictionaries
+        w.id_order = ids[::-1]
+        self.assertTrue(w._csr is None)
+        NPTA3E(w.sparse.toarray(), sparse.toarray()[::-1, ::-1])
+        self.assertRaises(ValueError, pysal.W.from_sparse, sparse[:3])
+
     def test_shimbel(self):
         d = {0: [-1, 1, 2, 1, 2, 3, 2, 3, 4],
              1: [1, -1, 1, 2, 1, 2, 3, 2, 3],
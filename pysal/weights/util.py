@@ -4,9 +4,11 @@ from pysal.common import *
 import pysal.weights
 import numpy as np
 from scipy import sparse, float32
+from scipy.sparse import csgraph
 import scipy.spatial
 import os
 import operator
+import multiprocessing as mp
 import scipy
 from warnings import warn
 
@@ -14,7 +16,8 @@ __all__ = ['lat2W', 'block_weights', 'comb', 'order', 'higher_order',
            'shimbel', 'remap_ids', 'full2W', 'full', 'WSP2W',
            'insert_diagonal', 'get_ids', 'get_points_array_from_shapefile',
            'min_threshold_distance', 'lat2SW', 'w_local_cluster',
-           'higher_order_sp', 'hexLat2W', 'regime_weights']
+           'higher_order_sp', 'higher_order_csr', 'hexLat2W',
+           'regime_weights', 'shimbel_matrix']
 
 
 KDTREE_TYPES = [scipy.spatial.KDTree, scipy.spatial.cKDTree]
@@ -403,30 +406,7 @@ def order(w, kmax=3):
     [1, -1, 1, 2, 1]
 
     """
-    #ids = w.neighbors.keys()
-    ids = w.id_order
-    info = {}
-    for id_ in ids:
-        s = [0] * w.n
-        s[ids.index(id_)] = -1
-        for j in w.neighbors[id_]:
-            s[ids.index(j)] = 1
-        k = 1
-        while k < kmax:
-            knext = k + 1
-            if s.count(k):
-                # get neighbors of order k
-                js = [ids[j] for j, val in enumerate(s) if val == k]
-                # get first order neighbors for order k neighbors
-                for j in js:
-                    next_neighbors = w.neighbors[j]
-                    for neighbor in next_neighbors:
-                        nid = ids.index(neighbor)
-                        if s[nid] == 0:
-                            s[nid] = knext
-            k = knext
-        info[id_] = s
-    return info
+    return dict(zip(w.id_order, shimbel_matrix(w, kmax=kmax).tolist()))
 
 
 def higher_order(w, k=2):
@@ -466,7 +446,7 @@ def higher_order(w, k=2):
     {0: 1.0, 2: 1.0, 6: 1.0}
     >>> w5_2 = higher_order(w5,2)
     >>> w5_2[0]
-    {10: 1.0, 2: 1.0, 6: 1.0}
+    {2: 1.0, 10: 1.0, 6: 1.0}
     """
     return higher_order_sp(w, k)
 
@@ -514,13 +494,13 @@ def higher_order_sp(w, k=2, shortest_path=True, diagonal=False):
     {1: 1.0, 5: 1.0}
     >>> w25_2 = pysal.weights.util.higher_order_sp(w25, 2)
     >>> w25_2[0]
-    {10: 1.0, 2: 1.0, 6: 1.0}
+    {2: 1.0, 10: 1.0, 6: 1.0}
     >>> w25_2 = pysal.weights.util.higher_order_sp(w25, 2, diagonal=True)
     >>> w25_2[0]
-    {0: 1.0, 10: 1.0, 2: 1.0, 6: 1.0}
+    {0: 1.0, 2: 1.0, 10: 1.0, 6: 1.0}
     >>> w25_3 = pysal.weights.util.higher_order_sp(w25, 3)
     >>> w25_3[0]
-    {15: 1.0, 3: 1.0, 11: 1.0, 7: 1.0}
+    {11: 1.0, 15: 1.0, 3: 1.0, 7: 1.0}
     >>> w25_3 = pysal.weights.util.higher_order_sp(w25, 3, shortest_path=False)
     >>> w25_3[0]
     {1: 1.0, 3: 1.0, 5: 1.0, 7: 1.0, 11: 1.0, 15: 1.0}
@@ -539,37 +519,190 @@ def higher_order_sp(w, k=2, shortest_path=True, diagonal=False):
         raise TypeError("Weights provided are neither a binary W object nor "
                         "a scipy.sparse.csr_matrix")
 
-    wk = w**k
-    rk, ck = wk.nonzero()
-    sk = set(zip(rk, ck))
+    wk = higher_order_csr(w, k, shortest_path=shortest_path,
+                          diagonal=diagonal).astype(float)
 
-    if shortest_path:
-        for j in range(1, k):
-            wj = w**j
-            rj, cj = wj.nonzero()
-            sj = set(zip(rj, cj))
-            sk.difference_update(sj)
+    if id_order:
+        return pysal.W.from_sparse(wk, id_order=list(id_order))
+    else:
+        return pysal.weights.WSP(wk)
 
-    if not diagonal:
-        sk = set([(i,j) for i,j in sk if i!=j])
 
-    if id_order:
-        d = dict([(i,[]) for i in id_order])
-        for pair in sk:
-            k, v = pair
-            k = id_order[k]
-            v = id_order[v]
-            d[k].append(v)
-        return pysal.W(neighbors=d)
+def higher_order_csr(graph, k=2, cumulative=False, shortest_path=True,
+                     diagonal=False, size=None, n_jobs=1):
+    """
+    Contiguity of order k, or up to order k, as a sparse matrix.
+
+    Parameters
+    ----------
+
+    graph         : scipy.sparse matrix
+                    (n, n) first order contiguity, only the pattern of its
+                    nonzero elements is used
+
+    k             : int
+                    Order of contiguity
+
+    cumulative    : boolean
+                    True: i,j are neighbors if they are neighbors of any
+                    order from 1 to k
+                    False: i,j are neighbors if they are k-order neighbors
+
+    shortest_path : boolean
+                    True: i,j and k-order neighbors if the
+                    shortest path for i,j is k
+                    False: i,j are k-order neighbors if there
+                    is a path from i,j of length k
+
+    diagonal      : boolean
+                    True:  keep k-order (i,j) joins when i==j
+                    False: remove k-order (i,j) joins when i==j
+
+    size          : int
+                    Number of observations whose neighbors are searched
+                    together, by default a batch reaches about 2**22 pairs
+                    when every observation has the average number of
+                    neighbors.
+
+    n_jobs        : int
+                    Number of processes searching the batches, -1 uses all
+                    available cores.
+
+    Returns
+    -------
+
+    wk            : scipy.sparse.csr_matrix
+                    (n, n) binary matrix of the neighbor pairs
+
+    Notes
+    -----
+    The neighbors are found by a breadth-first search over the CSR arrays
+    of graph from each batch of observations at once. Only the frontier
+    and the observations already reached are kept for a batch, so no power
+    of graph is formed. With shortest_path=False the frontier is not
+    pruned and row i holds the observations reached by a path of length
+    k, the pattern of row i of graph**k.
+
+    Examples
+    --------
+
+    >>> import pysal
+    >>> w25 = pysal.lat2W(5,5)
+    >>> w25_2 = pysal.weights.util.higher_order_csr(w25.sparse, 2)
+    >>> w25_2[0].indices
+    array([ 2,  6, 10], dtype=int32)
+    >>> w25_12 = pysal.weights.util.higher_order_csr(w25.sparse, 2,
+    ...                                              cumulative=True)
+    >>> w25_12[0].indices
+    array([ 1,  2,  5,  6, 10], dtype=int32)
+    """
+    graph = sparse.csr_matrix(graph)
+    n = graph.shape[0]
+    if size is None:
+        mean = max(graph.nnz / max(n, 1), 1)
+        size = max(1, int(2 ** 22 // mean ** min(k, 22)))
+    size = int(min(size, max(n, 1)))
+    tasks = [(start, min(start + size, n), k, cumulative, shortest_path,
+              diagonal) for start in range(0, n, size)]
+    data = (graph.indptr, graph.indices, n)
+    if n_jobs == -1:
+        n_jobs = mp.cpu_count()
+    if n_jobs > 1 and len(tasks) > 1:
+        pool = mp.Pool(min(n_jobs, len(tasks)), _frontier_init, data)
+        try:
+            blocks = pool.map(_higher_order_rows, tasks)
+        finally:
+            pool.close()
+            pool.join()
     else:
-        d = {}
-        for pair in sk:
-            k, v = pair
-            if k in d:
-                d[k].append(v)
-            else:
-                d[k] = [v]
-        return pysal.weights.WSP(pysal.W(neighbors=d).sparse)
+        _frontier_init(*data)
+        try:
+            blocks = [_higher_order_rows(task) for task in tasks]
+        finally:
+            _FRONTIER.clear()
+    if not blocks:
+        return sparse.csr_matrix((n, n), dtype=bool)
+    return sparse.vstack(blocks, format='csr')
+
+
+# binary graph searched by the frontier workers, set once per process
+_FRONTIER = {}
+
+
+def _frontier_init(indptr, indices, n):
+    """
+    Set up a worker with the binary pattern of the graph.
+    """
+    data = np.ones(len(indices), dtype=bool)
+    _FRONTIER['graph'] = sparse.csr_matrix((data, indices, indptr),
+                                           shape=(n, n))
+
+
+def _frontiers(graph, sources, kmax, shortest_path=True):
+    """
+    Breadth-first search from several sources at once.
+
+    Yields, for each order k from 1 to kmax, a boolean CSR matrix with one
+    row for each source marking the observations at order k, and a boolean
+    array flagging the sources reached again by a path of length k. With
+    shortest_path, observations are only marked at the order of their
+    shortest path; otherwise every observation reached by a path of length
+    k is marked. The search stops early when no observation is marked.
+    """
+    b, n = len(sources), graph.shape[0]
+    rows = np.arange(b)
+    frontier = sparse.csr_matrix((np.ones(b, dtype=bool), sources,
+                                  np.arange(b + 1)), shape=(b, n))
+    visited = frontier
+    for k in range(1, kmax + 1):
+        reached = frontier * graph
+        coo_rows = np.repeat(rows, np.diff(reached.indptr))
+        back = np.zeros(b, dtype=bool)
+        back[coo_rows[reached.indices == sources[coo_rows]]] = True
+        if shortest_path:
+            reached = reached - reached.multiply(visited)
+            reached.eliminate_zeros()
+            visited = visited + reached
+        yield k, reached, back
+        if not reached.nnz:
+            break
+        frontier = reached
+
+
+def _higher_order_rows(task):
+    """
+    Rows start to stop of higher_order_csr.
+    """
+    start, stop, k, cumulative, shortest_path, diagonal = task
+    graph = _FRONTIER['graph']
+    n = graph.shape[0]
+    sources = np.arange(start, stop)
+    b = len(sources)
+    out = sparse.csr_matrix((b, n), dtype=bool)
+    closed = np.zeros(b, dtype=int)
+    for order, ring, back in _frontiers(graph, sources, k, shortest_path):
+        closed[(closed == 0) & back] = order
+        if cumulative:
+            out = out + ring
+        elif order == k:
+            out = ring
+    if shortest_path and diagonal:
+        # a source is its own neighbor at the length of its shortest cycle
+        if cumulative:
+            keep = closed > 0
+        else:
+            keep = closed == k
+        out = out + sparse.csr_matrix((np.ones(keep.sum(), dtype=bool),
+                                       (np.flatnonzero(keep), sources[keep])),
+                                      shape=(b, n))
+    elif not diagonal:
+        self_loops = sparse.csr_matrix((np.ones(b, dtype=bool), sources,
+                                        np.arange(b + 1)), shape=(b, n))
+        out = out - out.multiply(self_loops)
+    out = sparse.csr_matrix(out)
+    out.eliminate_zeros()
+    out.sort_indices()
+    return out
 
 
 def w_local_cluster(w):
@@ -620,14 +753,13 @@ def w_local_cluster(w):
 
     """
 
-    c = np.zeros((w.n, 1), float)
     w.transformation = 'b'
-    for i, id in enumerate(w.id_order):
-        ki = max(w.cardinalities[id], 1)  # deal with islands
-        Ni = w.neighbors[id]
-        wi = pysal.w_subset(w, Ni).full()[0]
-        c[i] = wi.sum() / (ki * (ki - 1))
-    return c
+    pattern = w.sparse.tocsr(copy=True)
+    pattern.data = np.ones_like(pattern.data)
+    # the joins between pairs of neighbors of i number (A A A')_ii
+    joins = (pattern * pattern).multiply(pattern).sum(axis=1)
+    ki = np.maximum(np.diff(pattern.indptr), 1)  # deal with islands
+    return np.asarray(joins, dtype=float) / (ki * (ki - 1.))[:, None]
 
 
 def shimbel(w):
@@ -658,30 +790,149 @@ def shimbel(w):
     >>>
     """
 
-    info = {}
-    ids = w.id_order
-    for i in ids:
-        s = [0] * w.n
-        s[ids.index(i)] = -1
-        for j in w.neighbors[i]:
-            s[ids.index(j)] = 1
-        k = 1
-        flag = s.count(0)
-        while flag:
-            p = -1
-            knext = k + 1
-            for j in range(s.count(k)):
-                neighbor = s.index(k, p + 1)
-                p = neighbor
-                next_neighbors = w.neighbors[ids[p]]
-                for neighbor in next_neighbors:
-                    nid = ids.index(neighbor)
-                    if s[nid] == 0:
-                        s[nid] = knext
-            k = knext
-            flag = s.count(0)
-        info[i] = s
-    return info
+    return dict(zip(w.id_order, shimbel_matrix(w).tolist()))
+
+
+def shimbel_matrix(w, kmax=None, dtype=np.int32, filename=None, size=None,
+                   n_jobs=1):
+    """
+    Shimbel matrix of the lengths of the shortest contiguity paths between
+    all pairs of observations.
+
+    Parameters
+    ----------
+    w        : W
+               spatial weights object, or a scipy.sparse matrix whose
+               nonzero elements are the first order neighbors
+
+    kmax     : int
+               (Optional) paths longer than kmax are not searched and left
+               as 0
+
+    dtype    : numpy dtype
+               signed integer type of the matrix, np.int16 takes half the
+               memory of the default np.int32 for paths up to 32767 joins
+
+    filename : str
+               (Optional) write the matrix to a numpy memmap in this file
+               instead of keeping it in memory
+
+    size     : int
+               number of observations searched together, by default a
+               batch covers about 2**22 pairs
+
+    n_jobs   : int
+               number of processes searching the batches, -1 uses all
+               available cores
+
+    Returns
+    -------
+
+    s        : array, memmap
+               (n, n) shortest order between each pair of observations,
+               in the order of w.id_order, with -1 on the diagonal and 0
+               for pairs that are not connected within kmax joins
+
+    Notes
+    -----
+    A breadth first search runs from each observation over the CSR arrays
+    of w. The workers receive the arrays once and write their rows straight
+    into the shared or memmapped matrix.
+
+    Examples
+    --------
+    >>> from pysal import lat2W
+    >>> w5 = lat2W()
+    >>> s = shimbel_matrix(w5)
+    >>> s[0, 24]
+    8
+    >>> s[0, :4]
+    array([-1,  1,  2,  3], dtype=int32)
+    >>> shimbel_matrix(w5, kmax=2, dtype=np.int16)[0, :4]
+    array([-1,  1,  2,  0], dtype=int16)
+    """
+    if issubclass(type(w), pysal.weights.W):
+        graph = w.sparse
+    else:
+        graph = w
+    graph = sparse.csr_matrix(graph)
+    n = graph.shape[0]
+    dtype = np.dtype(dtype)
+    if dtype.kind != 'i':
+        raise ValueError('dtype must be a signed integer type')
+    if kmax is None:
+        kmax = np.inf
+    if size is None:
+        size = max(1, 2 ** 22 // max(n, 1))
+    if n_jobs == -1:
+        n_jobs = mp.cpu_count()
+
+    if filename is not None:
+        out = np.memmap(filename, dtype=dtype, mode='w+', shape=(n, n))
+        target = ('memmap', filename)
+    elif n_jobs > 1:
+        raw = mp.RawArray(dtype.char, n * n)
+        out = np.frombuffer(raw, dtype=dtype).reshape(n, n)
+        target = ('shared', raw)
+    else:
+        out = np.empty((n, n), dtype=dtype)
+        target = ('array', out)
+    tasks = [(start, min(start + size, n)) for start in range(0, n, size)]
+    data = (graph.indptr, graph.indices, n, target, dtype, kmax)
+    if n_jobs > 1 and len(tasks) > 1:
+        pool = mp.Pool(min(n_jobs, len(tasks)), _shimbel_init, data)
+        try:
+            pool.map(_shimbel_rows, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _shimbel_init(*data)
+        try:
+            map(_shimbel_rows, tasks)
+        finally:
+            _FRONTIER.clear()
+    if filename is not None:
+        out.flush()
+    return out
+
+
+def _shimbel_init(indptr, indices, n, target, dtype, kmax):
+    """
+    Set up a shimbel_matrix worker with the graph and the output.
+    """
+    data = np.ones(len(indices))
+    _FRONTIER['graph'] = sparse.csr_matrix((data, indices, indptr),
+                                           shape=(n, n))
+    kind, where = target
+    if kind == 'memmap':
+        out = np.memmap(where, dtype=dtype, mode='r+', shape=(n, n))
+    elif kind == 'shared':
+        out = np.frombuffer(where, dtype=dtype).reshape(n, n)
+    else:
+        out = where
+    _FRONTIER.update(out=out, kmax=kmax)
+
+
+def _shimbel_rows(task):
+    """
+    Rows start to stop of shimbel_matrix.
+    """
+    start, stop = task
+    graph, out, kmax = _FRONTIER['graph'], _FRONTIER['out'], _FRONTIER['kmax']
+    sources = np.arange(start, stop)
+    d = csgraph.dijkstra(graph, indices=sources, unweighted=True, limit=kmax)
+    d[np.isinf(d)] = 0
+    if d.max() > np.iinfo(out.dtype).max:
+        raise ValueError('paths are longer than the largest %s' % out.dtype)
+    rows = np.arange(len(sources))
+    d[rows, sources] = -1
+    # an observation listed among its own neighbors is of order 1
+    loops = np.asarray(graph[sources, sources]).ravel() > 0
+    d[rows[loops], sources[loops]] = 1
+    out[start:stop] = d
+    if isinstance(out, np.memmap):
+        out.flush()
 
 
 def full(w):
@@ -779,19 +1030,7 @@ def full2W(m, ids=None):
     '''
     if m.shape[0] != m.shape[1]:
         raise ValueError('Your array is not square')
-    neighbors, weights = {}, {}
-    for i in xrange(m.shape[0]):
-    # for i, row in enumerate(m):
-        row = m[i]
-        if ids:
-            i = ids[i]
-        ngh = list(row.nonzero()[0])
-        weights[i] = list(row[ngh])
-        ngh = list(ngh)
-        if ids:
-            ngh = [ids[j] for j in ngh]
-        neighbors[i] = ngh
-    return pysal.W(neighbors, weights, id_order=ids)
+    return pysal.W.from_sparse(sparse.csr_matrix(m), id_order=ids)
 
 
 def WSP2W(wsp, silent_island_warning=False):
@@ -835,30 +1074,9 @@ def WSP2W(wsp, silent_island_warning=False):
     [ 0.  1.  0.  0.  0.  1.  0.  0.  0.  0.]
 
     """
-    wsp.sparse
-    indices = wsp.sparse.indices
-    data = wsp.sparse.data
-    indptr = wsp.sparse.indptr
-    id_order = wsp.id_order
-    if id_order:
-        # replace indices with user IDs
-        indices = [id_order[i] for i in indices]
-    else:
-        id_order = range(wsp.n)
-    neighbors, weights = {}, {}
-    start = indptr[0]
-    for i in xrange(wsp.n):
-        oid = id_order[i]
-        end = indptr[i + 1]
-        neighbors[oid] = indices[start:end]
-        weights[oid] = data[start:end]
-        start = end
     ids = copy.copy(wsp.id_order)
-    w = pysal.W(neighbors, weights, ids,
-                silent_island_warning=silent_island_warning)
-    w._sparse = copy.deepcopy(wsp.sparse)
-    w._cache['sparse'] = w._sparse
-    return w
+    return pysal.W.from_sparse(wsp.sparse.copy(), id_order=ids,
+                               silent_island_warning=silent_island_warning)
 
 def insert_diagonal(w, val=1.0, wsp=False):
     warn('This function is deprecated. Use fill_diagonal instead.')
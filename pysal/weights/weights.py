@@ -6,6 +6,7 @@ __author__ = "Sergio J. Rey <srey@asu.edu> "
 import math
 import warnings
 import numpy as np
+from itertools import chain
 import scipy.sparse
 from os.path import basename as BASENAME
 from .util import full, WSP2W
@@ -159,27 +160,73 @@ class W(object):
 
     """
 
+    # transformation codes derived from the original weights
+    _STANDARD_TRANSFORMS = ('O', 'B', 'R', 'D', 'V')
+    # cached properties shared by all the transformations
+    _SHARED_CACHE = ('id2i', 'n', 'neighbors_0', 'cardinalities',
+                     'max_neighbors', 'mean_neighbors', 'min_neighbors',
+                     'islands', 'histogram', 'sd', '_coo')
+
     def __init__(self, neighbors, weights=None, id_order=None,
         silent_island_warning=False, ids=None):
         self.silent_island_warning = silent_island_warning
         self.transformations = {}
+        self._cache = {}
+        self._transform_cache = {}
+        self._user_transforms = set()
+        self._csr = None
         self.neighbors = neighbors
         if not weights:
             weights = {}
             for key in neighbors:
                 weights[key] = [1.] * len(neighbors[key])
-        self.weights = weights
-        self.transformations['O'] = self.weights.copy()  # original weights
+        self.transformations['O'] = weights.copy()  # original weights
+        self._setup(id_order)
+
+    def _init_from_sparse(self, sparse, id_order=None,
+                          silent_island_warning=False, sort_indices=True):
+        """Initialize w from the arrays of a sparse matrix.
+
+        w.neighbors and w.weights are only built if they are accessed.
+        Unless sort_indices is False, neighbors are listed in column order;
+        otherwise they keep the storage order of sparse.
+
+        """
+        sparse = scipy.sparse.csr_matrix(sparse)
+        if sparse.shape[0] != sparse.shape[1]:
+            raise ValueError("Weights object must be square")
+        if sort_indices and not sparse.has_sorted_indices:
+            sparse = sparse.sorted_indices()
+        self.silent_island_warning = silent_island_warning
+        self.transformations = {}
+        self._cache = {}
+        self._transform_cache = {}
+        self._user_transforms = set()
+        self._csr = sparse
+        self._neighbors = None
+        if id_order is not None:
+            id_order = list(id_order)
+            if len(id_order) != sparse.shape[0]:
+                raise ValueError(
+                    "Number of values in id_order must match shape of sparse")
+        self._setup(id_order)
+
+    def _setup(self, id_order):
+        """Set the id order and check for islands.
+
+        """
         self.transform = 'O'
         if id_order is None:
-            self._id_order = self.neighbors.keys()
-            self._id_order.sort()
+            if self._csr is None:
+                self._id_order = self.neighbors.keys()
+                self._id_order.sort()
+            else:
+                self._id_order = range(self._csr.shape[0])
             self._id_order_set = False
         else:
             self._id_order = id_order
             self._id_order_set = True
         self._reset()
-        self._n = len(self.weights)
         if self.islands and not self.silent_island_warning:
             ni = len(self.islands)
             if ni == 1:
@@ -192,9 +239,75 @@ class W(object):
     def _reset(self):
         """Reset properties.
 
+        Properties are cached separately for every transformation that has
+        been used, so this drops the caches of all of them. If the weights
+        dictionary of the current transformation has been built it may have
+        been edited in place, so it is used from now on instead of deriving
+        the weights from the original ones.
+
         """
+        if self._transform in self.transformations:
+            self._user_transforms.add(self._transform)
         self._cache = {}
-   
+        self._transform_cache = {self._transform: self._cache}
+
+    def _drop_csr(self):
+        """Build the neighbors and original weights dictionaries of a w
+        constructed from a sparse matrix and use them from now on.
+
+        """
+        if self._csr is not None:
+            self._neighbors = self.neighbors
+            if 'O' not in self.transformations:
+                self.transformations['O'] = self._build_weights(self._coo[2])
+            self._csr = None
+
+    @classmethod
+    def from_sparse(cls, sparse, id_order=None, silent_island_warning=False):
+        """Construct a W directly from a scipy sparse matrix.
+
+        The W is backed by the CSR arrays of the matrix. w.neighbors,
+        w.weights and w.cardinalities are generated on first access, so
+        statistics that only use w.sparse never build them.
+
+        Parameters
+        ----------
+        sparse                : scipy sparse matrix
+                                (n, n) weights matrix, the arrays of a CSR
+                                matrix with sorted indices are shared with w,
+                                not copied
+        id_order              : list
+                                ids aligned with the rows of sparse, if None
+                                the row offsets are used
+        silent_island_warning : boolean
+                                By default PySAL will print a warning if the
+                                dataset contains any disconnected observations
+                                or islands. To silence this warning set this
+                                parameter to True.
+
+        Returns
+        -------
+        w                     : W
+
+        Examples
+        --------
+        >>> import pysal
+        >>> sp = pysal.weights.lat2SW(2, 5)
+        >>> w = pysal.W.from_sparse(sp)
+        >>> w.n
+        10
+        >>> w.neighbors[0]
+        [1, 5]
+        >>> w.transform = 'r'
+        >>> w.weights[0]
+        [0.5, 0.5]
+
+        """
+        w = W.__new__(W)
+        w._init_from_sparse(sparse, id_order=id_order,
+                            silent_island_warning=silent_island_warning)
+        return w
+
     @classmethod
     def from_file(cls, path='', format=None, **kwargs):
         f = popen(dataPath=path, mode='r', dataFormat=format)
@@ -216,6 +329,126 @@ class W(object):
     def from_WSP(cls, WSP, silent_island_warning=True):
         return WSP2W(WSP, silent_island_warning=silent_island_warning)
 
+    @property
+    def neighbors(self):
+        """Dictionary of neighbor ids.
+
+        Key is region ID, value is a list of the ids of its neighbors.
+
+        """
+        if self._neighbors is None:
+            ids = self._id_order
+            indptr = self._csr.indptr.tolist()
+            indices = self._csr.indices.tolist()
+            if self._id_order_set:
+                indices = [ids[j] for j in indices]
+            neighbors = {}
+            for i, id_i in enumerate(ids):
+                neighbors[id_i] = indices[indptr[i]:indptr[i + 1]]
+            self._neighbors = neighbors
+        return self._neighbors
+
+    @neighbors.setter
+    def neighbors(self, value):
+        self._drop_csr()
+        self._neighbors = value
+
+    @property
+    def weights(self):
+        """Dictionary of edge weights under the current transformation.
+
+        Key is region ID, value is a list of weights aligned with
+        w.neighbors. For the standard transformations the dictionary is only
+        built the first time it is requested.
+
+        """
+        if self._transform not in self.transformations:
+            self.transformations[self._transform] = self._build_weights(
+                self._data)
+        return self.transformations[self._transform]
+
+    @weights.setter
+    def weights(self, value):
+        self._drop_csr()
+        self.transformations[self._transform] = value
+        self._user_transforms.add(self._transform)
+
+    def _build_weights(self, data):
+        """Construct a weights dictionary from a flat array aligned with
+        w._coo.
+
+        """
+        data = data.tolist()
+        weights = {}
+        start = 0
+        for i in self._id_order:
+            end = start + self.cardinalities[i]
+            weights[i] = data[start:end]
+            start = end
+        return weights
+
+    @property
+    def _coo(self):
+        """Row and column offsets and original weights of all the edges,
+        ordered by w.id_order and then by w.neighbors.
+
+        """
+        if '_coo' not in self._cache and self._csr is not None:
+            csr = self._csr
+            row = np.repeat(np.arange(self.n), np.diff(csr.indptr))
+            data = csr.data.astype(float)
+            self._cache['_coo'] = row, csr.indices, data
+        if '_coo' not in self._cache:
+            ids = self._id_order
+            offsets = self.neighbor_offsets
+            original = self.transformations['O']
+            cards = np.array([self.cardinalities[i] for i in ids], dtype=int)
+            row = np.repeat(np.arange(self.n), cards)
+            col = np.fromiter(chain.from_iterable(offsets[i] for i in ids),
+                              dtype=int, count=cards.sum())
+            data = np.fromiter(chain.from_iterable(original[i] for i in ids),
+                               dtype=float, count=cards.sum())
+            self._cache['_coo'] = row, col, data
+        return self._cache['_coo']
+
+    @property
+    def _data(self):
+        """Weights of the current transformation aligned with w._coo.
+
+        The standard transformations are derived directly from the original
+        weights rather than from dictionaries, unless their weights have been
+        assigned or edited and w._reset() called.
+
+        """
+        if '_data' not in self._cache:
+            row, col, data = self._coo
+            value = self._transform
+            if value in self._user_transforms:
+                weights = self.weights
+                data = np.fromiter(
+                    chain.from_iterable(weights[i] for i in self._id_order),
+                    dtype=float, count=len(data))
+            elif value == 'O':
+                pass
+            elif value == 'B':
+                data = np.ones_like(data)
+            elif value == 'R':
+                row_sum = np.bincount(row, data, minlength=self.n)
+                data = data / row_sum[row]
+            elif value == 'D':
+                data = data / data.sum()
+            elif value == 'V':
+                q = np.sqrt(np.bincount(row, data * data, minlength=self.n))
+                s = data / q[row]
+                data = s * (self.n / s.sum())
+            else:
+                weights = self.weights
+                data = np.fromiter(
+                    chain.from_iterable(weights[i] for i in self._id_order),
+                    dtype=float, count=len(data))
+            self._cache['_data'] = data
+        return self._cache['_data']
+
     @property
     def sparse(self):
         """Sparse matrix object.
@@ -225,28 +458,20 @@ class W(object):
 
         """
         if 'sparse' not in self._cache:
-            self._sparse = self._build_sparse()
-            self._cache['sparse'] = self._sparse
-        return self._sparse
+            self._cache['sparse'] = self._build_sparse()
+        return self._cache['sparse']
 
     def _build_sparse(self):
         """Construct the sparse attribute.
 
         """
-
-        row = []
-        col = []
-        data = []
-        id2i = self.id2i
-        for i, neigh_list in self.neighbor_offsets.iteritems():
-            card = self.cardinalities[i]
-            row.extend([id2i[i]] * card)
-            col.extend(neigh_list)
-            data.extend(self.weights[i])
-        row = np.array(row)
-        col = np.array(col)
-        data = np.array(data)
-        s = scipy.sparse.csr_matrix((data, (row, col)), shape=(self.n, self.n))
+        if self._csr is not None:
+            csr = self._csr
+            return scipy.sparse.csr_matrix(
+                (self._data, csr.indices, csr.indptr), shape=csr.shape)
+        row, col, data = self._coo
+        s = scipy.sparse.csr_matrix((self._data, (row, col)),
+                                    shape=(self.n, self.n))
         return s
 
     @property
@@ -256,12 +481,11 @@ class W(object):
 
         """
         if 'id2i' not in self._cache:
-            self._id2i = {}
+            id2i = {}
             for i, id_i in enumerate(self._id_order):
-                self._id2i[id_i] = i
-            self._id2i = self._id2i
-            self._cache['id2i'] = self._id2i
-        return self._id2i
+                id2i[id_i] = i
+            self._cache['id2i'] = id2i
+        return self._cache['id2i']
 
     @property
     def n(self):
@@ -269,9 +493,11 @@ class W(object):
 
         """
         if "n" not in self._cache:
-            self._n = len(self.neighbors)
-            self._cache['n'] = self._n
-        return self._n
+            if self._csr is not None:
+                self._cache['n'] = self._csr.shape[0]
+            else:
+                self._cache['n'] = len(self.neighbors)
+        return self._cache['n']
 
     @property
     def s0(self):
@@ -283,9 +509,8 @@ class W(object):
 
         """
         if 's0' not in self._cache:
-            self._s0 = self.sparse.sum()
-            self._cache['s0'] = self._s0
-        return self._s0
+            self._cache['s0'] = self.sparse.sum()
+        return self._cache['s0']
 
     @property
     def s1(self):
@@ -300,9 +525,8 @@ class W(object):
             t = self.sparse.transpose()
             t = t + self.sparse
             t2 = t.multiply(t)  # element-wise square
-            self._s1 = t2.sum() / 2.
-            self._cache['s1'] = self._s1
-        return self._s1
+            self._cache['s1'] = t2.sum() / 2.
+        return self._cache['s1']
 
     @property
     def s2array(self):
@@ -315,9 +539,9 @@ class W(object):
         """
         if 's2array' not in self._cache:
             s = self.sparse
-            self._s2array = np.array(s.sum(1) + s.sum(0).transpose()) ** 2
-            self._cache['s2array'] = self._s2array
-        return self._s2array
+            self._cache['s2array'] = np.array(s.sum(1) +
+                                              s.sum(0).transpose()) ** 2
+        return self._cache['s2array']
 
     @property
     def s2(self):
@@ -329,9 +553,8 @@ class W(object):
 
         """
         if 's2' not in self._cache:
-            self._s2 = self.s2array.sum()
-            self._cache['s2'] = self._s2
-        return self._s2
+            self._cache['s2'] = self.s2array.sum()
+        return self._cache['s2']
 
     @property
     def trcW2(self):
@@ -343,9 +566,8 @@ class W(object):
 
         """
         if 'trcW2' not in self._cache:
-            self._trcW2 = self.diagW2.sum()
-            self._cache['trcw2'] = self._trcW2
-        return self._trcW2
+            self._cache['trcW2'] = self.diagW2.sum()
+        return self._cache['trcW2']
 
     @property
     def diagW2(self):
@@ -356,10 +578,12 @@ class W(object):
         trcW2
 
         """
-        if 'diagw2' not in self._cache:
-            self._diagW2 = (self.sparse * self.sparse).diagonal()
-            self._cache['diagW2'] = self._diagW2
-        return self._diagW2
+        if 'diagW2' not in self._cache:
+            # (WW)_ii = sum_j w_ij w_ji, no need to form WW
+            s = self.sparse
+            d = s.multiply(s.transpose()).sum(1)
+            self._cache['diagW2'] = np.asarray(d).flatten()
+        return self._cache['diagW2']
 
     @property
     def diagWtW(self):
@@ -371,9 +595,11 @@ class W(object):
 
         """
         if 'diagWtW' not in self._cache:
-            self._diagWtW = (self.sparse.transpose() * self.sparse).diagonal()
-            self._cache['diagWtW'] = self._diagWtW
-        return self._diagWtW
+            # (W'W)_jj = sum_i w_ij^2, the column sums of the squared weights
+            s = self.sparse
+            d = np.bincount(s.indices, s.data * s.data, minlength=self.n)
+            self._cache['diagWtW'] = d
+        return self._cache['diagWtW']
 
     @property
     def trcWtW(self):
@@ -385,9 +611,8 @@ class W(object):
 
         """
         if 'trcWtW' not in self._cache:
-            self._trcWtW = self.diagWtW.sum()
-            self._cache['trcWtW'] = self._trcWtW
-        return self._trcWtW
+            self._cache['trcWtW'] = self.diagWtW.sum()
+        return self._cache['trcWtW']
 
     @property
     def diagWtW_WW(self):
@@ -395,11 +620,8 @@ class W(object):
 
         """
         if 'diagWtW_WW' not in self._cache:
-            wt = self.sparse.transpose()
-            w = self.sparse
-            self._diagWtW_WW = (wt * w + w * w).diagonal()
-            self._cache['diagWtW_WW'] = self._diagWtW_WW
-        return self._diagWtW_WW
+            self._cache['diagWtW_WW'] = self.diagWtW + self.diagW2
+        return self._cache['diagWtW_WW']
 
     @property
     def trcWtW_WW(self):
@@ -407,9 +629,8 @@ class W(object):
 
         """
         if 'trcWtW_WW' not in self._cache:
-            self._trcWtW_WW = self.diagWtW_WW.sum()
-            self._cache['trcWtW_WW'] = self._trcWtW_WW
-        return self._trcWtW_WW
+            self._cache['trcWtW_WW'] = self.diagWtW_WW.sum()
+        return self._cache['trcWtW_WW']
 
     @property
     def pct_nonzero(self):
@@ -417,9 +638,9 @@ class W(object):
 
         """
         if 'pct_nonzero' not in self._cache:
-            self._pct_nonzero = 100. * self.sparse.nnz / (1. * self._n ** 2)
-            self._cache['pct_nonzero'] = self._pct_nonzero
-        return self._pct_nonzero
+            self._cache['pct_nonzero'] = (100. * self.sparse.nnz /
+                                          (1. * self.n ** 2))
+        return self._cache['pct_nonzero']
 
     @property
     def cardinalities(self):
@@ -427,12 +648,15 @@ class W(object):
 
         """
         if 'cardinalities' not in self._cache:
-            c = {}
-            for i in self._id_order:
-                c[i] = len(self.neighbors[i])
-            self._cardinalities = c
-            self._cache['cardinalities'] = self._cardinalities
-        return self._cardinalities
+            if self._csr is not None:
+                cards = np.diff(self._csr.indptr).tolist()
+                c = dict(zip(self._id_order, cards))
+            else:
+                c = {}
+                for i in self._id_order:
+                    c[i] = len(self.neighbors[i])
+            self._cache['cardinalities'] = c
+        return self._cache['cardinalities']
 
     @property
     def max_neighbors(self):
@@ -440,9 +664,8 @@ class W(object):
 
         """
         if 'max_neighbors' not in self._cache:
-            self._max_neighbors = max(self.cardinalities.values())
-            self._cache['max_neighbors'] = self._max_neighbors
-        return self._max_neighbors
+            self._cache['max_neighbors'] = max(self.cardinalities.values())
+        return self._cache['max_neighbors']
 
     @property
     def mean_neighbors(self):
@@ -450,9 +673,9 @@ class W(object):
 
         """
         if 'mean_neighbors' not in self._cache:
-            self._mean_neighbors = np.mean(self.cardinalities.values())
-            self._cache['mean_neighbors'] = self._mean_neighbors
-        return self._mean_neighbors
+            self._cache['mean_neighbors'] = np.mean(
+                self.cardinalities.values())
+        return self._cache['mean_neighbors']
 
     @property
     def min_neighbors(self):
@@ -460,9 +683,8 @@ class W(object):
 
         """
         if 'min_neighbors' not in self._cache:
-            self._min_neighbors = min(self.cardinalities.values())
-            self._cache['min_neighbors'] = self._min_neighbors
-        return self._min_neighbors
+            self._cache['min_neighbors'] = min(self.cardinalities.values())
+        return self._cache['min_neighbors']
 
     @property
     def nonzero(self):
@@ -470,9 +692,8 @@ class W(object):
 
         """
         if 'nonzero' not in self._cache:
-            self._nonzero = self.sparse.nnz
-            self._cache['nonzero'] = self._nonzero
-        return self._nonzero
+            self._cache['nonzero'] = self.sparse.nnz
+        return self._cache['nonzero']
 
     @property
     def sd(self):
@@ -480,9 +701,8 @@ class W(object):
 
         """
         if 'sd' not in self._cache:
-            self._sd = np.std(self.cardinalities.values())
-            self._cache['sd'] = self._sd
-        return self._sd
+            self._cache['sd'] = np.std(self.cardinalities.values())
+        return self._cache['sd']
 
     @property
     def asymmetries(self):
@@ -490,9 +710,8 @@ class W(object):
 
         """
         if 'asymmetries' not in self._cache:
-            self._asymmetries = self.asymmetry()
-            self._cache['asymmetries'] = self._asymmetries
-        return self._asymmetries
+            self._cache['asymmetries'] = self.asymmetry()
+        return self._cache['asymmetries']
 
     @property
     def islands(self):
@@ -500,10 +719,9 @@ class W(object):
 
         """
         if 'islands' not in self._cache:
-            self._islands = [i for i,
-                             c in self.cardinalities.items() if c == 0]
-            self._cache['islands'] = self._islands
-        return self._islands
+            self._cache['islands'] = [i for i,
+                                      c in self.cardinalities.items() if c == 0]
+        return self._cache['islands']
 
     @property
     def histogram(self):
@@ -514,9 +732,8 @@ class W(object):
         if 'histogram' not in self._cache:
             ct, bin = np.histogram(self.cardinalities.values(),
                                    range(self.min_neighbors, self.max_neighbors + 2))
-            self._histogram = zip(bin, ct)
-            self._cache['histogram'] = self._histogram
-        return self._histogram
+            self._cache['histogram'] = zip(bin, ct)
+        return self._cache['histogram']
 
     def __getitem__(self, key):
         """Allow a dictionary like interaction with the weights class.
@@ -599,6 +816,7 @@ class W(object):
         if len(set(new_ids)) != len(new_ids):
             raise Exception("W.remap_ids: list `new_ids` contains duplicates")
         else:
+            self._drop_csr()
             new_neighbors = {}
             new_weights = {}
             old_transformations = self.transformations['O'].copy()
@@ -611,8 +829,9 @@ class W(object):
                 new_weights[n] = o_weights[:]
                 new_transformations[n] = old_transformations[o]
             self.neighbors = new_neighbors
+            # transformations other than the current one are rebuilt lazily
+            self.transformations = {"O": new_transformations}
             self.weights = new_weights
-            self.transformations["O"] = new_transformations
 
             id_order = [ self._id_order.index(o) for o in old_ids]
             for i,id_ in enumerate(id_order):
@@ -680,6 +899,7 @@ class W(object):
         """
 
         if set(self._id_order) == set(ordered_ids):
+            self._drop_csr()
             self._id_order = ordered_ids
             self._id_order_set = True
             self._reset()
@@ -735,12 +955,12 @@ class W(object):
         """
 
         if "neighbors_0" not in self._cache:
-            self.__neighbors_0 = {}
+            neighbors_0 = {}
             id2i = self.id2i
             for j, neigh_list in self.neighbors.iteritems():
-                self.__neighbors_0[j] = [id2i[neigh] for neigh in neigh_list]
-            self._cache['neighbors_0'] = self.__neighbors_0
-        return self.__neighbors_0
+                neighbors_0[j] = [id2i[neigh] for neigh in neigh_list]
+            self._cache['neighbors_0'] = neighbors_0
+        return self._cache['neighbors_0']
 
     def get_transform(self):
         """
@@ -781,6 +1001,10 @@ class W(object):
         instantiation. Chaining of transformations cannot be done on a W
         instance.
 
+        Each transformation keeps its own sparse matrix and derived properties
+        (s0, s1, s2, trcW2, ...), so switching back to a transformation that
+        has already been used does not recompute them.
+
         Parameters
         ----------
         transform   :   string
@@ -817,80 +1041,20 @@ class W(object):
         >>>
         """
         value = value.upper()
+        if value not in self._STANDARD_TRANSFORMS and \
+                value not in self.transformations:
+            raise Exception('unsupported weights transformation')
+        if value == 'R' and value not in self._transform_cache and \
+                not self.silent_island_warning:
+            for i in self.islands:
+                print('WARNING: ', i, ' is an island (no neighbors)')
+        previous = self._cache
         self._transform = value
-        if value in self.transformations:
-            self.weights = self.transformations[value]
-            self._reset()
-        else:
-            if value == "R":
-                # row standardized weights
-                weights = {}
-                self.weights = self.transformations['O']
-                for i in self.weights:
-                    wijs = self.weights[i]
-                    row_sum = sum(wijs) * 1.0
-                    if row_sum == 0.0:
-                        if not self.silent_island_warning:
-                            print('WARNING: ', i, ' is an island (no neighbors)')
-                    weights[i] = [wij / row_sum for wij in wijs]
-                weights = weights
-                self.transformations[value] = weights
-                self.weights = weights
-                self._reset()
-            elif value == "D":
-                # doubly-standardized weights
-                # update current chars before doing global sum
-                self._reset()
-                s0 = self.s0
-                ws = 1.0 / s0
-                weights = {}
-                self.weights = self.transformations['O']
-                for i in self.weights:
-                    wijs = self.weights[i]
-                    weights[i] = [wij * ws for wij in wijs]
-                weights = weights
-                self.transformations[value] = weights
-                self.weights = weights
-                self._reset()
-            elif value == "B":
-                # binary transformation
-                weights = {}
-                self.weights = self.transformations['O']
-                for i in self.weights:
-                    wijs = self.weights[i]
-                    weights[i] = [1.0 for wij in wijs]
-                weights = weights
-                self.transformations[value] = weights
-                self.weights = weights
-                self._reset()
-            elif value == "V":
-                # variance stabilizing
-                weights = {}
-                q = {}
-                k = self.cardinalities
-                s = {}
-                Q = 0.0
-                self.weights = self.transformations['O']
-                for i in self.weights:
-                    wijs = self.weights[i]
-                    q[i] = math.sqrt(sum([wij * wij for wij in wijs]))
-                    s[i] = [wij / q[i] for wij in wijs]
-                    Q += sum([si for si in s[i]])
-                nQ = self.n / Q
-                for i in self.weights:
-                    weights[i] = [w * nQ for w in s[i]]
-                weights = weights
-                self.transformations[value] = weights
-                self.weights = weights
-                self._reset()
-            elif value == "O":
-                # put weights back to original transformation
-                weights = {}
-                original = self.transformations[value]
-                self.weights = original
-                self._reset()
-            else:
-                raise Exception('unsupported weights transformation')
+        self._cache = self._transform_cache.setdefault(value, {})
+        # the structure of w does not depend on the transformation
+        for key in self._SHARED_CACHE:
+            if key in previous and key not in self._cache:
+                self._cache[key] = previous[key]
 
     transform = property(get_transform, set_transform)
 
@@ -1007,7 +1171,7 @@ class W(object):
         >>> wsp.n
         3
         >>> wsp.s0
-        4
+        4.0
 
         See also
         --------